@@ -0,0 +1,31 @@
+"""
+Rebuilds analysis_daily_rollups from the analyses table.
+
+Usage:
+    python backfill_rollups.py            # rebuild everything
+    python backfill_rollups.py --days 7   # rebuild only the last 7 days
+"""
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+from database import SessionLocal
+from database_init import init_db
+from services.analytics_service import AnalyticsService
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill daily analysis rollups")
+    parser.add_argument("--days", type=int, default=None, help="Only rebuild the last N days")
+    args = parser.parse_args()
+
+    init_db(raise_errors=True)
+    since = (datetime.utcnow() - timedelta(days=args.days)).date() if args.days else None
+
+    db = SessionLocal()
+    try:
+        written = AnalyticsService().backfill(db, since=since)
+        print(f"Backfill complete: {written} rollup rows written.")
+    finally:
+        db.close()
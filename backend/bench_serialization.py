@@ -0,0 +1,136 @@
+"""
+Payload size and serialization time for representative API responses: the previous
+path (jsonable_encoder + Starlette's JSONResponse) vs FastJSONResponse, and the wire
+size with gzip / brotli as applied by CompressionMiddleware.
+
+Usage: python bench_serialization.py [--repeat 200]
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from starlette.responses import JSONResponse
+
+import responses
+from responses import FastJSONResponse, compress, GZIP_LEVEL, BROTLI_QUALITY
+from schemas import AnalysisSummary, AnalysisResponse
+from services.quant_service import QuantService
+from services.market_data_service import MarketDataService, _normalize
+
+
+def market_data_frame(candles=500):
+    return _normalize(QuantService().generate_mock_data(candles))
+
+
+def market_data_iterrows_payload(df):
+    """How /market-data used to build its rows: iterrows and one dict per candle."""
+    return [
+        {"time": int(row["time"]), "open": row["open"], "high": row["high"], "low": row["low"], "close": row["close"]}
+        for _, row in df.iterrows()
+    ]
+
+
+def _analysis_fields(i):
+    return {
+        "id": i, "asset": "XAU/USD", "bias": "Bullish" if i % 2 else "Bearish", "confidence": 60 + i % 30,
+        "summary": "Price swept sell-side liquidity below the Asian low and displaced into a bullish FVG; "
+                   "expect a retrace into the order block before continuation.",
+        "recommendation": "BUY", "entry": 2031.25 + i, "sl": 2024.5 + i, "tp1": 2040.0 + i, "tp2": 2052.75 + i,
+        "risk_reward": "1:2.4", "sentiment": "Bullish", "image_path": f"uploads/{i:064x}.png",
+        "result": "win" if i % 3 == 0 else None,
+        "created_at": datetime.datetime(2026, 1, 1) + datetime.timedelta(hours=i),
+    }
+
+
+def analyses_payload(rows=50):
+    """/analyses goes through response_model: pydantic produces JSON-ready python first."""
+    adapter = TypeAdapter(list[AnalysisSummary])
+    return adapter.dump_python(adapter.validate_python([_analysis_fields(i) for i in range(rows)]), mode="json")
+
+
+def analysis_detail_payload():
+    quant = {
+        tf: {
+            "trend": "Bullish", "momentum": "Strong", "volatility_alert": False, "current_price": 2031.2,
+            "indicators": {"rsi": 61.3, "macd": {"line": 1.2, "signal": 0.8, "hist": 0.4, "sentiment": "Bullish"},
+                           "bollinger": {"upper": 2040.1, "lower": 2020.3, "position": "Inside"},
+                           "atr": 4.1, "ema_20": 2028.4, "ema_50": 2022.9},
+            "pivots": {"pivot": 2030.0, "r1": 2035.0, "s1": 2025.0, "r2": 2040.0, "s2": 2020.0},
+        }
+        for tf in ("1d", "4h", "1h")
+    }
+    fields = _analysis_fields(1)
+    fields["meta_data"] = {"quant": quant, "sentiment": {"score": 75, "label": "Bullish", "summary": "Strong"}}
+    model = AnalysisResponse.model_validate(fields)
+    return model.model_dump(mode="json")
+
+
+def admin_charts_payload(rows=50):
+    """Plain dicts with datetimes, as /admin/content/charts builds them."""
+    return [
+        {"id": i, "asset": "XAU/USD", "bias": "Bullish", "created_at": datetime.datetime(2026, 1, 1, i % 24),
+         "user_id": f"uid_{i % 7}", "image_url": f"uploads/{i:064x}_thumb.webp",
+         "preview_url": f"uploads/{i:064x}_preview.webp", "original_url": f"uploads/{i:064x}.png"}
+        for i in range(rows)
+    ]
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    df = market_data_frame()
+    build_before, _ = timed(lambda: market_data_iterrows_payload(df), args.repeat)
+    build_after, _ = timed(lambda: MarketDataService.to_rows(df), args.repeat)
+    build_columns, _ = timed(lambda: MarketDataService.to_columns(df), args.repeat)
+    build_points, _ = timed(lambda: MarketDataService.to_columns(MarketDataService.downsample(df, 100)), args.repeat)
+    print(f"/market-data build (500 candles): iterrows {build_before:.3f} ms, vectorized rows {build_after:.3f} ms, "
+          f"columns {build_columns:.3f} ms, downsample to 100 + columns {build_points:.3f} ms\n")
+
+    cases = [
+        # name, payload, whether the old path ran jsonable_encoder (routes without response_model)
+        ("/market-data (500 candles)", MarketDataService.to_rows(df), True),
+        ("  format=columns", MarketDataService.to_columns(df), True),
+        ("  format=columns&points=100", MarketDataService.to_columns(MarketDataService.downsample(df, 100)), True),
+        ("/analyses (50 rows)", analyses_payload(), False),
+        ("/analyses/{id} (with meta)", analysis_detail_payload(), False),
+        ("/admin/content/charts (50)", admin_charts_payload(), True),
+    ]
+
+    print(f"encoder: {'orjson' if responses.orjson else 'stdlib json (orjson not installed)'}; "
+          f"gzip level {GZIP_LEVEL}; brotli {'quality ' + str(BROTLI_QUALITY) if responses.brotli else 'not installed'}")
+    print(f"{'payload':<30} {'before ms':>10} {'after ms':>9} {'speedup':>8} {'raw B':>9} {'gzip B':>8} {'gzip ms':>8} {'br B':>8} {'br ms':>7}")
+    for name, payload, encoded_before in cases:
+        if encoded_before:
+            before_ms, _ = timed(lambda: JSONResponse(jsonable_encoder(payload)).body, args.repeat)
+        else:
+            before_ms, _ = timed(lambda: JSONResponse(payload).body, args.repeat)
+        after_ms, body = timed(lambda: FastJSONResponse(payload).body, args.repeat)
+
+        gzip_ms, gzipped = timed(lambda: compress(body, "gzip"), args.repeat)
+        if responses.brotli:
+            br_ms, brotlied = timed(lambda: compress(body, "br"), args.repeat)
+            br_size, br_time = f"{len(brotlied):>8}", f"{br_ms:>7.3f}"
+        else:
+            br_size, br_time = f"{'-':>8}", f"{'-':>7}"
+
+        print(f"{name:<30} {before_ms:>10.3f} {after_ms:>9.3f} {before_ms / after_ms:>7.1f}x "
+              f"{len(body):>9} {len(gzipped):>8} {gzip_ms:>8.3f} {br_size} {br_time}")
+
+
+if __name__ == "__main__":
+    main()
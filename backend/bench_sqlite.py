@@ -0,0 +1,126 @@
+"""
+Concurrent read/write throughput of the local SQLite fallback, default settings vs the
+tuned profile in database.py (WAL + pragmas + pooled connections).
+
+Usage: python bench_sqlite.py [--seconds 5] [--readers 8]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import datetime
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import models
+from database import apply_sqlite_pragmas
+
+SEED_ROWS = 5000
+USERS = [f"bench_user_{i}" for i in range(50)]
+
+
+def make_engine(path, tuned):
+    url = f"sqlite:///{path}"
+    if tuned:
+        engine = create_engine(url, connect_args={"check_same_thread": False}, pool_size=16, max_overflow=8)
+        apply_sqlite_pragmas(engine)
+    else:
+        # Roughly the old setup: rollback journal, default sync, a fresh connection per session
+        engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=NullPool)
+    return engine
+
+
+def seed(engine):
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        now = datetime.datetime.utcnow()
+        db.add_all([
+            models.Analysis(
+                user_id=USERS[i % len(USERS)], bias="Bullish", confidence=70, summary="seed",
+                image_path="uploads/x.png", created_at=now - datetime.timedelta(minutes=i),
+                meta_data={"quant": {"alignment": "Mixed"}}
+            )
+            for i in range(SEED_ROWS)
+        ])
+        db.commit()
+
+
+def run(engine, seconds, readers):
+    Session = sessionmaker(bind=engine)
+    stop = time.monotonic() + seconds
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def reader(idx):
+        n = 0
+        while time.monotonic() < stop:
+            try:
+                with Session() as db:
+                    db.execute(
+                        select(models.Analysis.id, models.Analysis.bias)
+                        .where(models.Analysis.user_id == USERS[(idx + n) % len(USERS)])
+                        .order_by(models.Analysis.created_at.desc()).limit(20)
+                    ).all()
+                n += 1
+            except Exception:
+                with lock:
+                    counts["errors"] += 1
+        with lock:
+            counts["reads"] += n
+
+    def writer():
+        n = 0
+        while time.monotonic() < stop:
+            try:
+                with Session() as db:
+                    db.add(models.Analysis(
+                        user_id=USERS[n % len(USERS)], bias="Bearish", confidence=60,
+                        summary="bench", image_path="uploads/y.png", meta_data={"quant": {}}
+                    ))
+                    db.commit()
+                n += 1
+            except Exception:
+                with lock:
+                    counts["errors"] += 1
+        with lock:
+            counts["writes"] += n
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {k: v / seconds if k != "errors" else v for k, v in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--readers", type=int, default=8)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="xgpro_bench_")
+    try:
+        print(f"--- SQLite benchmark: {args.readers} readers + 1 writer, {args.seconds}s each ---")
+        for label, tuned in (("default", False), ("tuned", True)):
+            path = os.path.join(workdir, f"{label}.db")
+            engine = make_engine(path, tuned)
+            seed(engine)
+            result = run(engine, args.seconds, args.readers)
+            engine.dispose()
+            print(f"{label:>8}: {result['reads']:8.0f} reads/s  {result['writes']:6.0f} writes/s  errors={result['errors']}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
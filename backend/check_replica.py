@@ -0,0 +1,57 @@
+"""
+Local check for read-replica routing using two SQLite files (no real replication):
+a row seeded only into the "replica" must show up on read-routed endpoints, and a
+user who just wrote must be served from the primary.
+
+Usage: python check_replica.py
+(Against Postgres: set DATABASE_URL and DATABASE_REPLICA_URL to two databases first.)
+"""
+import os
+import sys
+import datetime
+import tempfile
+
+if not os.getenv("DATABASE_REPLICA_URL"):
+    workdir = tempfile.mkdtemp(prefix="xgpro_replica_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'primary.db')}"
+    os.environ["DATABASE_REPLICA_URL"] = f"sqlite:///{os.path.join(workdir, 'replica.db')}"
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+
+import models
+from database import engine, read_engine, ReadSessionLocal
+from migrations import run_migrations
+from dependencies import mark_user_write
+from main import app
+
+USER = "replica_check_user"
+
+run_migrations(engine)
+run_migrations(read_engine)
+with read_engine.begin() as conn:
+    conn.execute(models.Analysis.__table__.delete().where(models.Analysis.user_id == USER))
+    conn.execute(models.Analysis.__table__.insert().values(
+        user_id=USER, asset="XAU/USD", bias="Bullish", confidence=70, summary="seeded on replica only",
+        image_path="uploads/x.png", created_at=datetime.datetime.utcnow(),
+    ))
+
+client = TestClient(app)
+headers = {"X-User-Id": USER}
+
+rows = client.get("/analyses", headers=headers).json()
+print(f"Replica read:    /analyses -> {len(rows)} row(s) (expected 1)")
+
+mark_user_write(USER)
+rows = client.get("/analyses", headers=headers).json()
+print(f"Sticky primary:  /analyses -> {len(rows)} row(s) (expected 0)")
+
+session = ReadSessionLocal()
+try:
+    session.add(models.User(firebase_uid=USER))
+    session.flush()
+    print("Read-only guard: FAILED (write was flushed)")
+except RuntimeError as e:
+    print(f"Read-only guard: OK ({e})")
+finally:
+    session.close()
@@ -1,18 +1,27 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
 
 import os
 
+def _normalize_url(url: str) -> str:
+    # Fix for SQLAlchemy compatibility (postgres:// -> postgresql://)
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+def _connect_args(url: str) -> dict:
+    # sqlite:// URLs are allowed too (e.g. two local files to exercise replica routing)
+    return {"check_same_thread": False} if url.startswith("sqlite") else {"sslmode": "require"}
+
 # Use /tmp for SQLite on Vercel (read-only file system workaround)
 # Note: This is ephemeral and resets on deployment/cold start.
 # For production, use a hosted Postgres URL via env var.
 if os.getenv("DATABASE_URL"):
-    SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
-    # Fix for SQLAlchemy compatibility (postgres:// -> postgresql://)
-    if SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
-        SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
-    connect_args = {"sslmode": "require"}
+    SQLALCHEMY_DATABASE_URL = _normalize_url(os.getenv("DATABASE_URL"))
+    connect_args = _connect_args(SQLALCHEMY_DATABASE_URL)
 else:
     if os.path.exists("/tmp"):
         SQLALCHEMY_DATABASE_URL = "sqlite:////tmp/xgproai.db"
@@ -20,9 +29,112 @@ else:
         SQLALCHEMY_DATABASE_URL = "sqlite:///./xgproai.db"
     connect_args = {"check_same_thread": False}
 
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+# SQLite performance profile, applied on every new connection.
+# WAL lets readers proceed while the single writer commits; NORMAL sync is durable
+# across app crashes (only an OS crash can lose the last commits) and skips most fsyncs.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),  # wait for the write lock instead of failing
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", 65536)),  # negative = KiB, per connection
+    "mmap_size": int(os.getenv("SQLITE_MMAP_BYTES", 268435456)),
+    "temp_store": "MEMORY",
+}
+
+def apply_sqlite_pragmas(target_engine):
+    """Registers the SQLite profile on an engine (sync engine or AsyncEngine.sync_engine)."""
+    @event.listens_for(target_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
+if IS_SQLITE:
+    # Many concurrent readers, one writer (SQLite serializes writes; busy_timeout queues them)
+    pool_args = {
+        "pool_size": int(os.getenv("SQLITE_POOL_SIZE", 8)),
+        "max_overflow": int(os.getenv("SQLITE_POOL_OVERFLOW", 8)),
+        "pool_timeout": 30,
+    }
+else:
+    pool_args = {"pool_pre_ping": True}
+
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args=connect_args, pool_pre_ping=True
+    SQLALCHEMY_DATABASE_URL, connect_args=connect_args, **pool_args
 )
+if IS_SQLITE:
+    apply_sqlite_pragmas(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the hot async routes (asyncpg on Postgres, aiosqlite locally).
+# Points at the same database as the sync engine above.
+def _async_database_url(url: str):
+    async_url = make_url(url)
+    if async_url.drivername in ("postgresql", "postgresql+psycopg2"):
+        # asyncpg doesn't understand libpq's sslmode query param; SSL goes via connect_args
+        return async_url.set(drivername="postgresql+asyncpg").difference_update_query(["sslmode"]), {"ssl": "require"}
+    if async_url.drivername == "sqlite":
+        return async_url.set(drivername="sqlite+aiosqlite"), {"check_same_thread": False}
+    return async_url, {}
+
+ASYNC_DATABASE_URL, async_connect_args = _async_database_url(SQLALCHEMY_DATABASE_URL)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, connect_args=async_connect_args, **pool_args
+)
+if IS_SQLITE:
+    apply_sqlite_pragmas(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# Optional read replica (DATABASE_REPLICA_URL). Read-only dependencies route here;
+# without a replica the "read" engines are simply the primary ones.
+REPLICA_DATABASE_URL = os.getenv("DATABASE_REPLICA_URL")
+if REPLICA_DATABASE_URL:
+    REPLICA_DATABASE_URL = _normalize_url(REPLICA_DATABASE_URL)
+    read_engine = create_engine(REPLICA_DATABASE_URL, connect_args=_connect_args(REPLICA_DATABASE_URL), **pool_args)
+    ASYNC_REPLICA_URL, async_replica_connect_args = _async_database_url(REPLICA_DATABASE_URL)
+    async_read_engine = create_async_engine(ASYNC_REPLICA_URL, connect_args=async_replica_connect_args, **pool_args)
+    if REPLICA_DATABASE_URL.startswith("sqlite"):
+        apply_sqlite_pragmas(read_engine)
+        apply_sqlite_pragmas(async_read_engine.sync_engine)
+else:
+    read_engine = engine
+    async_read_engine = async_engine
+HAS_REPLICA = read_engine is not engine
+
+class ReadOnlySession(Session):
+    """Session for read-routed dependencies; flushing raises so writes can't land on the replica."""
+
+@event.listens_for(ReadOnlySession, "before_flush")
+def _reject_replica_writes(session, flush_context, instances):
+    raise RuntimeError("Attempted to write through a read-only (replica) session")
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine, class_=ReadOnlySession)
+AsyncReadSessionLocal = async_sessionmaker(
+    bind=async_read_engine, class_=AsyncSession, sync_session_class=ReadOnlySession,
+    autoflush=False, expire_on_commit=False
+)
+
 Base = declarative_base()
+
+def pool_stats() -> dict:
+    """Connection pool usage per engine (scraped by /metrics)."""
+    engines = {"primary": engine, "primary_async": async_engine.sync_engine}
+    if HAS_REPLICA:
+        engines.update(replica=read_engine, replica_async=async_read_engine.sync_engine)
+    stats = {}
+    for name, target in engines.items():
+        pool = target.pool
+        if hasattr(pool, "checkedout"):  # QueuePool variants; NullPool/StaticPool keep no counts
+            stats[name] = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),  # Negative until the pool has filled
+            }
+    return stats
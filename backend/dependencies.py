@@ -1,7 +1,12 @@
 from fastapi import Depends, HTTPException, Header
 from sqlalchemy.orm import Session
-from database import SessionLocal
+from database import (
+    engine, async_engine, SessionLocal, AsyncSessionLocal,
+    ReadSessionLocal, AsyncReadSessionLocal, HAS_REPLICA,
+)
 import models
+from user_cache import get_cached_user
+from cache import TTLCache
 import os
 from jose import jwt, JWTError, ExpiredSignatureError
 
@@ -13,6 +18,36 @@ def get_db():
     finally:
         db.close()
 
+# Async Database Dependency (for async routes; keeps DB I/O off the event loop)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Read-your-writes: after a user writes, their reads stay on the primary until the
+# replica has (very likely) caught up. Per-worker, like the other in-process caches.
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 5))
+_recent_writers = TTLCache(maxsize=4096, ttl=REPLICA_STICKY_SECONDS)
+
+def mark_user_write(firebase_uid: str):
+    if HAS_REPLICA and firebase_uid:
+        _recent_writers.set(firebase_uid, True)
+
+def _stick_to_primary(x_user_id: str) -> bool:
+    return HAS_REPLICA and bool(x_user_id) and _recent_writers.get(x_user_id) is not None
+
+# Read-only Database Dependencies (replica when DATABASE_REPLICA_URL is set, else the primary)
+def get_read_db(x_user_id: str = Header(None)):
+    db = ReadSessionLocal(bind=engine) if _stick_to_primary(x_user_id) else ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(x_user_id: str = Header(None)):
+    bind = {"bind": async_engine} if _stick_to_primary(x_user_id) else {}
+    async with AsyncReadSessionLocal(**bind) as db:
+        yield db
+
 # Admin Dependency
 def verify_admin(x_user_id: str = Header(None), authorization: str = Header(None), db: Session = Depends(get_db)):
     # 1. Check for Bearer Token (Standalone Admin)
@@ -32,7 +67,7 @@ def verify_admin(x_user_id: str = Header(None), authorization: str = Header(None
     if not x_user_id:
         raise HTTPException(status_code=403, detail="Admin Access Denied: Authentication required")
     
-    user = db.query(models.User).filter(models.User.firebase_uid == x_user_id).first()
+    user = get_cached_user(db, x_user_id)
     if not user or not user.is_admin:
         raise HTTPException(status_code=403, detail="Admin Access Denied: Not an admin")
     return True
@@ -0,0 +1,37 @@
+"""
+Streams the analyses table to a file in constant memory.
+
+Usage:
+    python export_analyses.py --format ndjson --out analyses.ndjson
+    python export_analyses.py --format csv --flatten --start 2025-01-01 --end 2025-01-31 --out jan.csv
+    python export_analyses.py --format parquet --asset XAU/USD --out gold.parquet   # needs pyarrow
+"""
+import argparse
+import sys
+from datetime import date
+
+from services.export_service import ExportFilters, FORMATS, export_analyses, parquet_available
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export analyses as NDJSON, CSV or Parquet")
+    parser.add_argument("--format", choices=list(FORMATS), default="ndjson")
+    parser.add_argument("--out", default="-", help="Output path ('-' for stdout)")
+    parser.add_argument("--start", type=date.fromisoformat, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last day, inclusive (YYYY-MM-DD)")
+    parser.add_argument("--user-id")
+    parser.add_argument("--asset")
+    parser.add_argument("--result", help="win, loss or breakeven")
+    parser.add_argument("--flatten", action="store_true", help="Expand meta_data into meta.* columns")
+    args = parser.parse_args()
+
+    if args.format == "parquet" and not parquet_available():
+        sys.exit("Parquet export requires pyarrow (pip install pyarrow)")
+
+    filters = ExportFilters(start=args.start, end=args.end, user_id=args.user_id, asset=args.asset, result=args.result)
+    out = sys.stdout.buffer if args.out == "-" else open(args.out, "wb")
+    try:
+        for chunk in export_analyses(filters, fmt=args.format, flatten=args.flatten):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
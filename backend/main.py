@@ -1,10 +1,11 @@
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from limiter import limiter
 import os
+import asyncio
 import logging
 from dotenv import load_dotenv
 
@@ -15,6 +16,14 @@ from routers import auth, users, admin, analysis, admin_auth, contact
 
 # Import Database Init
 from database_init import init_db
+import upload_index
+import metrics
+from database import pool_stats
+from upload_ingest import UploadSizeLimitMiddleware
+from responses import FastJSONResponse, CompressionMiddleware
+from services.llm_governor import governor_stats
+from services.idempotency_service import idempotency_service
+from services.live_feed import live_feed_hub
 
 # Configure Logging
 logging.basicConfig(
@@ -28,10 +37,16 @@ logger = logging.getLogger(__name__)
 
 # Rate Limiter (defined in limiter.py to avoid circular imports)
 
-app = FastAPI(title="xGProAi Backend", version="2.0")
+app = FastAPI(title="xGProAi Backend", version="2.0", default_response_class=FastJSONResponse)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Cap upload bodies before they are parsed (added first so CORS headers wrap its 413)
+app.add_middleware(UploadSizeLimitMiddleware)
+
+# gzip/brotli for complete responses above COMPRESSION_MIN_BYTES; streams pass through
+app.add_middleware(CompressionMiddleware)
+
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -44,8 +59,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Reservation-Id", "Idempotent-Replayed"],
 )
 
+# Outermost, so latency covers every other middleware (and 413s / CORS preflights)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Startup Event
 @app.on_event("startup")
 def startup_event():
@@ -73,26 +92,71 @@ def force_migration():
     Manually trigger database schema migration.
     """
     try:
-        init_db()
+        init_db(raise_errors=True)
         return {"status": "success", "message": "Migration run successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _collect_runtime():
+    """Pool, governor, idempotency and live feed state, read at scrape time."""
+    pool = metrics.Gauge("xgpro_db_pool_connections", "DB pool connections by state", ["engine", "state"])
+    pool_size = metrics.Gauge("xgpro_db_pool_size", "Configured DB pool size", ["engine"])
+    for name, stats in pool_stats().items():
+        pool_size.set(stats["size"], engine=name)
+        for state in ("checked_out", "checked_in", "overflow"):
+            pool.set(stats[state], engine=name, state=state)
+
+    llm_in_flight = metrics.Gauge("xgpro_llm_in_flight", "LLM calls holding a governor slot", ["provider"])
+    llm_queue = metrics.Gauge("xgpro_llm_queue_depth", "Requests waiting for a governor slot", ["provider"])
+    llm_rejected = metrics.Counter("xgpro_llm_rejected_total", "Requests the governor turned away", ["provider", "reason"])
+    for g in governor_stats():
+        llm_in_flight.set(g["in_flight"], provider=g["provider"])
+        llm_queue.set(g["queue_depth"], provider=g["provider"])
+        llm_rejected.inc(g["rejected_queue_full"], provider=g["provider"], reason="queue_full")
+        llm_rejected.inc(g["rejected_timeout"], provider=g["provider"], reason="timeout")
+
+    idem = idempotency_service.stats()
+    idem_in_flight = metrics.Gauge("xgpro_idempotency_in_flight", "/analyze requests owning an Idempotency-Key")
+    idem_in_flight.set(idem["in_flight"])
+    idem_dedup = metrics.Counter("xgpro_idempotency_deduplicated_total", "Retries answered without re-running /analyze", ["via"])
+    idem_dedup.inc(idem["replayed_stored"], via="stored")
+    idem_dedup.inc(idem["joined_inflight"], via="in_flight")
+    feeds = live_feed_hub.stats()
+    feed_subscribers = metrics.Gauge("xgpro_live_feed_subscribers", "Open /market-data stream connections", ["symbol", "timeframe"])
+    feed_resyncs = metrics.Counter("xgpro_live_feed_resyncs_total", "Slow subscribers caught up with a snapshot", ["symbol", "timeframe"])
+    for feed in feeds["feeds"]:
+        feed_subscribers.set(feed["subscribers"], symbol=feed["symbol"], timeframe=feed["timeframe"])
+        feed_resyncs.inc(feed["resyncs"], symbol=feed["symbol"], timeframe=feed["timeframe"])
+    return [pool, pool_size, llm_in_flight, llm_queue, llm_rejected, idem_in_flight, idem_dedup,
+            feed_subscribers, feed_resyncs]
+
+
+metrics.register_collector(metrics.cache_collector(admin.CACHE_STATS))
+metrics.register_collector(_collect_runtime)
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics(request: Request):
+    """Prometheus scrape endpoint. Set METRICS_TOKEN to require 'Authorization: Bearer <token>'."""
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # Custom Image Serving
 @app.get("/uploads/{filename}")
-async def get_uploaded_file(filename: str):
+async def get_uploaded_file(filename: str, request: Request):
     # Sanitize filename to prevent path traversal
     safe_name = os.path.basename(filename)
 
-    # Check /tmp first for production (Render/Vercel)
-    tmp_path = os.path.join("/tmp", safe_name)
-    if os.path.exists(tmp_path):
-        return FileResponse(tmp_path)
-    
-    # Fallback to local uploads/ directory
-    local_path = os.path.join("uploads", safe_name)
-    if os.path.exists(local_path):
-        return FileResponse(local_path)
-        
-    raise HTTPException(status_code=404, detail="File not found")
+    entry = upload_index.cached(safe_name) or await asyncio.to_thread(upload_index.index_upload, safe_name)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    headers = {"ETag": entry.etag, "Cache-Control": entry.cache_control}
+    if upload_index.etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+
+    # FileResponse handles Range / If-Range; the indexed (just re-validated) stat is passed through
+    return FileResponse(entry.path, stat_result=entry.stat, headers=headers)
+
 
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import zlib
+
+try:
+    import msgpack
+    import zstandard
+except ImportError:  # Compact codec is optional; json+zlib is always available
+    msgpack = None
+    zstandard = None
+
+# Encoded blobs start with a one-byte codec tag so rows written with different
+# codecs (or on machines without the optional deps) can live side by side.
+TAG_JSON_ZLIB = 0x01
+TAG_MSGPACK_ZSTD = 0x02
+
+# "auto" packs with msgpack+zstd when installed, else json+zlib; "json" keeps plain JSON
+META_ENCODING = os.getenv("META_ENCODING", "auto").lower()
+# zstd level on the /analyze insert path; offline batches (migrate_meta.py, archiving)
+# can afford the slow high levels since nobody waits on them
+META_ZSTD_LEVEL = int(os.getenv("META_ZSTD_LEVEL", 3))
+META_ZSTD_BATCH_LEVEL = int(os.getenv("META_ZSTD_BATCH_LEVEL", 19))
+
+
+def _timeframe(trend):
+    return {
+        "trend": trend, "momentum": "Neutral", "volatility_alert": False, "current_price": 2000.0,
+        "indicators": {
+            "rsi": 50.0,
+            "macd": {"line": 0.0, "signal": 0.0, "hist": 0.0, "sentiment": "Bullish"},
+            "bollinger": {"upper": 2000.0, "lower": 2000.0, "position": "Inside"},
+            "atr": 1.0, "ema_20": 2000.0, "ema_50": 2000.0,
+        },
+        "pivots": {"pivot": 2000.0, "r1": 2000.0, "s1": 2000.0, "r2": 2000.0, "s2": 2000.0},
+        "ai_levels": {"entry": 2000.0, "sl": 2000.0, "tp": 2000.0},
+    }
+
+
+# Shape of a typical meta_data payload. Both codecs use it as a shared prefix
+# dictionary, so the repeated key names cost almost nothing per row.
+# Frozen: rows depend on these exact bytes. Add a new tag for a new template.
+_TEMPLATE = {
+    "quant": {
+        "alignment": "Bullish (Higher Timeframe Dominance) Bearish Mixed Neutral",
+        "trends": {"1h": "Bearish", "4h": "Bullish", "1d": "Neutral"},
+        "1h": _timeframe("Bearish"),
+        "4h": _timeframe("Bullish"),
+        "1d": _timeframe("Neutral"),
+    },
+    "sentiment": {"score": 0, "label": "Neutral", "summary": "No Data"},
+}
+
+_JSON_DICT = json.dumps(_TEMPLATE, separators=(",", ":")).encode("utf-8")
+_zstd_dict = None
+# ZstdCompressor/ZstdDecompressor instances are reusable but not thread-safe
+_local = threading.local()
+
+
+def _zstd():
+    global _zstd_dict
+    if _zstd_dict is None:
+        _zstd_dict = zstandard.ZstdCompressionDict(
+            msgpack.packb(_TEMPLATE, use_bin_type=True), dict_type=zstandard.DICT_TYPE_RAWCONTENT
+        )
+    return _zstd_dict
+
+
+def _compressor(level: int):
+    compressors = getattr(_local, "compressors", None)
+    if compressors is None:
+        compressors = _local.compressors = {}
+    if level not in compressors:
+        compressors[level] = zstandard.ZstdCompressor(level=level, dict_data=_zstd())
+    return compressors[level]
+
+
+def _decompressor():
+    if getattr(_local, "decompressor", None) is None:
+        _local.decompressor = zstandard.ZstdDecompressor(dict_data=_zstd())
+    return _local.decompressor
+
+
+def compact_available() -> bool:
+    return msgpack is not None and zstandard is not None
+
+
+def packing_enabled() -> bool:
+    return META_ENCODING != "json"
+
+
+def encode(meta, level: int = None) -> bytes | None:
+    """
+    dict -> tagged compressed bytes, using the best codec installed. `level` is the zstd
+    level (META_ZSTD_LEVEL by default; batch jobs pass META_ZSTD_BATCH_LEVEL).
+    """
+    if meta is None:
+        return None
+    if compact_available():
+        raw = msgpack.packb(meta, default=str, use_bin_type=True)
+        return bytes([TAG_MSGPACK_ZSTD]) + _compressor(META_ZSTD_LEVEL if level is None else level).compress(raw)
+
+    raw = json.dumps(meta, separators=(",", ":"), default=str).encode("utf-8")
+    compressor = zlib.compressobj(9, zdict=_JSON_DICT)
+    return bytes([TAG_JSON_ZLIB]) + compressor.compress(raw) + compressor.flush()
+
+
+def decode(blob: bytes):
+    """Inverse of encode()."""
+    if blob is None:
+        return None
+    tag, body = blob[0], blob[1:]
+    if tag == TAG_MSGPACK_ZSTD:
+        if not compact_available():
+            raise RuntimeError("meta_data was packed with msgpack+zstd; install msgpack and zstandard to read it")
+        raw = _decompressor().decompress(body)
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+    if tag == TAG_JSON_ZLIB:
+        decompressor = zlib.decompressobj(zdict=_JSON_DICT)
+        return json.loads(decompressor.decompress(body) + decompressor.flush())
+    raise ValueError(f"Unknown meta_data codec tag {tag:#x}")
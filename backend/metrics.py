@@ -0,0 +1,298 @@
+"""
+In-process Prometheus metrics (text exposition format 0.0.4), served at /metrics.
+
+Hot-path cost is a dict lookup and a few integer adds under a lock per observation.
+Cache, pool and queue numbers are not tracked on the hot path at all: they are read
+from the objects that already keep them when /metrics is scraped (see register_collector).
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans fast JSON routes up to the slow vision call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[n] for n in self.labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def samples(self):
+        """Yields (suffix, labelnames, labelvalues, value)."""
+        with self._lock:
+            items = list(self._series.items())
+        for key, value in items:
+            yield "", self.labelnames, key, value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)  # len(buckets) is the +Inf slot
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [per-bucket counts..., sum, count]
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        names = self.labelnames + ("le",)
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                yield "_bucket", names, key + (_format_value(float(bound)),), cumulative
+            yield "_sum", self.labelnames, key, series[-2]
+            yield "_count", self.labelnames, key, series[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect):
+        """
+        `collect()` is called on every scrape and returns metric objects (e.g. Gauges
+        filled from existing stats()), so the hot path keeps no extra bookkeeping.
+        """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        for collect in collectors:
+            try:
+                metrics.extend(collect())
+            except Exception as e:
+                # A broken collector must not take the whole scrape down
+                metrics.append(_collector_error(collect, e))
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            for suffix, names, values, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _collector_error(collect, error) -> Gauge:
+    gauge = Gauge("xgpro_metrics_collector_errors", "Collectors that failed during this scrape", ["collector"])
+    gauge.set(1, collector=getattr(collect, "__name__", repr(collect)))
+    return gauge
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames=()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def register_collector(collect):
+    REGISTRY.register_collector(collect)
+    return collect
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# --- Shared series -------------------------------------------------------------
+
+HTTP_REQUEST_SECONDS = histogram(
+    "xgpro_http_request_duration_seconds", "Request latency by route template", ["method", "route"]
+)
+HTTP_REQUESTS = counter(
+    "xgpro_http_requests_total", "Requests by route template and status code", ["method", "route", "status"]
+)
+HTTP_IN_FLIGHT = gauge("xgpro_http_requests_in_flight", "Requests currently being handled")
+
+ANALYZE_STAGE_SECONDS = histogram(
+    "xgpro_analyze_stage_duration_seconds", "Time spent in each /analyze stage", ["stage"]
+)
+
+PROVIDER_CALL_SECONDS = histogram(
+    "xgpro_provider_call_duration_seconds", "Upstream API call latency", ["provider", "operation"]
+)
+PROVIDER_CALLS = counter(
+    "xgpro_provider_calls_total", "Upstream API calls by outcome (ok/error)", ["provider", "operation", "outcome"]
+)
+
+PROCESS_START_TIME = gauge("xgpro_process_start_time_seconds", "Unix time the worker started")
+PROCESS_START_TIME.set(time.time())
+
+
+def stage(name: str):
+    """`with metrics.stage("quant"):` records one /analyze stage duration."""
+    return ANALYZE_STAGE_SECONDS.time(stage=name)
+
+
+class _ProviderCall:
+    __slots__ = ("error",)
+
+    def __init__(self):
+        self.error = False
+
+
+@contextmanager
+def track_provider(provider: str, operation: str):
+    """
+    Times one upstream call. Exceptions count as errors; for APIs that report failure in
+    the response instead, set `call.error = True` inside the block.
+    """
+    call = _ProviderCall()
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        call.error = True
+        raise
+    finally:
+        PROVIDER_CALL_SECONDS.observe(time.perf_counter() - start, provider=provider, operation=operation)
+        PROVIDER_CALLS.inc(provider=provider, operation=operation, outcome="error" if call.error else "ok")
+
+
+def cache_collector(caches: dict):
+    """Collector exposing TTLCache-style stats() dicts: {"users": user_cache_stats, ...}."""
+    def collect_caches():
+        hits = Counter("xgpro_cache_hits_total", "In-process cache hits", ["cache"])
+        misses = Counter("xgpro_cache_misses_total", "In-process cache misses", ["cache"])
+        evictions = Counter("xgpro_cache_evictions_total", "In-process cache LRU evictions", ["cache"])
+        size = Gauge("xgpro_cache_entries", "In-process cache entries", ["cache"])
+        for name, stats in caches.items():
+            s = stats()
+            hits.inc(s.get("hits", 0), cache=name)
+            misses.inc(s.get("misses", 0), cache=name)
+            evictions.inc(s.get("evictions", 0), cache=name)
+            size.set(s.get("size", 0), cache=name)
+        return [hits, misses, evictions, size]
+    return collect_caches
+
+
+class MetricsMiddleware:
+    """
+    Per-route latency and status counts. Routes are labelled by their template
+    ("/analyses/{analysis_id}"), never the raw path, to keep series bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=method, route=route_path)
+            HTTP_REQUESTS.inc(method=method, route=route_path, status=status)
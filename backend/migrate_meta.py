@@ -0,0 +1,100 @@
+"""
+Converts analyses.meta_data from plain JSON to the packed encoding (meta_codec),
+in batches, and reports the storage saved.
+
+Usage:
+    python migrate_meta.py --report           # sizes only, no writes
+    python migrate_meta.py [--batch-size 500] # convert every unpacked row
+
+On PostgreSQL the freed space is reused after autovacuum; run VACUUM (FULL) to shrink the table on disk.
+"""
+import argparse
+import json
+import logging
+
+from sqlalchemy import func, select, update
+
+import meta_codec
+import models
+from database import SessionLocal
+from database_init import init_db
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+
+def _fmt(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.2f} GB"
+
+
+def convert(db, batch_size: int, dry_run: bool) -> dict:
+    A = models.Analysis
+    stats = {"rows": 0, "json_bytes": 0, "packed_bytes": 0, "null_rows": 0}
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(A.id, A.meta_json)
+            .where(A.id > last_id, A.meta_json.isnot(None), A.meta_packed.is_(None))
+            .order_by(A.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = []
+        for row_id, meta in rows:
+            packed = meta_codec.encode(meta, level=meta_codec.META_ZSTD_BATCH_LEVEL)
+            if packed is None:
+                # JSON 'null' written by older code: nothing to pack, cleared to SQL NULL below
+                stats["null_rows"] += 1
+                updates.append((row_id, None))
+                continue
+            stats["rows"] += 1
+            stats["json_bytes"] += len(json.dumps(meta, separators=(",", ":"), default=str))
+            stats["packed_bytes"] += len(packed)
+            updates.append((row_id, packed))
+
+        if not dry_run:
+            for row_id, packed in updates:
+                db.execute(
+                    update(A).where(A.id == row_id).values(meta_packed=packed, meta_json=None)
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+            logging.info(f"Packed {stats['rows']} rows (up to id {last_id})")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack analyses.meta_data with the compact codec")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--report", action="store_true", help="Only report the expected savings")
+    args = parser.parse_args()
+
+    init_db(raise_errors=True)
+    if not meta_codec.packing_enabled():
+        raise SystemExit("META_ENCODING=json: packing is disabled")
+
+    db = SessionLocal()
+    try:
+        already = db.execute(
+            select(func.count(models.Analysis.id), func.coalesce(func.sum(func.length(models.Analysis.meta_packed)), 0))
+            .where(models.Analysis.meta_packed.isnot(None))
+        ).one()
+        stats = convert(db, args.batch_size, dry_run=args.report)
+    finally:
+        db.close()
+
+    codec = "msgpack+zstd" if meta_codec.compact_available() else "json+zlib"
+    saved = stats["json_bytes"] - stats["packed_bytes"]
+    ratio = (stats["packed_bytes"] / stats["json_bytes"]) if stats["json_bytes"] else 0
+    print(f"--- meta_data packing ({codec}){' [report only]' if args.report else ''} ---")
+    print(f"Already packed:  {already[0]} rows, {_fmt(already[1])}")
+    print(f"{'Would pack:' if args.report else 'Packed:':<17}{stats['rows']} rows")
+    print(f"{'JSON null:':<17}{stats['null_rows']} rows{'' if args.report else ' (cleared to NULL)'}")
+    print(f"JSON size:       {_fmt(stats['json_bytes'])}")
+    print(f"Packed size:     {_fmt(stats['packed_bytes'])} ({ratio:.0%} of original)")
+    print(f"Saved:           {_fmt(saved)}")
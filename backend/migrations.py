@@ -0,0 +1,160 @@
+from datetime import datetime
+import logging
+
+from sqlalchemy import DateTime, LargeBinary, bindparam, inspect, text
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# --- Migration steps ---
+# Each step receives a Connection inside its own transaction and must be safe to
+# run against databases that were previously patched by the old init_db ALTER loop.
+
+def _create_tables(conn):
+    models.Base.metadata.create_all(bind=conn)
+
+def _add_missing_columns(table, columns):
+    def step(conn):
+        existing = {c["name"] for c in inspect(conn).get_columns(table)}
+        for col_name, col_type in columns:
+            if not isinstance(col_type, str):  # SQLAlchemy type: render it for this dialect
+                col_type = col_type.compile(dialect=conn.dialect)
+            if col_name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {col_name} {col_type}"))
+                logger.info(f"Migrated: Added {col_name} to {table}")
+    return step
+
+def _create_table(model):
+    def step(conn):
+        model.__table__.create(bind=conn, checkfirst=True)
+    return step
+
+def _backfill_user_stats(conn):
+    models.UserAnalysisStats.__table__.create(bind=conn, checkfirst=True)
+    conn.execute(text(
+        "INSERT INTO user_analysis_stats (user_id, total, wins, losses, breakevens, updated_at) "
+        "SELECT user_id, COUNT(*), "
+        "SUM(CASE WHEN result = 'win' THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN result = 'loss' THEN 1 ELSE 0 END), "
+        "SUM(CASE WHEN result = 'breakeven' THEN 1 ELSE 0 END), "
+        "CURRENT_TIMESTAMP "
+        "FROM (SELECT user_id, result FROM analyses UNION ALL SELECT user_id, result FROM analyses_archive) a "
+        "WHERE user_id IS NOT NULL GROUP BY user_id"
+    ))
+
+def _backfill_created_at(tables):
+    """Legacy rows saved without a timestamp become the oldest (epoch), so keyset pages include them."""
+    def step(conn):
+        for table in tables:
+            conn.execute(
+                # Typed bind so SQLite stores it in the ORM's format and it compares with cursors
+                text(f"UPDATE {table} SET created_at = :epoch WHERE created_at IS NULL")
+                .bindparams(bindparam("epoch", datetime(1970, 1, 1), type_=DateTime()))
+            )
+    return step
+
+def _create_indexes(statements):
+    def step(conn):
+        for stmt in statements:
+            conn.execute(text(stmt))
+    return step
+
+
+# Append-only: never edit or reorder an applied version, add a new one instead.
+MIGRATIONS = [
+    (1, "create base tables", _create_tables),
+    (2, "legacy analyses columns", _add_missing_columns("analyses", [
+        ("result", "VARCHAR"),
+        ("risk_reward", "VARCHAR"),
+        ("sentiment", "VARCHAR"),
+        ("processing_time_ms", "INTEGER"),
+        ("entry", "FLOAT"),
+        ("sl", "FLOAT"),
+        ("tp1", "FLOAT"),
+        ("tp2", "FLOAT"),
+        ("recommendation", "VARCHAR"),
+        ("meta_data", "JSON"),
+    ])),
+    (3, "legacy users columns", _add_missing_columns("users", [
+        ("plan_tier", "VARCHAR DEFAULT 'trial'"),
+        ("credits_balance", "INTEGER DEFAULT 3"),
+        ("daily_usage_count", "INTEGER DEFAULT 0"),
+        ("last_usage_date", "TIMESTAMP"),
+        ("subscription_ends_at", "TIMESTAMP"),
+        ("trial_ends_at", "TIMESTAMP"),
+        ("hashed_password", "VARCHAR"),
+        ("mobile", "VARCHAR"),
+        ("country", "VARCHAR"),
+        ("gender", "VARCHAR"),
+        ("age_group", "VARCHAR"),
+        ("is_admin", "BOOLEAN DEFAULT FALSE"),
+        ("chat_cache_opt_out", "BOOLEAN DEFAULT FALSE"),
+    ])),
+    (4, "hot query indexes", _create_indexes([
+        "CREATE INDEX IF NOT EXISTS ix_analyses_created_at ON analyses (created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_analyses_user_created ON analyses (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_analyses_created_id ON analyses (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_users_created_id ON users (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_users_plan_tier ON users (plan_tier)",
+    ])),
+    (5, "daily analysis rollups", _create_table(models.AnalysisDailyRollup)),
+    (6, "analyses archive", _create_table(models.AnalysisArchive)),
+    (7, "packed analysis meta_data", _add_missing_columns("analyses", [
+        ("meta_packed", LargeBinary()),
+    ])),
+    (8, "per-user analysis counters", _backfill_user_stats),
+    (9, "analysis reservations", _create_table(models.AnalysisReservation)),
+    (10, "idempotency keys", _create_table(models.IdempotencyKey)),
+    (11, "backfill missing created_at", _backfill_created_at(["analyses", "users"])),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _current_version(engine):
+    """Single round trip; None when the tracking table doesn't exist yet."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT MAX(version) FROM schema_migrations")).scalar() or 0
+    except Exception:
+        return None
+
+
+def run_migrations(engine):
+    """
+    Applies pending migrations in order. When the schema is already current this
+    costs exactly one query (the MAX(version) lookup).
+    """
+    current = _current_version(engine)
+    if current is not None and current >= LATEST_VERSION:
+        return 0
+
+    if current is None:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                "version INTEGER PRIMARY KEY, name VARCHAR, applied_at TIMESTAMP)"
+            ))
+        current = 0
+
+    applied = 0
+    for version, name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            with engine.begin() as conn:
+                step(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {"v": version, "n": name, "t": datetime.utcnow()}
+                )
+            applied += 1
+            logger.info(f"Applied migration {version}: {name}")
+        except Exception as e:
+            # Most likely another worker applied it concurrently; re-check before giving up
+            if (_current_version(engine) or 0) >= version:
+                continue
+            logger.error(f"Migration {version} ({name}) failed: {e}")
+            raise
+    return applied
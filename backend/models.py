@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, Boolean, JSON, Index, LargeBinary, Text
 from database import Base
 import datetime
+import meta_codec
 
 class Analysis(Base):
     __tablename__ = "analyses"
@@ -21,9 +22,133 @@ class Analysis(Base):
     sentiment = Column(String, nullable=True)
     user_id = Column(String, index=True) # Firebase UID
     processing_time_ms = Column(Integer, nullable=True) # AI Latency
-    meta_data = Column(JSON, nullable=True) # JSON field for Quant Indicators
+    # Quant Indicators as plain JSON (legacy / META_ENCODING=json). none_as_null: None is SQL NULL, not JSON 'null'
+    meta_json = Column("meta_data", JSON(none_as_null=True), nullable=True)
+    meta_packed = Column(LargeBinary, nullable=True) # Same payload encoded by meta_codec
     created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
 
+    __table_args__ = (
+        # Serves per-user history listings (WHERE user_id = ? ORDER BY created_at DESC)
+        Index("ix_analyses_user_created", "user_id", "created_at"),
+        # Keyset pagination tie-break for global (admin) listings
+        Index("ix_analyses_created_id", "created_at", "id"),
+    )
+
+    @property
+    def meta_data(self):
+        """Quant/sentiment context, decoded from whichever column holds it."""
+        if self.meta_packed is not None:
+            return meta_codec.decode(self.meta_packed)
+        return self.meta_json
+
+    @meta_data.setter
+    def meta_data(self, value):
+        if meta_codec.packing_enabled():
+            self.meta_packed, self.meta_json = meta_codec.encode(value), None
+        else:
+            self.meta_json, self.meta_packed = value, None
+
+class AnalysisArchive(Base):
+    """
+    Cold storage for analyses past the retention window (see services/retention_service.py).
+    Same columns as analyses, keeping the original id, with meta_data always stored via meta_codec.
+    """
+    __tablename__ = "analyses_archive"
+
+    id = Column(Integer, primary_key=True) # Original analyses.id
+    asset = Column(String)
+    image_path = Column(String) # File is garbage-collected once archived
+    bias = Column(String)
+    confidence = Column(Integer)
+    summary = Column(String)
+    recommendation = Column(String, nullable=True)
+    result = Column(String, nullable=True)
+    entry = Column(Float, nullable=True)
+    sl = Column(Float, nullable=True)
+    tp1 = Column(Float, nullable=True)
+    tp2 = Column(Float, nullable=True)
+    risk_reward = Column(String, nullable=True)
+    sentiment = Column(String, nullable=True)
+    user_id = Column(String)
+    processing_time_ms = Column(Integer, nullable=True)
+    meta_compressed = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_analyses_archive_user_created", "user_id", "created_at"),
+    )
+
+    @property
+    def meta_data(self):
+        return meta_codec.decode(self.meta_compressed)
+
+class AnalysisReservation(Base):
+    """
+    A quota unit taken by POST /analyze/reserve before the upload is sent. /analyze claims it
+    (held -> consumed); unclaimed holds are refunded after they expire (held -> refunded).
+    """
+    __tablename__ = "analysis_reservations"
+
+    id = Column(String, primary_key=True) # Returned as X-Reservation-Id
+    user_id = Column(String, index=True) # Firebase UID
+    kind = Column(String) # QuotaGrant.kind: "daily" or "credit"
+    plan_tier = Column(String)
+    status = Column(String, default="held", nullable=False) # held, consumed, refunded
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        # Expiry sweep: WHERE status = 'held' AND expires_at <= now
+        Index("ix_reservations_status_expires", "status", "expires_at"),
+    )
+
+class IdempotencyKey(Base):
+    """
+    Outcome of an /analyze request sent with an Idempotency-Key header. Retries with the
+    same key replay the stored response instead of calling the model and charging again.
+    """
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(String, primary_key=True) # Keys are scoped per user
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False) # sha256 of the upload + form fields
+    status = Column(String, default="pending", nullable=False) # pending, completed
+    status_code = Column(Integer)
+    response_body = Column(Text) # JSON as returned to the first request
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class AnalysisDailyRollup(Base):
+    """
+    Per-day analysis counters, maintained on every insert (and rebuilt by backfill_rollups.py).
+    Admin analytics read O(days) rows from here instead of scanning analyses.
+    """
+    __tablename__ = "analysis_daily_rollups"
+
+    day = Column(Date, primary_key=True)
+    asset = Column(String, primary_key=True)
+    plan_tier = Column(String, primary_key=True) # Tier at the time of the analysis
+    count = Column(Integer, default=0, nullable=False)
+    latency_sum_ms = Column(Integer, default=0, nullable=False)
+    latency_count = Column(Integer, default=0, nullable=False)
+    confidence_sum = Column(Integer, default=0, nullable=False)
+    confidence_count = Column(Integer, default=0, nullable=False)
+
+class UserAnalysisStats(Base):
+    """
+    Per-user analysis counters (sidecar to users), updated in the same transaction as the
+    analyses insert / result patch so /stats is a primary-key read. Counts include archived rows.
+    """
+    __tablename__ = "user_analysis_stats"
+
+    user_id = Column(String, primary_key=True) # Firebase UID
+    total = Column(Integer, default=0, nullable=False)
+    wins = Column(Integer, default=0, nullable=False)
+    losses = Column(Integer, default=0, nullable=False)
+    breakevens = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
 class User(Base):
     __tablename__ = "users"
 
@@ -46,6 +171,12 @@ class User(Base):
     gender = Column(String, nullable=True)
     age_group = Column(String, nullable=True)
     is_admin = Column(Boolean, default=False)
+    chat_cache_opt_out = Column(Boolean, default=False) # Never serve/store cached chat answers
+
+    __table_args__ = (
+        Index("ix_users_created_id", "created_at", "id"),
+        Index("ix_users_plan_tier", "plan_tier"),
+    )
 
 class Payment(Base):
     __tablename__ = "payments"
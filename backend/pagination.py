@@ -0,0 +1,47 @@
+import base64
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque cursor pointing at the last row of a page (newest-first ordering)."""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(query, created_col, id_col, cursor: str = None):
+    """
+    Applies newest-first keyset pagination on (created_at, id) to a select()/Query.
+    Seeks straight to the cursor via the index instead of scanning OFFSET rows.
+    Rows without a created_at are left out: dialects disagree on where NULLs sort and a
+    NULL can't be encoded in a cursor (migration 11 backfills the legacy ones).
+    """
+    query = query.where(created_col.isnot(None))
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.where(or_(
+            created_col < created_at,
+            and_(created_col == created_at, id_col < row_id),
+        ))
+    return query.order_by(created_col.desc(), id_col.desc())
+
+
+def next_cursor(rows: list, limit: int):
+    """Cursor for the following page, or None when this page is the last one."""
+    if len(rows) < limit or not rows:
+        return None
+    last = rows[-1]
+    if last.created_at is None:  # Not from keyset_page(); can't seek past it
+        return None
+    return encode_cursor(last.created_at, last.id)
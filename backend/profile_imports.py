@@ -0,0 +1,124 @@
+"""
+Import-time profile of the serverless entry point (api/index.py -> main): what every
+cold start pays before the first request, /health included. Runs the import in a fresh
+interpreter under `python -X importtime` and reports where the time goes.
+
+Heavy dependencies (HEAVY_MODULES) should not show up at all: services import them
+inside the functions that use them. If one does, the chain of modules that pulled it
+in is printed.
+
+Usage: python profile_imports.py [--top 15]
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ENTRY_POINT = os.path.join(os.path.dirname(BACKEND_DIR), "api", "index.py")
+
+# Loaded on first use by the routes that need them, never at import time
+HEAVY_MODULES = [
+    "pandas", "numpy", "yfinance", "ccxt", "anthropic", "openai", "PIL", "pyarrow", "requests", "resend",
+]
+
+_SCRIPT = """
+import json, runpy, sys, time
+start = time.perf_counter()
+runpy.run_path({entry!r})
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{"ms": elapsed_ms, "heavy": sorted(m for m in {heavy!r} if m in sys.modules)}}))
+"""
+
+# "import time:      self [us] |  cumulative | <indent>name"
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$", re.MULTILINE)
+
+
+def measure_cold_start(importtime: bool = False):
+    """
+    Imports the entry point in a new interpreter. Returns ({"ms", "heavy"}, rows) where
+    rows are (module, self_us, cumulative_us, depth) in -X importtime order (children
+    before their importer); rows is empty unless importtime is set, which also inflates "ms".
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", _SCRIPT.format(entry=ENTRY_POINT, heavy=HEAVY_MODULES)]
+
+    env = dict(os.environ)
+    env.setdefault("JWT_SECRET_KEY", "cold-start-profile")  # auth.py refuses to import without one
+    proc = subprocess.run(command, capture_output=True, text=True, cwd=BACKEND_DIR, env=env)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {ENTRY_POINT} failed:\n{proc.stderr[-2000:]}")
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    rows = [
+        (name, int(self_us), int(cumulative_us), len(indent) // 2)
+        for self_us, cumulative_us, indent, name in _IMPORTTIME_LINE.findall(proc.stderr)
+    ]
+    return result, rows
+
+
+def importer_chain(rows, index: int) -> list[str]:
+    """Module at rows[index] followed by whatever imported it, up to the entry point."""
+    chain = [rows[index][0]]
+    depth = rows[index][3]
+    for name, _, _, row_depth in rows[index + 1:]:
+        if row_depth < depth:
+            chain.append(name)
+            depth = row_depth
+    return chain
+
+
+def _first_party_modules() -> set[str]:
+    names = set()
+    for entry in os.listdir(BACKEND_DIR):
+        if entry.endswith(".py"):
+            names.add(entry[:-3])
+        elif os.path.isfile(os.path.join(BACKEND_DIR, entry, "__init__.py")):
+            names.add(entry)
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    result, _ = measure_cold_start()
+    profiled, rows = measure_cold_start(importtime=True)
+    total_us = sum(self_us for _, self_us, _, _ in rows)
+
+    print(f"Cold start: {result['ms']:.0f} ms wall "
+          f"({total_us / 1000:.0f} ms of imports across {len(rows)} modules under -X importtime)\n")
+
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+    print(f"Top {args.top} top-level packages by import time:")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {self_us / 1000:>8.1f} ms  {package}")
+
+    first_party = _first_party_modules()
+    ours = [row for row in rows if row[0].split(".")[0] in first_party]
+    print(f"\nTop {args.top} app modules by cumulative time (including what they import):")
+    for name, _, cumulative_us, _ in sorted(ours, key=lambda row: -row[2])[:args.top]:
+        print(f"  {cumulative_us / 1000:>8.1f} ms  {name}")
+
+    print()
+    if not profiled["heavy"]:
+        print(f"No heavy dependencies imported at startup ({', '.join(HEAVY_MODULES)}).")
+        return
+    print(f"Heavy dependencies imported at startup: {', '.join(profiled['heavy'])}")
+    for index, (name, _, cumulative_us, _) in enumerate(rows):
+        if name in profiled["heavy"]:
+            chain = " <- ".join(importer_chain(rows, index))
+            print(f"  {cumulative_us / 1000:>8.1f} ms  {chain}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Recomputes user_analysis_stats from analyses + analyses_archive and repairs any drift
+(e.g. rows edited by hand or written by an older deploy).
+
+Usage:
+    python reconcile_user_stats.py            # repair
+    python reconcile_user_stats.py --dry-run  # report only
+"""
+import argparse
+import logging
+
+from database import SessionLocal
+from database_init import init_db
+from services.analytics_service import AnalyticsService
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile per-user analysis counters")
+    parser.add_argument("--dry-run", action="store_true", help="Report drift without fixing it")
+    args = parser.parse_args()
+
+    init_db(raise_errors=True)
+    db = SessionLocal()
+    try:
+        report = AnalyticsService().reconcile_user_stats(db, dry_run=args.dry_run)
+        verb = "would repair" if args.dry_run else "repaired"
+        print(f"Checked {report['checked']} users: {verb} {report['repaired']}, removed {report['removed']} stale rows.")
+    finally:
+        db.close()
@@ -0,0 +1,189 @@
+"""
+Fast JSON responses and response compression.
+
+FastJSONResponse is the app's default response class: orjson when installed (numpy,
+datetime and UUID handled natively, several times faster than the stdlib encoder),
+otherwise json.dumps with a fallback for the same types. Routes that build plain
+dicts/lists can return it directly to skip FastAPI's jsonable_encoder pass.
+
+CompressionMiddleware gzips (or brotli-compresses, when the brotli package is
+installed and the client accepts it) complete responses above a size threshold.
+Streaming responses (chat, exports, live feeds) pass through untouched.
+
+ClosingStreamingResponse runs a cleanup callback however a stream ends, for generators
+that hold a resource (a provider slot, a feed subscription) from before they start.
+"""
+import asyncio
+import datetime
+import decimal
+import gzip
+import json
+import os
+import uuid
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse, StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib encoder produces the same JSON, slower
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+# Responses smaller than this aren't worth the CPU (and often grow when compressed)
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 5))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))  # Dynamic responses: fast, still beats gzip
+# Bodies this large are compressed in a worker thread so the event loop isn't held for milliseconds
+OFFLOAD_MIN_BYTES = 256 * 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    """json.dumps fallback for the types orjson serializes natively."""
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (uuid.UUID, decimal.Decimal)):
+        return str(obj)
+    if hasattr(obj, "tolist"):  # numpy arrays and scalars
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+    # allow_nan=False like Starlette's JSONResponse (orjson writes NaN as null instead)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that calls `on_close` once the response is over: completed, failed or
+    client gone. A generator's own finally is not enough: it never runs if the client
+    disconnects before the first chunk is pulled, and Starlette skips `background` tasks
+    on disconnect.
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+def _accepted_encoding(accept_encoding: str) -> str | None:
+    """Best encoding we can produce that the client accepts (q=0 means refused)."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    Compresses single-message responses (every regular JSON response) whose body is at
+    least COMPRESSION_MIN_BYTES. Anything sent in several chunks, already encoded, partial
+    (206) or of a non-text type (upload images) is forwarded unchanged.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if (
+                    message["status"] in (204, 206, 304)
+                    or "content-encoding" in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message  # Held until we see whether the body is complete
+                return
+
+            if message["type"] != "http.response.body":
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False):
+                # Streaming response: leave it alone so chunks reach the client as they're produced
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start_message["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if len(body) >= self.minimum_size:
+                if len(body) >= OFFLOAD_MIN_BYTES:
+                    compressed = await asyncio.to_thread(compress, body, encoding)
+                else:
+                    compressed = compress(body, encoding)
+                if len(compressed) < len(body):
+                    body = compressed
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
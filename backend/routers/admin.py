@@ -1,13 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+import os
+from sqlalchemy.orm import Session, defer
+from sqlalchemy import func, select, union_all
+from datetime import date, datetime, timedelta
 import logging
 
 import models
-from dependencies import get_db, verify_admin
-from schemas import CreditUpdate, TierUpdate, TrialExtension
+from dependencies import get_db, get_read_db, verify_admin
+from schemas import CreditUpdate, TierUpdate, TrialExtension, AdminAnalysisSummary
+from pagination import keyset_page, next_cursor
+from responses import FastJSONResponse
+from user_cache import invalidate_user, user_cache_stats
+from services.llm_governor import governor_stats
+from services.chat_cache import chat_cache
+from services.sentiment_service import news_cache_stats
+from services.market_data_service import market_data_cache_stats
+from services.idempotency_service import idempotency_service
+from services.retention_service import RetentionService
+from services.export_service import ExportFilters, FORMATS, export_analyses, parquet_available
+from cache import TTLCache
+from storage import variant_path
+from upload_index import upload_index_stats
 
 # Setup Logger
 logger = logging.getLogger(__name__)
@@ -17,18 +31,60 @@ router = APIRouter(tags=["Admin"])
 # NOTE: Admin promotion is done directly via DB or via the admin panel only.
 # The /admin/promote backdoor has been removed for security.
 
+# Dashboard rollups are recomputed at most once per TTL; every admin widget reads from them
+_rollup_cache = TTLCache(maxsize=8, ttl=float(os.getenv("ADMIN_STATS_TTL", 30)))
+
+# In-process caches reported by /admin/caches and /metrics
+CACHE_STATS = {
+    "users": user_cache_stats,
+    "chat": chat_cache.stats,
+    "admin_rollups": _rollup_cache.stats,
+    "upload_index": upload_index_stats,
+    "news": news_cache_stats,
+    "market_data": market_data_cache_stats,
+}
+
+def _tier_counts(db: Session) -> dict:
+    """{plan_tier: user_count} from a single GROUP BY over users."""
+    counts = _rollup_cache.get("tier_counts")
+    if counts is None:
+        rows = db.query(models.User.plan_tier, func.count(models.User.id))\
+            .group_by(models.User.plan_tier).all()
+        counts = {tier: n for tier, n in rows}
+        _rollup_cache.set("tier_counts", counts)
+    return counts
+
+def _bias_rollup(db: Session) -> dict:
+    """{bias: (count, confidence_sum, confidence_count)} from a single GROUP BY over analyses + analyses_archive."""
+    rollup = _rollup_cache.get("bias_rollup")
+    if rollup is None:
+        analyses = union_all(
+            select(models.Analysis.bias, models.Analysis.confidence),
+            select(models.AnalysisArchive.bias, models.AnalysisArchive.confidence),
+        ).subquery()
+        rows = db.query(
+            analyses.c.bias,
+            func.count(),
+            func.sum(analyses.c.confidence),
+            func.count(analyses.c.confidence)
+        ).group_by(analyses.c.bias).all()
+        rollup = {bias: (n, conf_sum or 0, conf_n) for bias, n, conf_sum, conf_n in rows}
+        _rollup_cache.set("bias_rollup", rollup)
+    return rollup
+
 @router.get("/admin/stats")
-def get_admin_stats(db: Session = Depends(get_db), _: bool = Depends(verify_admin)):
+def get_admin_stats(db: Session = Depends(get_read_db), _: bool = Depends(verify_admin)):
     try:
-        total_users = db.query(models.User).count()
-        pro_users = db.query(models.User).filter(models.User.plan_tier == "pro").count()
-        total_analyses = db.query(models.Analysis).count()
+        tiers = _tier_counts(db)
+        total_users = sum(tiers.values())
+        pro_users = tiers.get("pro", 0)
+        total_analyses = sum(n for n, _, _ in _bias_rollup(db).values())
         
         # Calculate Revenue (Approximate)
         revenue_est = 0
-        revenue_est += db.query(models.User).filter(models.User.plan_tier == "pro").count() * 29.99
-        revenue_est += db.query(models.User).filter(models.User.plan_tier == "monthly").count() * 29.99
-        revenue_est += db.query(models.User).filter(models.User.plan_tier == "yearly").count() * 299.99
+        revenue_est += tiers.get("pro", 0) * 29.99
+        revenue_est += tiers.get("monthly", 0) * 29.99
+        revenue_est += tiers.get("yearly", 0) * 299.99
         
         return {
             "total_users": total_users,
@@ -42,30 +98,43 @@ def get_admin_stats(db: Session = Depends(get_db), _: bool = Depends(verify_admi
 
 @router.get("/admin/users")
 def get_all_users(
+    response: Response,
     skip: int = 0, 
-    limit: int = 50, 
+    limit: int = Query(50, ge=1, le=200), 
     search: str = None,
-    db: Session = Depends(get_db), 
+    cursor: str = None,
+    db: Session = Depends(get_read_db), 
     admin: bool = Depends(verify_admin)
 ):
+    """
+    Newest-first user list. Prefer `cursor` (from the X-Next-Cursor header);
+    `skip` is kept for older clients and only used when no cursor is given.
+    """
     try:
         query = db.query(models.User)
         if search:
             query = query.filter(models.User.email.ilike(f"%{search}%"))
         
-        users = query.order_by(models.User.created_at.desc()).offset(skip).limit(limit).all()
+        query = keyset_page(query, models.User.created_at, models.User.id, cursor)
+        if skip and not cursor:
+            query = query.offset(skip)
+        users = query.limit(limit).all()
+
+        cursor_out = next_cursor(users, limit)
+        if cursor_out:
+            response.headers["X-Next-Cursor"] = cursor_out
         return users
     except Exception as e:
         logger.error(f"Admin Users Error: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
 @router.get("/admin/users/{user_id}/details")
-def get_user_details(user_id: int, db: Session = Depends(get_db), admin: bool = Depends(verify_admin)):
+def get_user_details(user_id: int, db: Session = Depends(get_read_db), admin: bool = Depends(verify_admin)):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
         
-    recent_analyses = db.query(models.Analysis).filter(
+    recent_analyses = db.query(models.Analysis).options(defer(models.Analysis.meta_json), defer(models.Analysis.meta_packed)).filter(
         models.Analysis.user_id == user.firebase_uid
     ).order_by(models.Analysis.created_at.desc()).limit(20).all()
     
@@ -82,6 +151,7 @@ def update_user_credits(user_id: int, credit_data: CreditUpdate, db: Session = D
     
     user.credits_balance = credit_data.amount
     db.commit()
+    invalidate_user(user.firebase_uid)
     return {"status": "success", "new_balance": user.credits_balance}
 
 @router.delete("/admin/users/{user_id}")
@@ -92,77 +162,138 @@ def delete_user(user_id: int, db: Session = Depends(get_db), _: bool = Depends(v
     
     # Optional: Delete their analyses too? Yes, for clean up.
     db.query(models.Analysis).filter(models.Analysis.user_id == user.firebase_uid).delete()
+    db.query(models.UserAnalysisStats).filter(models.UserAnalysisStats.user_id == user.firebase_uid).delete()
     db.delete(user)
     db.commit()
+    invalidate_user(user.firebase_uid)
+    _rollup_cache.clear()
     return {"status": "success", "message": "User deleted"}
 
-@router.get("/admin/analyses")
-def get_recent_global_analyses(limit: int = 20, db: Session = Depends(get_db), _: bool = Depends(verify_admin)):
+@router.get("/admin/analyses", response_model=list[AdminAnalysisSummary])
+def get_recent_global_analyses(
+    response: Response,
+    limit: int = Query(20, ge=1, le=200),
+    cursor: str = None,
+    db: Session = Depends(get_read_db),
+    _: bool = Depends(verify_admin)
+):
     try:
-        analyses = db.query(models.Analysis).order_by(models.Analysis.created_at.desc()).limit(limit).all()
+        query = db.query(models.Analysis).options(defer(models.Analysis.meta_json), defer(models.Analysis.meta_packed))
+        analyses = keyset_page(query, models.Analysis.created_at, models.Analysis.id, cursor).limit(limit).all()
+
+        cursor_out = next_cursor(analyses, limit)
+        if cursor_out:
+            response.headers["X-Next-Cursor"] = cursor_out
         return analyses
     except Exception as e:
         logger.error(f"Admin Analyses Error: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
+@router.get("/admin/export/analyses")
+def export_analyses_endpoint(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    start: date = None,
+    end: date = None,
+    user_id: str = None,
+    asset: str = None,
+    result: str = None,
+    flatten: bool = False,
+    _: bool = Depends(verify_admin)
+):
+    """
+    Streams matching analyses (oldest first) without buffering the result set.
+    flatten=true expands meta_data into meta.* columns.
+    """
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export is not available on this server (pyarrow is not installed)")
+
+    filters = ExportFilters(start=start, end=end, user_id=user_id, asset=asset, result=result)
+    media_type, extension = FORMATS[format]
+    filename = f"analyses_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return StreamingResponse(
+        export_analyses(filters, fmt=format, flatten=flatten),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/admin/maintenance/retention")
+def run_retention(dry_run: bool = False, db: Session = Depends(get_db), _: bool = Depends(verify_admin)):
+    """Runs one bounded archival + image GC pass (the same job as run_retention.py)."""
+    try:
+        report = RetentionService().run(db, dry_run=dry_run)
+        if not dry_run and report["analyses"]["archived"]:
+            _rollup_cache.clear()
+        return {"status": "success", "dry_run": dry_run, **report}
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Retention Run Error: {e}")
+        return JSONResponse(status_code=500, content={"detail": str(e)})
+
 @router.get("/admin/content/charts")
-def get_admin_charts(db: Session = Depends(get_db), _: bool = Depends(verify_admin)):
+def get_admin_charts(db: Session = Depends(get_read_db), _: bool = Depends(verify_admin)):
     try:
-        charts = db.query(models.Analysis).order_by(models.Analysis.created_at.desc()).limit(50).all()
-        return [
+        charts = db.query(models.Analysis)\
+            .options(defer(models.Analysis.meta_json), defer(models.Analysis.meta_packed))\
+            .order_by(models.Analysis.created_at.desc()).limit(50).all()
+        return FastJSONResponse([
             {
                 "id": c.id,
                 "asset": c.asset,
                 "bias": c.bias,
                 "created_at": c.created_at,
                 "user_id": c.user_id,
-                "image_url": c.image_path 
+                "image_url": variant_path(c.image_path, "thumb"),
+                "preview_url": variant_path(c.image_path, "preview"),
+                "original_url": c.image_path
             }
             for c in charts
-        ]
+        ])
     except Exception as e:
         logger.error(f"Admin Content Charts Error: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
 @router.get("/admin/analytics/usage")
-def get_usage_analytics(db: Session = Depends(get_db), _: bool = Depends(verify_admin)):
+def get_usage_analytics(db: Session = Depends(get_read_db), _: bool = Depends(verify_admin)):
     try:
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        analyses = db.query(models.Analysis).filter(models.Analysis.created_at >= thirty_days_ago).all()
-        
-        daily_counts = {}
-        for a in analyses:
-            date_str = a.created_at.strftime("%Y-%m-%d")
-            daily_counts[date_str] = daily_counts.get(date_str, 0) + 1
+        thirty_days_ago = (datetime.utcnow() - timedelta(days=30)).date()
+        rows = db.query(models.AnalysisDailyRollup.day, func.sum(models.AnalysisDailyRollup.count))\
+            .filter(models.AnalysisDailyRollup.day >= thirty_days_ago)\
+            .group_by(models.AnalysisDailyRollup.day)\
+            .order_by(models.AnalysisDailyRollup.day).all()
         
-        data = [{"date": k, "count": v} for k,v in daily_counts.items()]
-        return sorted(data, key=lambda x: x["date"])
+        return [{"date": day.strftime("%Y-%m-%d"), "count": int(n)} for day, n in rows]
     except Exception as e:
         logger.error(f"Admin Usage Analytics Error: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
 @router.get("/admin/analytics/assets")
-def get_asset_analytics(db: Session = Depends(get_db), _: bool = Depends(verify_admin)):
+def get_asset_analytics(db: Session = Depends(get_read_db), _: bool = Depends(verify_admin)):
     try:
-        analyses = db.query(models.Analysis).order_by(models.Analysis.created_at.desc()).limit(500).all()
-        asset_counts = {}
-        for a in analyses:
-            asset = a.asset or "Unknown"
-            asset_counts[asset] = asset_counts.get(asset, 0) + 1
+        # Asset mix over the last 30 days, from the daily rollups
+        thirty_days_ago = (datetime.utcnow() - timedelta(days=30)).date()
+        rows = db.query(models.AnalysisDailyRollup.asset, func.sum(models.AnalysisDailyRollup.count))\
+            .filter(models.AnalysisDailyRollup.day >= thirty_days_ago)\
+            .group_by(models.AnalysisDailyRollup.asset).all()
         
-        return [{"name": k, "value": v} for k,v in asset_counts.items()]
+        return [{"name": asset, "value": int(n)} for asset, n in rows]
     except Exception as e:
         logger.error(f"Admin Asset Analytics Error: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
 @router.get("/admin/ai/stats")
-def get_ai_stats(db: Session = Depends(get_db), _: bool = Depends(verify_admin)):
+def get_ai_stats(db: Session = Depends(get_read_db), _: bool = Depends(verify_admin)):
     try:
-        avg_conf = db.query(func.avg(models.Analysis.confidence)).scalar() or 0
+        bias = _bias_rollup(db)
+        conf_sum = sum(s for _, s, _ in bias.values())
+        conf_n = sum(n for _, _, n in bias.values())
+        avg_conf = conf_sum / conf_n if conf_n else 0
         
-        latencies = db.query(models.Analysis.processing_time_ms, models.Analysis.created_at)\
-            .filter(models.Analysis.processing_time_ms != None)\
-            .order_by(models.Analysis.created_at.desc()).limit(50).all()
+        latencies = _rollup_cache.get("latencies")
+        if latencies is None:
+            latencies = db.query(models.Analysis.processing_time_ms, models.Analysis.created_at)\
+                .filter(models.Analysis.processing_time_ms != None)\
+                .order_by(models.Analysis.created_at.desc()).limit(50).all()
+            _rollup_cache.set("latencies", latencies)
             
         avg_latency = 0
         if latencies:
@@ -170,8 +301,8 @@ def get_ai_stats(db: Session = Depends(get_db), _: bool = Depends(verify_admin))
             
         latency_history = [{"date": l[1].strftime("%H:%M:%S"), "ms": l[0]} for l in reversed(latencies)]
 
-        bullish = db.query(models.Analysis).filter(models.Analysis.bias == "Bullish").count()
-        bearish = db.query(models.Analysis).filter(models.Analysis.bias == "Bearish").count()
+        bullish = bias.get("Bullish", (0, 0, 0))[0]
+        bearish = bias.get("Bearish", (0, 0, 0))[0]
         
         market_accuracy = 56 
         
@@ -189,13 +320,42 @@ def get_ai_stats(db: Session = Depends(get_db), _: bool = Depends(verify_admin))
         logger.error(f"Admin AI Stats Error: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
 
+@router.get("/admin/ai/limits")
+def get_ai_limits(_: bool = Depends(verify_admin)):
+    """
+    Live view of the per-provider LLM governors (in-flight, queue depth, wait times).
+    """
+    return {"providers": governor_stats()}
+
+@router.get("/admin/ai/chat-cache")
+def get_chat_cache_stats(_: bool = Depends(verify_admin)):
+    """
+    Chat response cache effectiveness: hit rate, entries and estimated DeepSeek tokens saved.
+    """
+    return chat_cache.stats()
+
+@router.get("/admin/ai/idempotency")
+def get_idempotency_stats(_: bool = Depends(verify_admin)):
+    """
+    /analyze Idempotency-Key usage on this worker: deduplicated retries (replayed or joined in flight), conflicts.
+    """
+    return idempotency_service.stats()
+
+@router.get("/admin/caches")
+def get_cache_stats(_: bool = Depends(verify_admin)):
+    """
+    Hit rates and sizes of the in-process caches.
+    """
+    return {name: stats() for name, stats in CACHE_STATS.items()}
+
 @router.get("/admin/finance/stats")
-def get_financial_stats(db: Session = Depends(get_db), _: bool = Depends(verify_admin)):
+def get_financial_stats(db: Session = Depends(get_read_db), _: bool = Depends(verify_admin)):
     try:
-        starter = db.query(models.User).filter(models.User.plan_tier == "starter").count()
-        active = db.query(models.User).filter(models.User.plan_tier == "active").count()
-        advanced = db.query(models.User).filter(models.User.plan_tier == "advanced").count()
-        pro_legacy = db.query(models.User).filter(models.User.plan_tier == "pro").count()
+        tiers = _tier_counts(db)
+        starter = tiers.get("starter", 0)
+        active = tiers.get("active", 0)
+        advanced = tiers.get("advanced", 0)
+        pro_legacy = tiers.get("pro", 0)
         
         mrr_ghs = (starter * 180) + (active * 150) + (advanced * 300) + (pro_legacy * 300)
         
@@ -233,6 +393,8 @@ def update_user_tier(user_id: int, tier_data: TierUpdate, db: Session = Depends(
              user.subscription_ends_at = now + timedelta(days=30)
              
     db.commit()
+    invalidate_user(user.firebase_uid)
+    _rollup_cache.invalidate("tier_counts")
     return {"status": "success", "message": f"User upgraded to {tier_data.tier}"}
 
 @router.post("/admin/users/{user_id}/extend-trial")
@@ -250,4 +412,5 @@ def extend_user_trial(user_id: int, extension: TrialExtension, db: Session = Dep
     user.credits_balance += 3
     
     db.commit()
+    invalidate_user(user.firebase_uid)
     return {"status": "success", "new_expiry": user.trial_ends_at}
@@ -1,173 +1,257 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header, Query, Response
 from fastapi.responses import JSONResponse, StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
 from datetime import datetime, timedelta
 import shutil
 import os
 import json
 import logging
-import uuid
+import asyncio
+import time
 
+import metrics
 import models
-from dependencies import get_db
+from dependencies import get_db, get_async_db, get_read_db, get_async_read_db, mark_user_write
 from auth import get_current_user
-from schemas import AnalysisResponse, AnalysisUpdateResult, ChatMessage
+from schemas import AnalysisResponse, AnalysisSummary, AnalysisUpdateResult, ChatMessage
+from pagination import keyset_page, next_cursor
+from responses import FastJSONResponse, ClosingStreamingResponse, dumps
+from storage import get_storage
+from upload_ingest import ingest_upload, IngestedUpload
+from user_cache import cache_user, get_cached_user, get_cached_user_async, invalidate_user
 from services.ai_service import AIService
 from services.quant_service import QuantService
 from services.sentiment_service import SentimentService
 from services.chat_service import ChatService
+from services.chat_cache import chat_cache
+from services.llm_governor import get_governor, GovernorRejected
+from services.quota_service import QuotaService, QuotaDenied
+from services.analytics_service import AnalyticsService
+from services.market_data_service import MarketDataService, MARKET_DATA_HISTORY
+from services.live_feed import live_feed_hub, FeedFull, FEED_SYMBOLS
+from services.idempotency_service import (
+    idempotency_service, IdempotencyConflict, StoredResponse, request_fingerprint
+)
 
 # Setup Logger
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["Analysis"])
 
+quota_service = QuotaService()
+analytics_service = AnalyticsService()
+
+# /market-data window when no range or limit is given (what the provider fetch used to return)
+DEFAULT_CANDLES = 100
+VALID_TIMEFRAMES = ["1m", "5m", "15m", "30m", "1h", "4h", "1d", "1w"]
+# Comment line sent on idle live-feed streams
+FEED_HEARTBEAT_SECONDS = 15
+
 # /upload endpoint removed — use /analyze directly.
 
-@router.post("/analyze", response_model=AnalysisResponse)
-async def analyze_chart(
-    file: UploadFile = File(...), 
-    equity: float = Form(1000.0), 
-    db: Session = Depends(get_db),
+async def _resolve_user(db: AsyncSession, x_user_id: str, x_user_email: str | None):
+    """
+    Cached user snapshot for the request, re-linking by email or lazily provisioning a
+    trial user on first contact. Quota itself is enforced by QuotaService.
+    """
+    user = await get_cached_user_async(db, x_user_id)
+    
+    # If not found by UID, try finding by Email
+    if not user and x_user_email:
+         db_user = (await db.execute(
+             select(models.User).where(models.User.email == x_user_email)
+         )).scalars().first()
+         if db_user:
+             logger.info(f"User found by email {x_user_email}, updating UID to {x_user_id}")
+             invalidate_user(db_user.firebase_uid)
+             db_user.firebase_uid = x_user_id
+             await db.commit()
+             user = cache_user(db_user)
+
+    # If user doesn't exist in DB yet, create them (lazy sync)
+    if not user:
+        # 3-Day Free Trial
+        trial_expiry = datetime.utcnow() + timedelta(days=3)
+        db_user = models.User(
+            firebase_uid=x_user_id,
+            email=x_user_email, 
+            full_name=x_user_email.split('@')[0] if x_user_email else "Trader",
+            plan_tier="trial",
+            credits_balance=10,
+            trial_ends_at=trial_expiry
+        )
+        db.add(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+        user = cache_user(db_user)
+
+    # Backfill email if missing for existing user
+    if x_user_email and not user.email:
+        await db.execute(
+            update(models.User)
+            .where(models.User.firebase_uid == x_user_id)
+            .values(email=x_user_email, full_name=x_user_email.split('@')[0])
+        )
+        await db.commit()
+        invalidate_user(x_user_id)
+
+    return user
+
+
+async def _check_news_pause(sentiment_service: SentimentService):
+    """Safety switch: no new entries around high-impact events (calendar result is cached)."""
+    news_risk = await asyncio.to_thread(sentiment_service.check_high_impact_news)
+    if news_risk.get("risk") == "HIGH":
+        event_name = news_risk.get("event")
+        logger.warning(f"SAFETY SWITCH TRIGGERED: {event_name}")
+        raise HTTPException(status_code=400, detail=f"TRADING PAUSED: High Impact News Detected ({event_name}). System prevents entry during volatility spikes.")
+
+
+async def _release_reservation(db: AsyncSession, reservation_id: str | None, firebase_uid: str):
+    """Refunds the /analyze/reserve hold of a request rejected before it claimed the hold."""
+    if not reservation_id:
+        return
+    try:
+        if await quota_service.release(db, reservation_id, firebase_uid):
+            logger.info(f"Reservation {reservation_id} released: request rejected before claim")
+    except Exception as e:
+        logger.error(f"Releasing reservation {reservation_id} failed: {e}")
+
+
+@router.post("/analyze/reserve")
+async def reserve_analysis(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     x_user_id: str = Header(None),
-    x_user_email: str = Header(None) 
+    x_user_email: str = Header(None)
 ):
+    """
+    Pre-flight for /analyze with no request body: runs the quota and news checks and
+    holds one unit. Send the returned id as X-Reservation-Id with the upload; rejected
+    users never upload the file.
+    """
+    if not x_user_id:
+        raise HTTPException(status_code=400, detail="User ID required")
+
+    await _resolve_user(db, x_user_id, x_user_email)
+    await _check_news_pause(SentimentService())
+
     try:
-        if not x_user_id:
-            raise HTTPException(status_code=400, detail="User ID required")
+        await quota_service.release_expired(db)
+    except Exception as e:
+        logger.error(f"Reservation sweep failed: {e}")
 
-        # Check User Tier & Daily Limit
-        user = db.query(models.User).filter(models.User.firebase_uid == x_user_id).first()
-        
-        # If not found by UID, try finding by Email
-        if not user and x_user_email:
-             user = db.query(models.User).filter(models.User.email == x_user_email).first()
-             if user:
-                 logger.info(f"User found by email {x_user_email}, updating UID to {x_user_id}")
-                 user.firebase_uid = x_user_id
-                 db.commit()
-                 db.refresh(user)
-
-        # If user doesn't exist in DB yet, create them (lazy sync)
-        if not user:
-            # 3-Day Free Trial
-            trial_expiry = datetime.utcnow() + timedelta(days=3)
-            user = models.User(
-                firebase_uid=x_user_id,
-                email=x_user_email, 
-                full_name=x_user_email.split('@')[0] if x_user_email else "Trader",
-                plan_tier="trial",
-                credits_balance=10,
-                trial_ends_at=trial_expiry
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-
-        # Backfill email if missing for existing user
-        if x_user_email and not user.email:
-            user.email = x_user_email
-            user.full_name = x_user_email.split('@')[0]
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-
-        # 1. ACCESS CONTROL LOGIC
-        allow_analysis = False
-        daily_limit = 0
-        
-        # Lazy Daily Reset
-        today = datetime.utcnow().date()
-        last_usage = user.last_usage_date.date() if user.last_usage_date else None
-        
-        if last_usage != today:
-            user.daily_usage_count = 0
-            user.last_usage_date = datetime.utcnow()
-            db.commit()
-
-        # Determine Limits based on Tier
-        if user.plan_tier in ["starter"]:
-            daily_limit = 10
-        elif user.plan_tier in ["active", "pro", "monthly"]:
-            daily_limit = 20
-        elif user.plan_tier in ["advanced", "yearly"]:
-            daily_limit = 100
-        elif user.plan_tier == "trial":
-            daily_limit = 3 
-        
-        # Check Subscription Expiry
-        is_subscription_active = False
-        if user.plan_tier != "trial" and user.plan_tier != "free":
-            if user.subscription_ends_at and user.subscription_ends_at > datetime.utcnow():
-                is_subscription_active = True
-            else:
-                user.plan_tier = "free"
-                db.commit()
-                raise HTTPException(status_code=403, detail="Subscription expired. Please renew.")
-        
-        # Logic Execution
-        if is_subscription_active:
-            if user.daily_usage_count >= daily_limit:
-                 raise HTTPException(status_code=403, detail=f"Daily limit reached ({daily_limit} uploads/day). Please upgrade for more.")
-            
-            user.daily_usage_count += 1
-            user.last_usage_date = datetime.utcnow()
-            allow_analysis = True
-            db.commit()
-            
-        elif user.plan_tier == "trial":
-            if user.credits_balance <= 0 or user.credits_balance > 3: 
-                 if user.credits_balance > 3 and user.credits_balance == 10:
-                     user.credits_balance = 3
-                     db.commit()
-            
-            if user.credits_balance <= 0:
-                 raise HTTPException(status_code=403, detail="Free trial limit reached (3 uploads). Please upgrade.")
-                 
-            now = datetime.utcnow()
-            if user.trial_ends_at and now > user.trial_ends_at:
-                 user.plan_tier = "free"
-                 db.commit()
-                 raise HTTPException(status_code=403, detail="Free trial time expired. Please upgrade.")
-
-            user.credits_balance -= 1
-            allow_analysis = True
-            db.commit()
-            
-        else:
-            raise HTTPException(status_code=403, detail="Trial expired. Please upgrade to Pro.")
+    try:
+        reservation, grant = await quota_service.reserve(db, x_user_id)
+    except QuotaDenied as qd:
+        raise HTTPException(status_code=403, detail=qd.detail)
 
-        if not allow_analysis:
-             raise HTTPException(status_code=403, detail="Access denied.")
+    response.headers["X-Reservation-Id"] = reservation.id
+    return {
+        "reservation_id": reservation.id,
+        "expires_at": reservation.expires_at,
+        "remaining": grant.remaining,
+    }
 
-        # 1. Save File — validate type, size, and sanitize filename
-        ALLOWED_TYPES = {"image/png", "image/jpeg", "image/webp", "image/jpg"}
-        MAX_SIZE_BYTES = 10 * 1024 * 1024  # 10 MB
 
-        if file.content_type not in ALLOWED_TYPES:
-            raise HTTPException(status_code=400, detail="Invalid file type. Only PNG, JPG, and WEBP images are accepted.")
+@router.post("/analyze", response_model=AnalysisResponse)
+async def analyze_chart(
+    file: UploadFile = File(...), 
+    equity: float = Form(1000.0), 
+    db: AsyncSession = Depends(get_async_db),
+    x_user_id: str = Header(None),
+    x_user_email: str = Header(None),
+    x_reservation_id: str = Header(None),
+    idempotency_key: str = Header(None)
+):
+    """
+    Send an Idempotency-Key (e.g. a UUID per chart) so retries after a dropped connection
+    return the original result instead of charging quota and calling the model again.
+    """
+    if not x_user_id:
+        raise HTTPException(status_code=400, detail="User ID required")
 
-        # Read file content once, check size
-        file_bytes = await file.read()
-        if len(file_bytes) > MAX_SIZE_BYTES:
-            raise HTTPException(status_code=400, detail="File too large. Maximum allowed size is 10 MB.")
+    # Validate the upload first (streamed, sniffed, size/dimension capped) so bad files cost no DB work
+    try:
+        with metrics.stage("ingest"):
+            upload = await ingest_upload(file)
+    except HTTPException:
+        await _release_reservation(db, x_reservation_id, x_user_id)
+        raise
 
-        # Sanitize filename — use UUID to prevent path traversal
-        ext = os.path.splitext(os.path.basename(file.filename or "chart"))[1].lower()
-        if ext not in (".png", ".jpg", ".jpeg", ".webp"):
-            ext = ".png"
-        safe_filename = f"{uuid.uuid4().hex}{ext}"
+    if not idempotency_key:
+        return await _run_analysis(db, upload, equity, x_user_id, x_user_email, x_reservation_id)
 
-        upload_dir = "/tmp" if os.path.exists("/tmp") else "uploads"
-        os.makedirs(upload_dir, exist_ok=True)
+    fingerprint = request_fingerprint(upload.digest, equity)
+    try:
+        stored = await idempotency_service.begin(db, x_user_id, idempotency_key, fingerprint)
+    except IdempotencyConflict as ic:
+        await _release_reservation(db, x_reservation_id, x_user_id)
+        headers = {"Retry-After": str(ic.retry_after)} if ic.retry_after else None
+        raise HTTPException(status_code=ic.status_code, detail=ic.detail, headers=headers)
+    if stored is not None:
+        # A replay doesn't run the analysis; a fresh hold sent with the retry isn't needed
+        await _release_reservation(db, x_reservation_id, x_user_id)
+        return Response(
+            content=stored.body, status_code=stored.status_code,
+            media_type="application/json", headers={"Idempotent-Replayed": "true"},
+        )
 
-        physical_path = os.path.join(upload_dir, safe_filename)
-        db_image_path = f"uploads/{safe_filename}"
+    try:
+        result = await _run_analysis(db, upload, equity, x_user_id, x_user_email, x_reservation_id)
+    except HTTPException as he:
+        await idempotency_service.release(
+            db, x_user_id, idempotency_key, StoredResponse(he.status_code, json.dumps({"detail": he.detail}))
+        )
+        raise
+    except BaseException:
+        await idempotency_service.release(
+            db, x_user_id, idempotency_key, StoredResponse(500, json.dumps({"detail": "Analysis Failed"}))
+        )
+        raise
+
+    if isinstance(result, Response):
+        # Error already turned into a response (refunded), so retries may run again
+        await idempotency_service.release(
+            db, x_user_id, idempotency_key, StoredResponse(result.status_code, result.body.decode("utf-8"))
+        )
+    else:
+        await idempotency_service.complete(
+            db, x_user_id, idempotency_key, StoredResponse(200, result.model_dump_json())
+        )
+    return result
 
-        with open(physical_path, "wb") as buffer:
-            buffer.write(file_bytes)
 
-        file_location = physical_path
+async def _run_analysis(db: AsyncSession, upload: IngestedUpload, equity: float, x_user_id: str,
+                        x_user_email: str | None, x_reservation_id: str | None):
+    grant = None
+    try:
+        with metrics.stage("resolve_user"):
+            user = await _resolve_user(db, x_user_id, x_user_email)
+
+        # 1. ACCESS CONTROL — claim the unit held by /analyze/reserve, or take one now
+        # (one conditional UPDATE covers daily reset, limit check and decrement)
+        with metrics.stage("quota"):
+            if x_reservation_id:
+                grant = await quota_service.claim(db, x_reservation_id, x_user_id)
+                if grant is None:
+                    logger.info(f"Reservation {x_reservation_id} not claimable; charging quota directly")
+            if grant is None:
+                try:
+                    grant = await quota_service.consume(db, x_user_id)
+                except QuotaDenied as qd:
+                    raise HTTPException(status_code=403, detail=qd.detail)
+
+        # 1. Save File — content-addressed name (sha256), extension from the sniffed format
+        storage = get_storage()
+        with metrics.stage("store_image"):
+            stored = await asyncio.to_thread(storage.save_image, upload.data, upload.ext, upload.digest)
+        db_image_path = f"uploads/{stored.name}"
+        file_location = storage.local_path(stored.name)
+        if stored.deduped:
+            logger.info(f"   Upload deduplicated: {stored.name}")
 
         # 2. AI Analysis & Tri-Model Orchestration
         try:
@@ -183,19 +267,17 @@ async def analyze_chart(
             
             # --- MODEL 1: SENTIMENT ENGINE ---
             logger.info("1. Sentiment Engine: Checking News...")
-            news_risk = sentiment_service.check_high_impact_news()
-            
-            if news_risk.get("risk") == "HIGH":
-                event_name = news_risk.get("event")
-                logger.warning(f"SAFETY SWITCH TRIGGERED: {event_name}")
-                raise HTTPException(status_code=400, detail=f"TRADING PAUSED: High Impact News Detected ({event_name}). System prevents entry during volatility spikes.")
+            with metrics.stage("news_check"):
+                await _check_news_pause(sentiment_service)
                 
-            market_sentiment = sentiment_service.get_market_sentiment()
+            with metrics.stage("sentiment"):
+                market_sentiment = await asyncio.to_thread(sentiment_service.get_market_sentiment)
             logger.info(f"   Sentiment: {market_sentiment.get('label')} ({market_sentiment.get('score')})")
 
             # --- MODEL 2: QUANT ENGINE (Multi-Timeframe) ---
             logger.info("2. Quant Engine: Analyzing Market Structure (D1, H4, H1)...")
-            quant_context = await quant_service.get_multi_timeframe_analysis("XAU/USD")
+            with metrics.stage("quant"):
+                quant_context = await quant_service.get_multi_timeframe_analysis("XAU/USD")
             
             alignment = quant_context.get("alignment", "Unavailable")
             trend_1h = quant_context.get("1h", {}).get("trend", "Neutral")
@@ -206,12 +288,27 @@ async def analyze_chart(
             
             start_time = datetime.utcnow()
             
-            ai_result_json = ai_service.analyze_chart(
-                file_location, 
-                equity=equity,
-                quant_data=quant_context,
-                sentiment_data=market_sentiment
-            )
+            # Admission through the Anthropic governor; the blocking SDK call runs in a thread
+            # so queued requests don't stall the event loop.
+            try:
+                queued_at = time.perf_counter()
+                async with get_governor("anthropic").slot(grant.plan_tier):
+                    metrics.ANALYZE_STAGE_SECONDS.observe(time.perf_counter() - queued_at, stage="governor_wait")
+                    with metrics.stage("vision"):
+                        ai_result_json = await asyncio.to_thread(
+                            ai_service.analyze_chart,
+                            file_location, 
+                            equity=equity,
+                            quant_data=quant_context,
+                            sentiment_data=market_sentiment
+                        )
+            except GovernorRejected as gr:
+                logger.warning(f"Vision Engine busy: {gr}")
+                raise HTTPException(
+                    status_code=429,
+                    detail="AI engine is at capacity. Please retry shortly.",
+                    headers={"Retry-After": str(gr.retry_after)}
+                )
             
             end_time = datetime.utcnow()
             duration_ms = int((end_time - start_time).total_seconds() * 1000)
@@ -222,7 +319,7 @@ async def analyze_chart(
             ai_data["sentiment_engine"] = market_sentiment
             
             levels = ai_data.get("levels", {})
-            metrics = ai_data.get("metrics", {})
+            ai_metrics = ai_data.get("metrics", {})
             
             def to_float(val):
                 try:
@@ -240,8 +337,8 @@ async def analyze_chart(
                 "sl": to_float(levels.get("sl")),
                 "tp1": to_float(levels.get("tp1")),
                 "tp2": to_float(levels.get("tp2")),
-                "risk_reward": metrics.get("risk_reward", "N/A"),
-                "sentiment": metrics.get("sentiment", "Neutral"),
+                "risk_reward": ai_metrics.get("risk_reward", "N/A"),
+                "sentiment": ai_metrics.get("sentiment", "Neutral"),
                 "image_path": db_image_path,
                 "user_id": x_user_id,
                 "processing_time_ms": duration_ms,
@@ -254,8 +351,18 @@ async def analyze_chart(
         except HTTPException as he:
              raise he
 
+    except HTTPException:
+        if grant:
+            await quota_service.refund(db, grant)
+        else:
+            await _release_reservation(db, x_reservation_id, x_user_id)
+        raise
     except Exception as e:
         logger.error(f"Analysis Endpoint Failed: {e}")
+        if grant:
+            await quota_service.refund(db, grant)
+        else:
+            await _release_reservation(db, x_reservation_id, x_user_id)
         return JSONResponse(
             status_code=500,
             content={"detail": f"Analysis Failed: {str(e)}"}
@@ -263,10 +370,13 @@ async def analyze_chart(
 
     # 3. Save to DB
     try:
-        db_analysis = models.Analysis(**analysis_data)
-        db.add(db_analysis)
-        db.commit()
-        db.refresh(db_analysis)
+        with metrics.stage("db_save"):
+            db_analysis = models.Analysis(**analysis_data, created_at=datetime.utcnow())
+            db.add(db_analysis)
+            await analytics_service.record_analysis(db, db_analysis, grant.plan_tier)
+            await db.commit()
+            await db.refresh(db_analysis)
+        mark_user_write(x_user_id)
         
         # Map to Response Schema manually to include hydrated fields
         response = AnalysisResponse.model_validate(db_analysis)
@@ -276,35 +386,56 @@ async def analyze_chart(
         return response
     except Exception as e:
          logger.error(f"Database Save Failed: {e}")
+         await quota_service.refund(db, grant)
          raise HTTPException(status_code=500, detail=f"Failed to save results: {str(e)}")
 
-@router.get("/analyses", response_model=list[AnalysisResponse])
-def get_analyses(
-    skip: int = 0, 
-    limit: int = 100, 
-    db: Session = Depends(get_db),
+@router.get("/analyses", response_model=list[AnalysisSummary])
+async def get_analyses(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str = None,
+    db: AsyncSession = Depends(get_async_read_db),
     x_user_id: str = Header(None)
 ):
+    """
+    Newest-first history in pages of `limit`. Prefer `cursor` (the X-Next-Cursor header
+    from the previous page); `skip` is kept for older clients and only used when no
+    cursor is given.
+    """
     if not x_user_id:
         return []
     
-    analyses = db.query(models.Analysis).filter(
-        models.Analysis.user_id == x_user_id
-    ).order_by(models.Analysis.created_at.desc()).offset(skip).limit(limit).all()
+    query = keyset_page(
+        select(models.Analysis)
+        .options(defer(models.Analysis.meta_json), defer(models.Analysis.meta_packed))
+        .where(models.Analysis.user_id == x_user_id),
+        models.Analysis.created_at, models.Analysis.id, cursor
+    )
+    if skip and not cursor:
+        query = query.offset(skip)
+    analyses = (await db.execute(query.limit(limit))).scalars().all()
+
+    cursor_out = next_cursor(analyses, limit)
+    if cursor_out:
+        response.headers["X-Next-Cursor"] = cursor_out
     return analyses
 
 @router.get("/analyses/{analysis_id}", response_model=AnalysisResponse)
-def read_analysis(analysis_id: int, x_user_id: str = Header(None), db: Session = Depends(get_db)):
+def read_analysis(analysis_id: int, x_user_id: str = Header(None), db: Session = Depends(get_read_db)):
     if not x_user_id:
         raise HTTPException(status_code=400, detail="User ID required")
 
     analysis = db.query(models.Analysis).filter(models.Analysis.id == analysis_id).first()
+    if analysis is None:
+        # Rows past the retention window live in the archive table
+        analysis = db.query(models.AnalysisArchive).filter(models.AnalysisArchive.id == analysis_id).first()
     if analysis is None:
         raise HTTPException(status_code=404, detail="Analysis not found")
         
     # Security: Ensure user owns analysis or is admin
     # Optional: fetch user to check is_admin if needed, but for now strict ownership is sufficient for dashboard
-    user = db.query(models.User).filter(models.User.firebase_uid == x_user_id).first()
+    user = get_cached_user(db, x_user_id)
     is_admin = user.is_admin if user else False
     
     if analysis.user_id != x_user_id and not is_admin:
@@ -312,9 +443,10 @@ def read_analysis(analysis_id: int, x_user_id: str = Header(None), db: Session =
 
     # Map meta_data to response fields
     response = AnalysisResponse.model_validate(analysis)
-    if analysis.meta_data:
-        response.quant_engine = analysis.meta_data.get("quant")
-        response.sentiment_engine = analysis.meta_data.get("sentiment")
+    meta = response.meta_data
+    if meta:
+        response.quant_engine = meta.get("quant")
+        response.sentiment_engine = meta.get("sentiment")
 
     return response
 
@@ -336,47 +468,154 @@ def update_analysis_result(
     if analysis.user_id != x_user_id:
         raise HTTPException(status_code=403, detail="Not authorized to modify this analysis")
 
+    analytics_service.record_result_change(db, x_user_id, analysis.result, result_data.result)
     analysis.result = result_data.result
     db.commit()
     db.refresh(analysis)
+    mark_user_write(x_user_id)
     return analysis
 
 @router.get("/market-data/{symbol}")
-async def get_market_data(symbol: str, timeframe: str = "1h"):
+async def get_market_data(
+    symbol: str,
+    timeframe: str = "1h",
+    start: int = Query(None, alias="from", description="Epoch seconds, inclusive"),
+    end: int = Query(None, alias="to", description="Epoch seconds, inclusive"),
+    limit: int = Query(None, ge=1, le=MARKET_DATA_HISTORY, description="Most recent N candles of the range"),
+    points: int = Query(None, ge=2, le=MARKET_DATA_HISTORY, description="Downsample to at most N OHLC buckets"),
+    format: str = Query("rows", pattern="^(rows|columns)$"),
+):
+    """
+    Candles as [{time, open, high, low, close}] (default) or, with format=columns, as
+    parallel arrays {t, o, h, l, c}. Without from/to/limit the latest 100 candles are returned.
+    """
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
     try:
         clean_symbol = symbol.replace("-", "/")
-        quant = QuantService()
         
-        valid_timeframes = ["1m", "5m", "15m", "30m", "1h", "4h", "1d", "1w"]
-        if timeframe not in valid_timeframes:
+        if timeframe not in VALID_TIMEFRAMES:
             timeframe = "1h" 
 
-        df = await quant.fetch_ohlcv(clean_symbol, timeframe=timeframe)
-        
-        data = []
-        if not df.empty:
-            for _, row in df.iterrows():
-                data.append({
-                    "time": int(row['timestamp'].timestamp()),
-                    "open": row['open'],
-                    "high": row['high'],
-                    "low": row['low'],
-                    "close": row['close']
-                })
-                
-        return data
+        if start is None and end is None and limit is None:
+            limit = DEFAULT_CANDLES
+
+        market_data = MarketDataService()
+        df = await market_data.get_history(clean_symbol, timeframe)
+        df = market_data.downsample(market_data.select(df, start, end, limit), points)
+
+        # Plain lists of numbers: serialize directly, no jsonable_encoder pass
+        if format == "columns":
+            return FastJSONResponse(market_data.to_columns(df))
+        return FastJSONResponse(market_data.to_rows(df))
     except Exception as e:
         logger.error(f"Market Data Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/market-data/{symbol}/stream")
+async def stream_market_data(symbol: str, timeframe: str = "1h"):
+    """
+    Server-Sent Events instead of polling /market-data: a "snapshot" event (recent bars as
+    {t, o, h, l, c} plus indicators) on connect, then a "bar" event whenever the latest
+    candle changes. All viewers of a symbol/timeframe share one server-side feed.
+    """
+    clean_symbol = symbol.replace("-", "/")
+    # Every distinct symbol would start its own provider polling task
+    if clean_symbol not in FEED_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"Live feed not available for {clean_symbol}")
+    if timeframe not in VALID_TIMEFRAMES:
+        timeframe = "1h"
+
+    try:
+        subscription = await live_feed_hub.subscribe(clean_symbol, timeframe)
+    except FeedFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Live feed is at capacity. Use /market-data instead.",
+            headers={"Retry-After": "30"}
+        )
+
+    async def events():
+        while True:
+            event = await subscription.next_event(FEED_HEARTBEAT_SECONDS)
+            if event is None:
+                yield ": ping\n\n"  # Keeps proxies from closing an idle stream
+                continue
+            yield f"event: {event['type']}\ndata: {dumps(event).decode('utf-8')}\n\n"
+
+    # on_close also runs if the client is gone before the generator starts
+    return ClosingStreamingResponse(
+        events(),
+        on_close=lambda: live_feed_hub.unsubscribe(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/chat/message")
-async def chat_message(chat_data: ChatMessage, x_user_id: str = Header(None), db: Session = Depends(get_db)):
+async def chat_message(chat_data: ChatMessage, x_user_id: str = Header(None), db: AsyncSession = Depends(get_async_db)):
     if not x_user_id:
         raise HTTPException(status_code=400, detail="User ID required")
         
+    user = await get_cached_user_async(db, x_user_id)
+    tier = user.plan_tier if user else "free"
     chat_service = ChatService()
-    
-    return StreamingResponse(
-        chat_service.stream_chat_response(chat_data.message, chat_data.history),
-        media_type="text/plain"
+
+    if not chat_service.client:
+        return StreamingResponse(
+            chat_service.stream_chat_response(chat_data.message, chat_data.history),
+            media_type="text/plain"
+        )
+
+    # Only the snapshot version is needed for the cache key; the prompt is built on a miss
+    candles, snapshot_version = await chat_service.market_snapshot()
+
+    # Response Cache (skipped entirely for users who opted out)
+    cache_key = None
+    if chat_cache.enabled and not (user and user.chat_cache_opt_out):
+        cache_key = chat_cache.make_key(chat_data.message, chat_data.history, snapshot_version)
+        cached = chat_cache.get(cache_key)
+        if cached:
+            return StreamingResponse(
+                ChatService.replay(cached[0]),
+                media_type="text/plain",
+                headers={"X-Chat-Cache": "hit"}
+            )
+    else:
+        chat_cache.bypassed += 1
+
+    messages = await chat_service.build_messages(chat_data.message, chat_data.history, candles)
+
+    # Hold a DeepSeek slot for the lifetime of the stream
+    governor = get_governor("deepseek")
+    try:
+        await governor.acquire(tier)
+    except GovernorRejected as gr:
+        raise HTTPException(
+            status_code=429,
+            detail="Chat is at capacity. Please retry shortly.",
+            headers={"Retry-After": str(gr.retry_after)}
+        )
+
+    released = False
+
+    def release_slot():
+        nonlocal released
+        if not released:
+            released = True
+            governor.release()
+
+    async def governed_stream():
+        try:
+            async for chunk in chat_service.stream_completion(messages, cache_key):
+                yield chunk
+        finally:
+            release_slot()
+
+    # on_close covers a client that disconnects before the generator is first iterated
+    # (its finally never runs then); release_slot is idempotent
+    return ClosingStreamingResponse(
+        governed_stream(),
+        on_close=release_slot,
+        media_type="text/plain",
+        headers={"X-Chat-Cache": "miss" if cache_key else "bypass"}
     )
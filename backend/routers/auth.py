@@ -8,6 +8,7 @@ from dependencies import get_db
 from schemas import UserCreate, UserResponse, Token, ProfileUpdate
 from auth import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
 from limiter import limiter
+from user_cache import invalidate_user
 
 router = APIRouter(tags=["Authentication"])
 
@@ -55,6 +56,8 @@ def update_profile(profile: ProfileUpdate, x_user_id: str = Header(None), db: Se
     if profile.country is not None: user.country = profile.country
     if profile.gender is not None: user.gender = profile.gender
     if profile.age_group is not None: user.age_group = profile.age_group
+    if profile.chat_cache_opt_out is not None: user.chat_cache_opt_out = profile.chat_cache_opt_out
     
     db.commit()
+    invalidate_user(x_user_id)
     return {"status": "success", "message": "Profile updated successfully"}
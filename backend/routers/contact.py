@@ -1,6 +1,5 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-import resend
 import os
 
 router = APIRouter(prefix="/contact", tags=["Contact"])
@@ -19,6 +18,8 @@ async def send_contact_message(payload: ContactRequest):
     if not api_key:
         raise HTTPException(status_code=500, detail="Email service not configured.")
 
+    import resend  # Only this route sends mail; keeps it out of cold-start imports
+
     resend.api_key = api_key
 
     html_body = f"""
@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends, Header, HTTPException, Request
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from datetime import datetime, timedelta
 import logging
 
 import models
-from dependencies import get_db
+from dependencies import get_db, get_async_db, get_async_read_db
 from schemas import StatsResponse, PaymentInit
 from services.paystack_service import PaystackService
+from user_cache import cache_user, get_cached_user, get_cached_user_async, invalidate_user
 
 # Setup Logger
 logger = logging.getLogger(__name__)
@@ -14,8 +17,9 @@ logger = logging.getLogger(__name__)
 router = APIRouter(tags=["Users"])
 
 @router.get("/stats", response_model=StatsResponse)
-def get_stats(
-    db: Session = Depends(get_db),
+async def get_stats(
+    db: AsyncSession = Depends(get_async_db),
+    read_db: AsyncSession = Depends(get_async_read_db),
     x_user_id: str = Header(None),
     x_user_email: str = Header(None)
 ):
@@ -30,12 +34,12 @@ def get_stats(
             }
 
         # Fetch User Freshly
-        user = db.query(models.User).filter(models.User.firebase_uid == x_user_id).first()
+        user = await get_cached_user_async(db, x_user_id)
 
         # --- Eagerly provision trial user on first dashboard visit ---
         if not user and x_user_id:
             trial_expiry = datetime.utcnow() + timedelta(days=3)
-            user = models.User(
+            db_user = models.User(
                 firebase_uid=x_user_id,
                 email=x_user_email,
                 full_name=x_user_email.split('@')[0] if x_user_email else "Trader",
@@ -43,20 +47,26 @@ def get_stats(
                 credits_balance=3,
                 trial_ends_at=trial_expiry
             )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
+            db.add(db_user)
+            await db.commit()
+            await db.refresh(db_user)
+            user = cache_user(db_user)
             logger.info(f"Provisioned new trial user on stats call: {x_user_id}")
 
         tier = user.plan_tier if user else "trial"
         credits = user.credits_balance if user else 3
 
-        count = db.query(models.Analysis).filter(models.Analysis.user_id == x_user_id).count()
+        # Maintained counters: a primary-key read instead of COUNT(*) over analyses
+        counters = await read_db.get(models.UserAnalysisStats, x_user_id)
+        count = counters.total if counters else 0
 
         return {
             "total_analyses": count,
             "charts_analyzed": count,
             "ai_responses": count,
+            "wins": counters.wins if counters else 0,
+            "losses": counters.losses if counters else 0,
+            "breakevens": counters.breakevens if counters else 0,
             "credits_remaining": credits,
             "plan_tier": tier,
             "subscription_ends_at": user.subscription_ends_at if user else None,
@@ -64,7 +74,8 @@ def get_stats(
             "country": user.country if user else None,
             "gender": user.gender if user else None,
             "age_group": user.age_group if user else None,
-            "is_admin": user.is_admin if user else False
+            "is_admin": user.is_admin if user else False,
+            "chat_cache_opt_out": bool(user.chat_cache_opt_out) if user else False
         }
     except Exception as e:
         logger.error(f"Stats Error: {e}")
@@ -82,7 +93,7 @@ def initialize_payment(payment: PaymentInit, x_user_id: str = Header(None), db:
         raise HTTPException(status_code=400, detail="User ID required")
         
     # Get User
-    user = db.query(models.User).filter(models.User.firebase_uid == x_user_id).first()
+    user = get_cached_user(db, x_user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
         
@@ -106,7 +117,7 @@ def initialize_payment(payment: PaymentInit, x_user_id: str = Header(None), db:
         raise HTTPException(status_code=500, detail="Payment initialization failed")
 
 @router.post("/paystack/webhook")
-async def paystack_webhook(request: Request, db: Session = Depends(get_db)):
+async def paystack_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
     payload_bytes = await request.body()
     signature = request.headers.get('x-paystack-signature')
     
@@ -124,7 +135,9 @@ async def paystack_webhook(request: Request, db: Session = Depends(get_db)):
         plan_tier = metadata.get("plan_tier") or "active" # Default fallback
         
         if user_id:
-            user = db.query(models.User).filter(models.User.firebase_uid == user_id).first()
+            user = (await db.execute(
+                select(models.User).where(models.User.firebase_uid == user_id)
+            )).scalars().first()
             if user:
                 now = datetime.utcnow()
                 
@@ -146,7 +159,8 @@ async def paystack_webhook(request: Request, db: Session = Depends(get_db)):
                 user.plan_tier = plan_tier 
                 user.credits_balance = 999 
                 
-                db.commit()
+                await db.commit()
+                invalidate_user(user_id)
                 logger.info(f"Paystack Success: {user_id} upgraded to {plan_tier} for {days_to_add} days")
                 
     return {"status": "success"}
@@ -196,6 +210,7 @@ def verify_payment(reference: str, x_user_id: str = Header(None), db: Session =
                 user.subscription_ends_at = datetime.utcnow() + timedelta(days=duration_days)
                 
                 db.commit()
+                invalidate_user(user_id)
                 
                 # Save Payment Record
                 payment = models.Payment(
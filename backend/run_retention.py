@@ -0,0 +1,46 @@
+"""
+Archives analyses past the retention window, removes orphaned upload images,
+purges expired idempotency keys and refunds expired /analyze/reserve holds.
+Meant to run on a schedule (see the cron job in render.yaml).
+
+Usage:
+    python run_retention.py                 # ANALYSIS_RETENTION_DAYS (default 180)
+    python run_retention.py --days 90 --dry-run
+"""
+import argparse
+import asyncio
+import json
+import logging
+
+from database import SessionLocal, AsyncSessionLocal
+from database_init import init_db
+from services.quota_service import QuotaService
+from services.retention_service import RetentionService, RETENTION_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_MAX_BATCHES
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+
+async def release_reservations(dry_run: bool) -> dict:
+    async with AsyncSessionLocal() as db:
+        return await QuotaService().release_all_expired(db, dry_run=dry_run)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old analyses and GC orphaned images")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="Retention window in days")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=ARCHIVE_MAX_BATCHES)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be archived/deleted")
+    args = parser.parse_args()
+
+    init_db(raise_errors=True)
+    db = SessionLocal()
+    try:
+        report = RetentionService().run(
+            db, retention_days=args.days, batch_size=args.batch_size,
+            max_batches=args.max_batches, dry_run=args.dry_run
+        )
+        report["reservations"] = asyncio.run(release_reservations(args.dry_run))
+        print(json.dumps(report, indent=2))
+    finally:
+        db.close()
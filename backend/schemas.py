@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, computed_field
 from datetime import datetime
+from storage import variant_path
 
 # Auth & User Schemas
 class UserCreate(BaseModel):
@@ -24,6 +25,7 @@ class ProfileUpdate(BaseModel):
     country: str | None = None
     gender: str | None = None
     age_group: str | None = None
+    chat_cache_opt_out: bool | None = None
 
 class TierUpdate(BaseModel):
     tier: str
@@ -38,6 +40,9 @@ class StatsResponse(BaseModel):
     total_analyses: int
     charts_analyzed: int
     ai_responses: int
+    wins: int = 0
+    losses: int = 0
+    breakevens: int = 0
     credits_remaining: int
     plan_tier: str
     trial_ends_at: datetime | None = None
@@ -48,6 +53,7 @@ class StatsResponse(BaseModel):
     gender: str | None = None
     age_group: str | None = None
     is_admin: bool = False
+    chat_cache_opt_out: bool = False
 
 # Analysis Schemas
 class AnalysisResponse(BaseModel):
@@ -73,6 +79,37 @@ class AnalysisResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class AnalysisSummary(BaseModel):
+    """List projection of an analysis — no meta_data (loaded only when a single analysis is opened)."""
+    id: int
+    asset: str
+    bias: str
+    confidence: int
+    summary: str
+    recommendation: str | None = None
+    entry: float | None = None
+    sl: float | None = None
+    tp1: float | None = None
+    tp2: float | None = None
+    risk_reward: str | None = None
+    sentiment: str | None = None
+    image_path: str
+    result: str | None = None
+    created_at: datetime
+
+    @computed_field
+    @property
+    def thumbnail_path(self) -> str:
+        """Pre-generated thumbnail for list views (the original for legacy uploads)."""
+        return variant_path(self.image_path, "thumb")
+
+    class Config:
+        from_attributes = True
+
+class AdminAnalysisSummary(AnalysisSummary):
+    user_id: str | None = None
+    processing_time_ms: int | None = None
+
 class AnalysisUpdateResult(BaseModel):
     result: str # win, loss, breakeven
 
@@ -1,6 +1,5 @@
 import os
 import base64
-import anthropic
 import mimetypes
 from dotenv import load_dotenv
 import logging
@@ -9,7 +8,8 @@ load_dotenv()
 
 import logging
 import io
-from PIL import Image
+
+import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +17,8 @@ class AIService:
     def __init__(self):
         self.api_key = os.getenv("ANTHROPIC_API_KEY")
         if self.api_key:
+            import anthropic  # Loaded on the first analysis, not at app import
+
             self.client = anthropic.Anthropic(api_key=self.api_key)
             # List of models to try in order of preference
             self.models_to_try = [
@@ -36,6 +38,8 @@ class AIService:
         Resizes image to max_size (width or height) to optimize payload and speed.
         Returns bytes of resized image.
         """
+        from PIL import Image
+
         with Image.open(image_path) as img:
             # Convert to RGB if needed (e.g. RGBA PNGs)
             if img.mode in ("RGBA", "P"):
@@ -80,30 +84,31 @@ class AIService:
         for model in self.models_to_try:
             try:
                 logger.info(f"Attempting analysis with model: {model}")
-                response = self.client.messages.create(
-                    model=model,
-                    max_tokens=3000,
-                    system=system_prompt,
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "image",
-                                    "source": {
-                                        "type": "base64",
-                                        "media_type": mime_type,
-                                        "data": image_data,
+                with metrics.track_provider("anthropic", "messages"):
+                    response = self.client.messages.create(
+                        model=model,
+                        max_tokens=3000,
+                        system=system_prompt,
+                        messages=[
+                            {
+                                "role": "user",
+                                "content": [
+                                    {
+                                        "type": "image",
+                                        "source": {
+                                            "type": "base64",
+                                            "media_type": mime_type,
+                                            "data": image_data,
+                                        },
                                     },
-                                },
-                                {
-                                    "type": "text",
-                                    "text": f"Analyze this XAU/USD chart. Equity: ${equity}. JSON ONLY."
-                                }
-                            ],
-                        }
-                    ],
-                )
+                                    {
+                                        "type": "text",
+                                        "text": f"Analyze this XAU/USD chart. Equity: ${equity}. JSON ONLY."
+                                    }
+                                ],
+                            }
+                        ],
+                    )
                 
                 # If successful, extract and return
                 text_response = response.content[0].text
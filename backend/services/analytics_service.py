@@ -0,0 +1,186 @@
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import func, select, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+Rollup = models.AnalysisDailyRollup
+UserStats = models.UserAnalysisStats
+
+ROLLUP_COUNTERS = ["count", "latency_sum_ms", "latency_count", "confidence_sum", "confidence_count"]
+# analyses.result value -> user_analysis_stats column
+RESULT_COUNTERS = {"win": "wins", "loss": "losses", "breakeven": "breakevens"}
+
+
+def _upsert(dialect_name: str, table, keys: list[str], counters: list[str], values: dict, extra: dict = None):
+    """INSERT ... ON CONFLICT (keys) DO UPDATE adding `values` onto the existing counters."""
+    insert = pg_insert if dialect_name == "postgresql" else sqlite_insert
+    stmt = insert(table).values(**values)
+    set_ = {c: getattr(table.c, c) + getattr(stmt.excluded, c) for c in counters}
+    set_.update(extra or {})
+    return stmt.on_conflict_do_update(index_elements=keys, set_=set_)
+
+
+def _rollup_upsert(dialect_name: str, values: dict):
+    return _upsert(dialect_name, Rollup.__table__, ["day", "asset", "plan_tier"], ROLLUP_COUNTERS, values)
+
+
+def _user_stats_upsert(dialect_name: str, user_id: str, total: int = 0, **results):
+    values = {"user_id": user_id, "total": total, "wins": 0, "losses": 0, "breakevens": 0, "updated_at": datetime.utcnow()}
+    values.update(results)
+    return _upsert(
+        dialect_name, UserStats.__table__, ["user_id"], ["total", "wins", "losses", "breakevens"], values,
+        extra={"updated_at": values["updated_at"]},
+    )
+
+
+def _rollup_values(day: date, asset: str, plan_tier: str, latency_ms, confidence) -> dict:
+    return {
+        "day": day,
+        "asset": asset or "Unknown",
+        "plan_tier": plan_tier or "unknown",
+        "count": 1,
+        "latency_sum_ms": latency_ms or 0,
+        "latency_count": 1 if latency_ms is not None else 0,
+        "confidence_sum": confidence or 0,
+        "confidence_count": 1 if confidence is not None else 0,
+    }
+
+
+class AnalyticsService:
+    """
+    Maintains analysis_daily_rollups and user_analysis_stats. The record_* methods run
+    inside the caller's transaction so counters commit (or roll back) with the analysis row.
+    """
+
+    async def record_analysis(self, db, analysis: models.Analysis, plan_tier: str):
+        created = analysis.created_at or datetime.utcnow()
+        values = _rollup_values(
+            created.date(), analysis.asset, plan_tier, analysis.processing_time_ms, analysis.confidence
+        )
+        dialect = db.get_bind().dialect.name
+        await db.execute(_rollup_upsert(dialect, values))
+        await db.execute(_user_stats_upsert(dialect, analysis.user_id, total=1))
+
+    def record_result_change(self, db: Session, user_id: str, old_result: str | None, new_result: str | None):
+        """Moves one analysis between the win/loss/breakeven counters (no-op for unknown values)."""
+        deltas = {}
+        if old_result in RESULT_COUNTERS:
+            deltas[RESULT_COUNTERS[old_result]] = -1
+        if new_result in RESULT_COUNTERS:
+            col = RESULT_COUNTERS[new_result]
+            deltas[col] = deltas.get(col, 0) + 1
+        if any(deltas.values()):
+            db.execute(_user_stats_upsert(db.get_bind().dialect.name, user_id, **deltas))
+
+    def reconcile_user_stats(self, db: Session, dry_run: bool = False) -> dict:
+        """
+        Recomputes every user's counters from analyses + analyses_archive and repairs rows
+        that drifted. Returns {"checked", "repaired", "removed"}.
+        """
+        A, Arch = models.Analysis, models.AnalysisArchive
+        rows = union_all(
+            select(A.user_id, A.result),
+            select(Arch.user_id, Arch.result),
+        ).subquery()
+        expected = {}
+        for user_id, result, n in db.execute(
+            select(rows.c.user_id, rows.c.result, func.count()).group_by(rows.c.user_id, rows.c.result)
+        ):
+            if user_id is None:
+                continue
+            counts = expected.setdefault(user_id, {"total": 0, "wins": 0, "losses": 0, "breakevens": 0})
+            counts["total"] += n
+            if result in RESULT_COUNTERS:
+                counts[RESULT_COUNTERS[result]] += n
+
+        report = {"checked": 0, "repaired": 0, "removed": 0}
+        current = {s.user_id: s for s in db.query(UserStats).all()}
+        for user_id, counts in expected.items():
+            report["checked"] += 1
+            stats = current.pop(user_id, None)
+            if stats and all(getattr(stats, k) == v for k, v in counts.items()):
+                continue
+            report["repaired"] += 1
+            logger.warning(f"User stats drift for {user_id}: {stats and {k: getattr(stats, k) for k in counts}} -> {counts}")
+            if not dry_run:
+                if stats is None:
+                    db.add(UserStats(user_id=user_id, **counts))
+                else:
+                    for k, v in counts.items():
+                        setattr(stats, k, v)
+                    stats.updated_at = datetime.utcnow()
+        for stats in current.values():  # Counters for users with no analyses left
+            if stats.total or stats.wins or stats.losses or stats.breakevens:
+                report["removed"] += 1
+                if not dry_run:
+                    db.delete(stats)
+
+        if not dry_run:
+            db.commit()
+        return report
+
+    def backfill(self, db: Session, since: date = None) -> int:
+        """
+        Rebuilds rollup rows from analyses + analyses_archive (from `since`, or everything),
+        so days past the retention window are recomputed rather than lost.
+        Tier is taken from the user's current plan since analyses don't record it.
+        Returns the number of rollup rows written.
+        """
+        A, Arch = models.Analysis, models.AnalysisArchive
+        parts = [
+            select(table.created_at, table.asset, table.user_id, table.processing_time_ms, table.confidence)
+            for table in (A, Arch)
+        ]
+        if since:
+            since_start = datetime.combine(since, datetime.min.time())
+            parts = [part.where(table.created_at >= since_start) for part, table in zip(parts, (A, Arch))]
+        rows = union_all(*parts).subquery()
+
+        day_expr = func.date(rows.c.created_at)
+        query = db.query(
+            day_expr,
+            rows.c.asset,
+            models.User.plan_tier,
+            func.count(),
+            func.coalesce(func.sum(rows.c.processing_time_ms), 0),
+            func.count(rows.c.processing_time_ms),
+            func.coalesce(func.sum(rows.c.confidence), 0),
+            func.count(rows.c.confidence),
+        ).select_from(rows).outerjoin(
+            models.User, models.User.firebase_uid == rows.c.user_id
+        ).group_by(day_expr, rows.c.asset, models.User.plan_tier)
+
+        delete_query = db.query(Rollup)
+        if since:
+            delete_query = delete_query.filter(Rollup.day >= since)
+
+        rows = query.all()
+        delete_query.delete(synchronize_session=False)
+
+        merged = {}
+        for day, asset, tier, n, lat_sum, lat_n, conf_sum, conf_n in rows:
+            if isinstance(day, str):  # SQLite returns DATE() as text
+                day = date.fromisoformat(day)
+            key = (day, asset or "Unknown", tier or "unknown")
+            acc = merged.setdefault(key, [0, 0, 0, 0, 0])
+            for i, v in enumerate((n, lat_sum, lat_n, conf_sum, conf_n)):
+                acc[i] += int(v or 0)
+
+        db.add_all([
+            Rollup(
+                day=day, asset=asset, plan_tier=tier, count=acc[0],
+                latency_sum_ms=acc[1], latency_count=acc[2],
+                confidence_sum=acc[3], confidence_count=acc[4],
+            )
+            for (day, asset, tier), acc in merged.items()
+        ])
+        db.commit()
+        logger.info(f"Rollup backfill wrote {len(merged)} rows from {sum(a[0] for a in merged.values())} analyses")
+        return len(merged)
@@ -0,0 +1,72 @@
+import os
+import re
+import json
+import hashlib
+import logging
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# How many trailing history messages are sent to the model (and therefore part of the key)
+CHAT_HISTORY_LIMIT = 10
+
+_PUNCT_RE = re.compile(r"[^\w\s/]")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    Lowercase, drop punctuation and collapse whitespace so that
+    "What's the gold bias now?" and "whats the gold bias now" share a key.
+    """
+    text = _PUNCT_RE.sub("", (text or "").lower())
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+class ChatResponseCache:
+    """
+    Caches complete DeepSeek answers keyed by (normalized prompt, truncated history,
+    market snapshot version). A new candle bumps the snapshot version, so cached
+    answers never outlive the market data they were generated from.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("CHAT_CACHE_ENABLED", "true").lower() == "true"
+        self.store = TTLCache(
+            maxsize=int(os.getenv("CHAT_CACHE_MAX_ENTRIES", 512)),
+            ttl=float(os.getenv("CHAT_CACHE_TTL", 1800)),
+        )
+        self.tokens_saved = 0
+        self.bypassed = 0
+
+    def make_key(self, message: str, history: list, snapshot_version: str) -> str:
+        trimmed = [
+            {"role": m.get("role"), "content": normalize_prompt(m.get("content", ""))}
+            for m in (history or [])[-CHAT_HISTORY_LIMIT:]
+        ]
+        raw = json.dumps([normalize_prompt(message), trimmed, snapshot_version], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Returns the cached (text, tokens) tuple or None."""
+        entry = self.store.get(key)
+        if entry is not None:
+            self.tokens_saved += entry[1]
+        return entry
+
+    def put(self, key: str, text: str, tokens: int):
+        if text:
+            self.store.set(key, (text, tokens))
+
+    def stats(self) -> dict:
+        stats = self.store.stats()
+        stats.update({
+            "enabled": self.enabled,
+            "tokens_saved": self.tokens_saved,
+            "bypassed": self.bypassed,
+        })
+        return stats
+
+
+chat_cache = ChatResponseCache()
@@ -1,18 +1,27 @@
+import asyncio
 import os
 import logging
 from typing import AsyncGenerator
-from openai import AsyncOpenAI
 
-from services.quant_service import QuantService
+from services.market_data_service import MarketDataService
+from services.chat_cache import chat_cache, CHAT_HISTORY_LIMIT
+import metrics
 
 logger = logging.getLogger(__name__)
 
+CHAT_SYMBOL = "XAU/USD"
+CHAT_TIMEFRAME = "1h"
+# Most recent candles the prompt's indicators are computed from
+CHAT_CONTEXT_CANDLES = 100
+
 class ChatService:
     def __init__(self):
         self.api_key = os.getenv("DEEPSEEK_API_KEY")
         self.client = None
-        self.quant = QuantService()
+        self.market_data = MarketDataService()
         if self.api_key:
+            from openai import AsyncOpenAI  # Loaded on the first chat, not at app import
+
             self.client = AsyncOpenAI(
                 api_key=self.api_key,
                 base_url="https://api.deepseek.com"
@@ -20,20 +29,35 @@ class ChatService:
         else:
             logger.warning("DEEPSEEK_API_KEY is not set. Chat will not work.")
 
-    async def stream_chat_response(self, message: str, history: list) -> AsyncGenerator[str, None]:
+    async def market_snapshot(self):
         """
-        Streams chat response from Deepseek API with live market context.
+        (candles, snapshot_version) for the chat context, from the TTL-cached history that
+        /market-data shares, so a chat cache hit costs no provider round-trip.
+        snapshot_version identifies the latest candle (part of the chat cache key).
         """
-        if not self.client:
-            yield "⚠️ Error: Deepseek API Key is missing. Please configure the backend."
-            return
+        try:
+            df = await self.market_data.get_history(CHAT_SYMBOL, CHAT_TIMEFRAME)
+        except Exception as e:
+            logger.error(f"Failed to fetch market context for chat: {e}")
+            return None, "none"
+        if df.empty:
+            return df, "none"
+        return df, str(int(df["time"].iloc[-1]))
 
-        # 1. Fetch Live Market Context
+    async def build_messages(self, message: str, history: list, candles=None) -> list:
+        """
+        Builds the DeepSeek prompt with live market context from market_snapshot()'s candles.
+        """
         market_context_str = ""
         try:
-            df = await self.quant.fetch_ohlcv("XAU/USD", timeframe="1h", limit=100)
-            analysis = self.quant.analyze_market_structure(df)
-            
+            if candles is not None and not candles.empty:
+                # Copy: the indicators are added as columns and the cached frame is shared
+                analysis = await asyncio.to_thread(
+                    self.market_data.quant.analyze_market_structure, candles.tail(CHAT_CONTEXT_CANDLES).copy()
+                )
+            else:
+                analysis = {}
+
             if "current_price" in analysis:
                 market_context_str = (
                     f"Live Market Data (XAU/USD 1H):\n"
@@ -49,7 +73,7 @@ class ChatService:
                         f"- AI Levels: Entry {levels['entry']:.2f}, SL {levels['sl']:.2f}, TP {levels['tp']:.2f}\n"
                     )
         except Exception as e:
-            logger.error(f"Failed to fetch market context for chat: {e}")
+            logger.error(f"Failed to build market context for chat: {e}")
 
         # Prepare messages
         system_prompt = (
@@ -67,24 +91,71 @@ class ChatService:
         ]
         
         # Add history (limit to last 10 messages to save context)
-        for msg in history[-10:]:
+        for msg in history[-CHAT_HISTORY_LIMIT:]:
             messages.append({"role": msg["role"], "content": msg["content"]})
             
         # Add current message
         messages.append({"role": "user", "content": message})
 
-        try:
-            stream = await self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=messages,
-                stream=True,
-                temperature=0.7
-            )
+        return messages
+
+    async def stream_completion(self, messages: list, cache_key: str = None) -> AsyncGenerator[str, None]:
+        """
+        Streams the DeepSeek completion. When cache_key is given, the full answer
+        is stored in the chat cache once the stream finishes cleanly.
+        """
+        if not self.client:
+            yield "⚠️ Error: Deepseek API Key is missing. Please configure the backend."
+            return
+
+        parts = []
+        total_tokens = 0
+        # Covers the whole stream (time to last token)
+        with metrics.track_provider("deepseek", "chat") as call:
+            try:
+                stream = await self.client.chat.completions.create(
+                    model="deepseek-chat",
+                    messages=messages,
+                    stream=True,
+                    temperature=0.7,
+                    stream_options={"include_usage": True}
+                )
 
-            async for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
+                async for chunk in stream:
+                    if chunk.usage:
+                        total_tokens = chunk.usage.total_tokens or 0
+                    if chunk.choices and chunk.choices[0].delta.content is not None:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
 
-        except Exception as e:
-            logger.error(f"Deepseek API Error: {e}")
-            yield f"⚠️ API Error: {str(e)}"
+            except Exception as e:
+                call.error = True
+                logger.error(f"Deepseek API Error: {e}")
+                yield f"⚠️ API Error: {str(e)}"
+                return
+
+        if cache_key:
+            text = "".join(parts)
+            # Rough 4-chars-per-token estimate if the provider didn't report usage
+            chat_cache.put(cache_key, text, total_tokens or len(text) // 4)
+
+    async def stream_chat_response(self, message: str, history: list) -> AsyncGenerator[str, None]:
+        """
+        Streams chat response from Deepseek API with live market context.
+        """
+        if not self.client:
+            yield "⚠️ Error: Deepseek API Key is missing. Please configure the backend."
+            return
+
+        candles, _ = await self.market_snapshot()
+        messages = await self.build_messages(message, history, candles)
+        async for chunk in self.stream_completion(messages):
+            yield chunk
+
+    @staticmethod
+    async def replay(text: str, chunk_size: int = 64) -> AsyncGenerator[str, None]:
+        """
+        Replays a cached answer as a stream so the client renders it like a live one.
+        """
+        for i in range(0, len(text), chunk_size):
+            yield text[i:i + chunk_size]
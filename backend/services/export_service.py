@@ -0,0 +1,248 @@
+import csv
+import importlib.util
+import io
+import json
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, time
+
+from sqlalchemy import literal, select, union_all
+
+import meta_codec
+import models
+from database import ReadSessionLocal
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 1000
+
+# Column order for every export format; meta_data is appended (raw or flattened) after these
+EXPORT_COLUMNS = [
+    "id", "user_id", "asset", "bias", "confidence", "summary", "recommendation", "result",
+    "entry", "sl", "tp1", "tp2", "risk_reward", "sentiment", "processing_time_ms",
+    "image_path", "created_at",
+]
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+@dataclass
+class ExportFilters:
+    start: date | None = None
+    end: date | None = None  # inclusive
+    user_id: str | None = None
+    asset: str | None = None
+    result: str | None = None
+
+
+def parquet_available() -> bool:
+    # In requirements.txt but imported lazily; looked up without importing it so images
+    # built without it answer 501 instead of failing mid-stream
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def flatten_meta(meta, prefix: str = "meta") -> dict:
+    """{"quant": {"rsi": 40}} -> {"meta.quant.rsi": 40}; lists are kept as JSON strings."""
+    flat = {}
+    if isinstance(meta, dict):
+        for key, value in meta.items():
+            flat.update(flatten_meta(value, f"{prefix}.{key}"))
+    elif isinstance(meta, list):
+        flat[prefix] = json.dumps(meta, default=str)
+    else:
+        flat[prefix] = meta
+    return flat
+
+
+def _filtered(query, table, filters: ExportFilters):
+    if filters.start:
+        query = query.where(table.created_at >= datetime.combine(filters.start, time.min))
+    if filters.end:
+        query = query.where(table.created_at <= datetime.combine(filters.end, time.max))
+    if filters.user_id:
+        query = query.where(table.user_id == filters.user_id)
+    if filters.asset:
+        query = query.where(table.asset == filters.asset)
+    if filters.result:
+        query = query.where(table.result == filters.result)
+    return query
+
+
+def _build_query(filters: ExportFilters):
+    """
+    Hot and archived analyses in id order. Archived rows keep their original id and
+    only ever have meta_data packed, so their meta_json column is always NULL.
+    """
+    A, Arch = models.Analysis, models.AnalysisArchive
+    rows = union_all(
+        _filtered(select(*[getattr(A, c) for c in EXPORT_COLUMNS], A.meta_json, A.meta_packed), A, filters),
+        _filtered(
+            select(
+                *[getattr(Arch, c) for c in EXPORT_COLUMNS],
+                literal(None, A.meta_json.type).label("meta_json"),
+                Arch.meta_compressed.label("meta_packed"),
+            ),
+            Arch, filters,
+        ),
+    ).subquery()
+    return select(rows).order_by(rows.c.id)
+
+
+def iter_rows(filters: ExportFilters, flatten: bool = False):
+    """
+    Yields one dict per analysis (archived ones included) using a server-side cursor, so memory stays flat
+    regardless of how many rows match. Opens its own session because the generator
+    outlives the request's dependency-injected one. Reads from the replica when configured.
+    """
+    db = ReadSessionLocal()
+    try:
+        result = db.execute(
+            _build_query(filters).execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+        )
+        for row in result:
+            record = dict(zip(EXPORT_COLUMNS, row[:-2]))
+            meta = meta_codec.decode(row[-1]) if row[-1] is not None else row[-2]
+            if flatten:
+                record.update(flatten_meta(meta or {}))
+            else:
+                record["meta_data"] = meta
+            yield record
+    finally:
+        db.close()
+
+
+def _scalar(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+def _batches(rows, size: int = EXPORT_BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _columns_for(first_batch: list[dict]) -> list[str]:
+    """
+    CSV and Parquet need a fixed header, so it is taken from the first batch.
+    Flattened meta keys that only appear later are dropped (NDJSON keeps everything).
+    """
+    columns = list(EXPORT_COLUMNS)
+    for record in first_batch:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+    return columns
+
+
+def stream_ndjson(rows):
+    for batch in _batches(rows):
+        yield "".join(json.dumps(r, default=str) + "\n" for r in batch).encode("utf-8")
+
+
+def stream_csv(rows):
+    batches = _batches(rows)
+    first = next(batches, [])
+    columns = _columns_for(first)
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for batch in _chain(first, batches):
+        writer.writerows({k: _scalar(v) for k, v in r.items()} for r in batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if not first:
+        yield buffer.getvalue().encode("utf-8")
+
+
+def stream_parquet(rows):
+    """
+    One row group per batch; only the writer's current row group is held in memory.
+    Flattened meta values are written as strings to keep the schema stable across batches.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:  # Routes check parquet_available() first
+        raise RuntimeError("pyarrow is not installed; Parquet export is unavailable")
+
+    batches = _batches(rows)
+    first = next(batches, [])
+    columns = _columns_for(first)
+    base = {
+        "id": pa.int64(), "confidence": pa.int64(), "processing_time_ms": pa.int64(),
+        "entry": pa.float64(), "sl": pa.float64(), "tp1": pa.float64(), "tp2": pa.float64(),
+        "created_at": pa.timestamp("us"),
+    }
+    schema = pa.schema([(c, base.get(c, pa.string())) for c in columns])
+
+    def to_table(batch):
+        data = {}
+        for c in columns:
+            values = [r.get(c) for r in batch]
+            if c not in base:
+                values = [None if v is None else str(_scalar(v)) for v in values]
+            data[c] = values
+        return pa.Table.from_pydict(data, schema=schema)
+
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for batch in _chain(first, batches):
+            writer.write_table(to_table(batch))
+            yield sink.drain()
+    yield sink.drain()  # footer
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain() while keeping tell() absolute."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _chain(first, rest):
+    if first:
+        yield first
+    yield from rest
+
+
+def export_analyses(filters: ExportFilters, fmt: str = "ndjson", flatten: bool = False):
+    """Returns a generator of encoded chunks for the requested format."""
+    rows = iter_rows(filters, flatten=flatten)
+    if fmt == "csv":
+        return stream_csv(rows)
+    if fmt == "parquet":
+        return stream_parquet(rows)
+    return stream_ndjson(rows)
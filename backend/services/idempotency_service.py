@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# How long a finished request can be replayed (client retry window)
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400))
+# A pending key older than this is treated as abandoned (worker died mid-request) and taken over
+IDEMPOTENCY_PENDING_TIMEOUT = int(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT", 300))
+# Retry-After sent when the original request is still running on another worker
+IDEMPOTENCY_RETRY_AFTER = 5
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    """The key can't be used for this request right now; status_code/detail are user-facing."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int | None = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    status_code: int
+    body: str  # JSON
+
+
+def request_fingerprint(*parts) -> str:
+    """Identifies the request a key was first used with (upload digest + form fields)."""
+    return hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def _settle(future: asyncio.Future, result=None, exc: BaseException = None):
+    if future.done():
+        return
+    if exc is None:
+        future.set_result(result)
+    elif not isinstance(exc, Exception):
+        future.cancel()  # e.g. the owning request was cancelled
+    else:
+        future.set_exception(exc)
+        future.exception()  # Retrieved here so an unwatched future doesn't log a warning
+
+
+class IdempotencyService:
+    """
+    Idempotency-Key handling for /analyze. The first request with a key inserts a pending
+    row and runs; retries on the same worker await its in-flight future, retries anywhere
+    else replay the stored response once it completes. Failed requests release the key
+    so the next retry runs again (their quota was refunded).
+    """
+
+    def __init__(self):
+        self._inflight: dict[tuple[str, str], tuple[str, asyncio.Future]] = {}
+        self._counts = Counter()
+
+    async def begin(self, db: AsyncSession, user_id: str, key: str, fingerprint: str) -> StoredResponse | None:
+        """
+        None if the caller owns the key and must finish with complete() or release().
+        Otherwise the response to replay; raises IdempotencyConflict for reused or busy keys.
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyConflict(400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters.")
+
+        slot = (user_id, key)
+        entry = self._inflight.get(slot)
+        if entry is not None:
+            running_fingerprint, future = entry
+            self._check_fingerprint(running_fingerprint, fingerprint)
+            self._counts["joined_inflight"] += 1
+            logger.info(f"Idempotency-Key retry joined the in-flight request for {user_id}")
+            return await asyncio.shield(future)
+
+        # Registered before the first await so concurrent duplicates on this worker join it
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[slot] = (fingerprint, future)
+        try:
+            stored = await self._acquire(db, user_id, key, fingerprint)
+        except BaseException as e:
+            self._inflight.pop(slot, None)
+            _settle(future, exc=e)
+            raise
+        if stored is not None:
+            self._inflight.pop(slot, None)
+            _settle(future, stored)
+        return stored
+
+    async def complete(self, db: AsyncSession, user_id: str, key: str, response: StoredResponse):
+        """Stores the response for replay and wakes in-flight duplicates."""
+        K = models.IdempotencyKey
+        try:
+            await db.execute(
+                update(K)
+                .where(K.user_id == user_id, K.key == key, K.status == "pending")
+                .values(status="completed", status_code=response.status_code, response_body=response.body)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            self._counts["completed"] += 1
+        except Exception as e:
+            # The analysis itself succeeded; a retry will just run again
+            logger.error(f"Could not store idempotent response for {user_id}: {e}")
+        finally:
+            self._finish(user_id, key, response)
+
+    async def release(self, db: AsyncSession, user_id: str, key: str, response: StoredResponse):
+        """
+        Frees the key after a failed request. In-flight duplicates get the same error;
+        later retries run again.
+        """
+        self._finish(user_id, key, response)
+        K = models.IdempotencyKey
+        try:
+            await db.rollback()
+            await db.execute(delete(K).where(K.user_id == user_id, K.key == key, K.status == "pending"))
+            await db.commit()
+            self._counts["released"] += 1
+        except Exception as e:
+            # Left pending; taken over after IDEMPOTENCY_PENDING_TIMEOUT
+            logger.error(f"Could not release Idempotency-Key for {user_id}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "started": self._counts["started"],
+            "completed": self._counts["completed"],
+            "released": self._counts["released"],
+            "replayed_stored": self._counts["replayed_stored"],
+            "joined_inflight": self._counts["joined_inflight"],
+            "deduplicated": self._counts["replayed_stored"] + self._counts["joined_inflight"],
+            "conflicts": self._counts["conflicts"],
+            "fingerprint_mismatches": self._counts["fingerprint_mismatches"],
+            "takeovers": self._counts["takeovers"],
+            "ttl_s": IDEMPOTENCY_TTL_SECONDS,
+        }
+
+    def _finish(self, user_id: str, key: str, response: StoredResponse):
+        entry = self._inflight.pop((user_id, key), None)
+        if entry is not None:
+            _settle(entry[1], response)
+
+    def _check_fingerprint(self, stored: str, fingerprint: str):
+        if stored != fingerprint:
+            self._counts["fingerprint_mismatches"] += 1
+            raise IdempotencyConflict(422, "Idempotency-Key was already used for a different request.")
+
+    async def _acquire(self, db: AsyncSession, user_id: str, key: str, fingerprint: str) -> StoredResponse | None:
+        K = models.IdempotencyKey
+        now = datetime.utcnow()
+        values = {
+            "user_id": user_id, "key": key, "fingerprint": fingerprint, "status": "pending",
+            "status_code": None, "response_body": None,
+            "created_at": now, "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        }
+
+        insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        inserted = (await db.execute(
+            insert(K).values(**values).on_conflict_do_nothing(index_elements=["user_id", "key"]).returning(K.key)
+        )).first()
+        await db.commit()
+        if inserted:
+            self._counts["started"] += 1
+            return None
+
+        row = (await db.execute(
+            select(K.fingerprint, K.status, K.status_code, K.response_body, K.created_at, K.expires_at)
+            .where(K.user_id == user_id, K.key == key)
+        )).first()
+        if row is None:
+            # Released between our insert and select; let the client retry
+            raise IdempotencyConflict(409, "Request with this Idempotency-Key is being retried.", IDEMPOTENCY_RETRY_AFTER)
+
+        abandoned = row.status == "pending" and row.created_at < now - timedelta(seconds=IDEMPOTENCY_PENDING_TIMEOUT)
+        if row.expires_at <= now or abandoned:
+            # Conditional on the row we read, so only one of several racing retries takes it over
+            taken = (await db.execute(
+                update(K)
+                .where(K.user_id == user_id, K.key == key, K.status == row.status, K.created_at == row.created_at)
+                .values(**values)
+                .returning(K.key)
+                .execution_options(synchronize_session=False)
+            )).first()
+            await db.commit()
+            if taken:
+                self._counts["takeovers" if abandoned else "started"] += 1
+                return None
+            raise IdempotencyConflict(409, "Request with this Idempotency-Key is being retried.", IDEMPOTENCY_RETRY_AFTER)
+
+        self._check_fingerprint(row.fingerprint, fingerprint)
+        if row.status == "completed":
+            self._counts["replayed_stored"] += 1
+            logger.info(f"Idempotency-Key replay for {user_id}")
+            return StoredResponse(row.status_code, row.response_body)
+
+        self._counts["conflicts"] += 1
+        raise IdempotencyConflict(
+            409, "A request with this Idempotency-Key is still being processed.", IDEMPOTENCY_RETRY_AFTER
+        )
+
+
+idempotency_service = IdempotencyService()
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import os
+
+from services.market_data_service import MarketDataService
+
+logger = logging.getLogger(__name__)
+
+# Fixed poll interval for every feed; unset, it is derived from the timeframe (see poll_interval)
+FEED_POLL_SECONDS = float(os.getenv("FEED_POLL_SECONDS")) if os.getenv("FEED_POLL_SECONDS") else None
+# Derived cadence: FEED_POLLS_PER_BAR provider reads per candle, clamped to [min, max] seconds
+FEED_POLLS_PER_BAR = int(os.getenv("FEED_POLLS_PER_BAR", 12))
+FEED_POLL_MIN_SECONDS = float(os.getenv("FEED_POLL_MIN_SECONDS", 5))
+FEED_POLL_MAX_SECONDS = float(os.getenv("FEED_POLL_MAX_SECONDS", 30))
+# Events buffered per subscriber before it is treated as slow and resynced
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", 16))
+FEED_MAX_SUBSCRIBERS = int(os.getenv("FEED_MAX_SUBSCRIBERS", 500))
+# Each feed polls a provider on its own, so both the symbols and the number of feeds are bounded
+FEED_SYMBOLS = {s.strip() for s in os.getenv("FEED_SYMBOLS", "XAU/USD").split(",") if s.strip()}
+FEED_MAX_FEEDS = int(os.getenv("FEED_MAX_FEEDS", 8))
+
+TIMEFRAME_SECONDS = {
+    "1m": 60, "5m": 300, "15m": 900, "30m": 1800,
+    "1h": 3600, "4h": 14400, "1d": 86400, "1w": 604800,
+}
+# Candles included in the snapshot a subscriber starts (or resyncs) from
+SNAPSHOT_CANDLES = 100
+
+
+class FeedFull(Exception):
+    """Raised when this worker already serves FEED_MAX_SUBSCRIBERS connections or FEED_MAX_FEEDS feeds."""
+
+
+def poll_interval(timeframe: str) -> float:
+    """Seconds between provider reads: a new candle reaches subscribers within one interval."""
+    if FEED_POLL_SECONDS is not None:
+        return FEED_POLL_SECONDS
+    bar_seconds = TIMEFRAME_SECONDS.get(timeframe, 3600)
+    return min(FEED_POLL_MAX_SECONDS, max(FEED_POLL_MIN_SECONDS, bar_seconds / FEED_POLLS_PER_BAR))
+
+
+class Subscription:
+    def __init__(self, feed: "MarketFeed"):
+        self.feed = feed
+        self.queue = asyncio.Queue(maxsize=FEED_QUEUE_SIZE)
+        self.resyncs = 0
+
+    def offer(self, event: dict):
+        """
+        Non-blocking delivery. A subscriber that fell FEED_QUEUE_SIZE events behind has
+        its backlog replaced by one fresh snapshot: it catches up in a single message and
+        the feed never waits on a slow client.
+        """
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.resyncs += 1
+            self.feed.resyncs += 1
+            self.queue.put_nowait(self.feed.snapshot_event())
+
+    async def next_event(self, timeout: float) -> dict | None:
+        """Next event, or None if nothing arrived within `timeout` (caller sends a heartbeat)."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class MarketFeed:
+    """
+    One polling task per (symbol, timeframe), shared by every subscriber: provider load
+    depends on the number of distinct charts, not on the number of open dashboards.
+    Publishes a "bar" event when the latest candle changes (new bar or live update of the
+    current one) with the current analyze_market_structure() indicators.
+    """
+
+    def __init__(self, symbol: str, timeframe: str, market_data: MarketDataService):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.market_data = market_data
+        self.subscribers: set[Subscription] = set()
+        self.task: asyncio.Task | None = None
+        self.ready = asyncio.Event()
+        self.history = None
+        self.indicators = {}
+        self.last_bar = None
+        self.published = 0
+        self.resyncs = 0
+
+    def snapshot_event(self) -> dict:
+        recent = self.market_data.select(self.history, limit=SNAPSHOT_CANDLES) if self.history is not None else None
+        return {
+            "type": "snapshot",
+            "symbol": self.symbol,
+            "timeframe": self.timeframe,
+            "bars": self.market_data.to_columns(recent) if recent is not None else {"t": [], "o": [], "h": [], "l": [], "c": []},
+            "indicators": self.indicators,
+        }
+
+    async def refresh(self) -> bool:
+        """Re-reads history from the provider (not the /market-data cache); True if the latest bar changed."""
+        df = await self.market_data.get_history(self.symbol, self.timeframe, refresh=True)
+        if df.empty:
+            return False
+        if df.attrs.get("mock") and self.history is not None:
+            # Providers down: keep the last state rather than streaming random fallback bars
+            return False
+        bar = self.market_data.to_rows(df.iloc[-1:])[0]
+        if bar == self.last_bar and self.history is not None:
+            return False
+        # calculate_indicators adds columns in place; the cached history is shared, so copy
+        self.indicators = await asyncio.to_thread(self.market_data.quant.analyze_market_structure, df.copy())
+        self.history = df
+        self.last_bar = bar
+        return True
+
+    async def run(self):
+        while True:
+            try:
+                started = self.ready.is_set()  # The first read is delivered as the snapshot instead
+                changed = await self.refresh()
+                self.ready.set()
+                if changed and started:
+                    self.publish({
+                        "type": "bar", "symbol": self.symbol, "timeframe": self.timeframe,
+                        "bar": self.last_bar, "indicators": self.indicators,
+                    })
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Live feed {self.symbol} {self.timeframe} refresh failed: {e}")
+                self.ready.set()  # Subscribers get an empty snapshot rather than hanging
+            await asyncio.sleep(poll_interval(self.timeframe))
+
+    def publish(self, event: dict):
+        self.published += 1
+        for subscription in list(self.subscribers):
+            subscription.offer(event)
+
+    def stats(self) -> dict:
+        return {
+            "symbol": self.symbol,
+            "timeframe": self.timeframe,
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "resyncs": self.resyncs,
+            "poll_seconds": poll_interval(self.timeframe),
+            "last_bar_time": self.last_bar["time"] if self.last_bar else None,
+        }
+
+
+class LiveFeedHub:
+    def __init__(self):
+        self._feeds: dict[tuple[str, str], MarketFeed] = {}
+        self.market_data = MarketDataService()
+
+    def subscriber_count(self) -> int:
+        return sum(len(feed.subscribers) for feed in self._feeds.values())
+
+    async def subscribe(self, symbol: str, timeframe: str) -> Subscription:
+        """Joins (or starts) the feed; the first queued event is the current snapshot."""
+        if self.subscriber_count() >= FEED_MAX_SUBSCRIBERS:
+            raise FeedFull()
+        key = (symbol, timeframe)
+        feed = self._feeds.get(key)
+        if feed is None:
+            if len(self._feeds) >= FEED_MAX_FEEDS:
+                raise FeedFull()
+            feed = self._feeds[key] = MarketFeed(symbol, timeframe, self.market_data)
+            feed.task = asyncio.create_task(feed.run())
+            logger.info(f"Live feed started: {symbol} {timeframe}")
+        subscription = Subscription(feed)
+        feed.subscribers.add(subscription)
+        try:
+            await feed.ready.wait()
+        except BaseException:
+            self.unsubscribe(subscription)
+            raise
+        subscription.offer(feed.snapshot_event())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        feed = subscription.feed
+        feed.subscribers.discard(subscription)
+        if not feed.subscribers and self._feeds.get((feed.symbol, feed.timeframe)) is feed:
+            # Last viewer gone: stop polling (the history cache keeps a quick restart cheap)
+            del self._feeds[(feed.symbol, feed.timeframe)]
+            feed.task.cancel()
+            logger.info(f"Live feed stopped: {feed.symbol} {feed.timeframe}")
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": self.subscriber_count(),
+            "max_subscribers": FEED_MAX_SUBSCRIBERS,
+            "max_feeds": FEED_MAX_FEEDS,
+            "feeds": [feed.stats() for feed in self._feeds.values()],
+        }
+
+
+live_feed_hub = LiveFeedHub()
@@ -0,0 +1,223 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# Admission priority per plan tier (lower = admitted first under contention).
+# Paying tiers jump the queue; trial/free traffic waits behind them.
+DEFAULT_TIER_PRIORITY = {
+    "yearly": 0,
+    "advanced": 0,
+    "active": 1,
+    "pro": 1,
+    "monthly": 1,
+    "starter": 1,
+    "trial": 2,
+    "free": 3,
+}
+
+# Max seconds a request of a given priority may wait in the queue before we give up.
+DEFAULT_TIER_MAX_WAIT = {
+    0: 30.0,
+    1: 20.0,
+    2: 10.0,
+    3: 5.0,
+}
+
+
+def _parse_map(raw: str | None, key_type, value_type) -> dict:
+    """Parses "yearly=0,trial=2" into {"yearly": 0, "trial": 2}; empty or unset gives {}."""
+    result = {}
+    for item in (raw or "").split(","):
+        if item.strip():
+            key, _, value = item.partition("=")
+            result[key_type(key.strip())] = value_type(value.strip())
+    return result
+
+
+# Overrides for every provider, merged over the defaults, e.g.
+# LLM_TIER_PRIORITY="trial=3,starter=0" and LLM_TIER_MAX_WAIT="0=45,3=2"
+TIER_PRIORITY = {**DEFAULT_TIER_PRIORITY, **_parse_map(os.getenv("LLM_TIER_PRIORITY"), str, int)}
+TIER_MAX_WAIT = {**DEFAULT_TIER_MAX_WAIT, **_parse_map(os.getenv("LLM_TIER_MAX_WAIT"), int, float)}
+
+
+class GovernorRejected(Exception):
+    """Raised when a request cannot be admitted (queue full or deadline passed)."""
+
+    def __init__(self, provider: str, reason: str, retry_after: int = 5):
+        super().__init__(f"{provider} is busy ({reason})")
+        self.provider = provider
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ProviderGovernor:
+    """
+    Token-bucket + concurrency limiter for one upstream LLM provider.
+    Requests that cannot start immediately wait in a bounded priority queue
+    and are rejected once their tier's deadline passes.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, rate_per_min: float, burst: int, max_queue: int,
+                 tier_priority: dict = None, tier_max_wait: dict = None):
+        self.name = name
+        self.tier_priority = tier_priority or TIER_PRIORITY
+        self.tier_max_wait = tier_max_wait or TIER_MAX_WAIT
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_per_sec = max(rate_per_min, 0.001) / 60.0
+        self.burst = max(1, burst)
+        self.max_queue = max(0, max_queue)
+
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._in_flight = 0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._refill_handle = None
+
+        # Metrics
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.queued_total = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate_per_sec)
+
+    def _can_start(self) -> bool:
+        self._refill()
+        return self._in_flight < self.max_concurrency and self._tokens >= 1.0
+
+    def _take(self):
+        self._tokens -= 1.0
+        self._in_flight += 1
+
+    def _queue_depth(self) -> int:
+        # Drop waiters that already timed out or were cancelled
+        if any(w[2].done() for w in self._waiters):
+            self._waiters = [w for w in self._waiters if not w[2].done()]
+            heapq.heapify(self._waiters)
+        return len(self._waiters)
+
+    def _dispatch(self):
+        """Admit queued waiters in priority order while capacity and tokens allow."""
+        self._refill_handle = None
+        while self._queue_depth() and self._can_start():
+            _, _, fut = heapq.heappop(self._waiters)
+            self._take()
+            fut.set_result(True)
+
+        # Capacity is free but the bucket is empty: wake up when the next token lands
+        if self._waiters and self._in_flight < self.max_concurrency and self._refill_handle is None:
+            delay = max((1.0 - self._tokens) / self.rate_per_sec, 0.01)
+            self._refill_handle = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    async def acquire(self, tier: str = "free"):
+        priority = self.tier_priority.get(tier or "free", max(self.tier_priority.values()))
+
+        if not self._queue_depth() and self._can_start():
+            self._take()
+            self.admitted += 1
+            return
+
+        if self._queue_depth() >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise GovernorRejected(self.name, "queue full")
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self.queued_total += 1
+        self._dispatch()
+
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.tier_max_wait.get(priority, 5.0))
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                # Admitted in the same tick the deadline fired; hand the slot back
+                self.release()
+            else:
+                fut.cancel()
+            self.rejected_timeout += 1
+            raise GovernorRejected(self.name, "wait deadline exceeded")
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()
+            else:
+                fut.cancel()
+            raise
+        finally:
+            waited = time.monotonic() - start
+            self.total_wait_s += waited
+            self.max_wait_s = max(self.max_wait_s, waited)
+
+        self.admitted += 1
+
+    def release(self):
+        self._in_flight = max(0, self._in_flight - 1)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tier: str = "free"):
+        await self.acquire(tier)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        self._refill()
+        return {
+            "provider": self.name,
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self._queue_depth(),
+            "max_queue": self.max_queue,
+            "tokens_available": round(self._tokens, 2),
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_ms": int(self.total_wait_s / self.queued_total * 1000) if self.queued_total else 0,
+            "max_wait_ms": int(self.max_wait_s * 1000),
+            "tier_max_wait_s": self.tier_max_wait,
+        }
+
+
+def _from_env(name: str, default_concurrency: int, default_rpm: int) -> ProviderGovernor:
+    prefix = name.upper()
+    return ProviderGovernor(
+        name=name,
+        max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", default_concurrency)),
+        rate_per_min=float(os.getenv(f"{prefix}_RATE_PER_MIN", default_rpm)),
+        burst=int(os.getenv(f"{prefix}_BURST", default_concurrency)),
+        max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", 50)),
+        # Per-provider tier overrides on top of the shared LLM_TIER_* settings
+        tier_priority={**TIER_PRIORITY, **_parse_map(os.getenv(f"{prefix}_TIER_PRIORITY"), str, int)},
+        tier_max_wait={**TIER_MAX_WAIT, **_parse_map(os.getenv(f"{prefix}_TIER_MAX_WAIT"), int, float)},
+    )
+
+
+# One governor per upstream provider, shared across the process
+_governors = {
+    "anthropic": _from_env("anthropic", default_concurrency=4, default_rpm=50),
+    "deepseek": _from_env("deepseek", default_concurrency=8, default_rpm=120),
+}
+
+
+def get_governor(provider: str) -> ProviderGovernor:
+    return _governors[provider]
+
+
+def governor_stats() -> list:
+    return [g.stats() for g in _governors.values()]
@@ -0,0 +1,124 @@
+import logging
+import os
+from typing import TYPE_CHECKING
+
+from cache import TTLCache
+from services.quant_service import QuantService
+
+if TYPE_CHECKING:  # numpy/pandas load on first use, not when the app imports this module
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Candles fetched per (symbol, timeframe); /market-data slices ranges out of this window
+MARKET_DATA_HISTORY = int(os.getenv("MARKET_DATA_HISTORY", 1000))
+MARKET_DATA_TTL = float(os.getenv("MARKET_DATA_TTL", 60))
+OHLC_COLUMNS = ["open", "high", "low", "close"]
+
+# (symbol, timeframe) -> normalized candle frame
+_history = TTLCache(maxsize=32, ttl=MARKET_DATA_TTL)
+
+
+def market_data_cache_stats() -> dict:
+    return _history.stats()
+
+
+def _normalize(df: "pd.DataFrame") -> "pd.DataFrame":
+    """Sorted, de-duplicated candles with an int64 epoch-seconds `time` column."""
+    import numpy as np
+    import pandas as pd
+
+    if df.empty or "timestamp" not in df.columns:
+        return pd.DataFrame(columns=["time"] + OHLC_COLUMNS)
+    df = df.dropna(subset=OHLC_COLUMNS)
+    times = pd.to_datetime(df["timestamp"])
+    if times.dt.tz is not None:
+        times = times.dt.tz_convert("UTC").dt.tz_localize(None)
+    out = pd.DataFrame({
+        "time": times.to_numpy(dtype="datetime64[s]").astype(np.int64),
+        **{col: df[col].to_numpy(dtype=np.float64) for col in OHLC_COLUMNS},
+    })
+    return out.sort_values("time").drop_duplicates("time", keep="last").reset_index(drop=True)
+
+
+class MarketDataService:
+    """
+    Candle history for /market-data: one provider fetch per (symbol, timeframe) per TTL,
+    range selection, OHLC-preserving downsampling and row/columnar serialization, all on
+    numpy arrays (no per-row Python work beyond building the final JSON objects).
+    """
+
+    def __init__(self, quant: QuantService = None):
+        self.quant = quant or QuantService()
+
+    async def get_history(self, symbol: str, timeframe: str, refresh: bool = False) -> "pd.DataFrame":
+        """
+        Cached candle history. refresh=True skips the cached copy (the live feed, which
+        must not lag a TTL behind) and stores what it fetched for /market-data readers.
+        """
+        key = (symbol, timeframe)
+        df = None if refresh else _history.get(key)
+        if df is None:
+            raw = await self.quant.fetch_ohlcv(symbol, timeframe=timeframe, limit=MARKET_DATA_HISTORY)
+            df = _normalize(raw)
+            df.attrs["mock"] = raw.attrs.get("mock", False)
+            # Don't pin a provider outage for the whole TTL: empty frames and the random
+            # fallback candles QuantService returns when every provider failed
+            if not df.empty and not df.attrs["mock"]:
+                _history.set(key, df)
+        return df
+
+    @staticmethod
+    def select(df: "pd.DataFrame", start: int = None, end: int = None, limit: int = None) -> "pd.DataFrame":
+        """Candles with start <= time <= end (epoch seconds), the most recent `limit` of them."""
+        import numpy as np
+
+        times = df["time"].to_numpy()
+        lo = np.searchsorted(times, start, side="left") if start is not None else 0
+        hi = np.searchsorted(times, end, side="right") if end is not None else len(times)
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return df.iloc[lo:hi]
+
+    @staticmethod
+    def downsample(df: "pd.DataFrame", points: int) -> "pd.DataFrame":
+        """
+        Merges consecutive candles into `points` buckets: first open, max high, min low,
+        last close, stamped with the bucket's first time. Extremes survive, so wicks and
+        ranges look the same on a long chart.
+        """
+        import numpy as np
+        import pandas as pd
+
+        n = len(df)
+        if points is None or n <= points:
+            return df
+        starts = np.linspace(0, n, points + 1).astype(np.int64)[:-1]  # Strictly increasing while points < n
+        ends = np.append(starts[1:], n) - 1
+        return pd.DataFrame({
+            "time": df["time"].to_numpy()[starts],
+            "open": df["open"].to_numpy()[starts],
+            "high": np.maximum.reduceat(df["high"].to_numpy(), starts),
+            "low": np.minimum.reduceat(df["low"].to_numpy(), starts),
+            "close": df["close"].to_numpy()[ends],
+        })
+
+    @staticmethod
+    def to_rows(df: "pd.DataFrame") -> list:
+        """[{time, open, high, low, close}, ...] — the original /market-data shape."""
+        columns = [df[col].tolist() for col in ["time"] + OHLC_COLUMNS]
+        return [
+            {"time": t, "open": o, "high": h, "low": l, "close": c}
+            for t, o, h, l, c in zip(*columns)
+        ]
+
+    @staticmethod
+    def to_columns(df: "pd.DataFrame") -> dict:
+        """{"t": [...], "o": [...], "h": [...], "l": [...], "c": [...]}: roughly half the bytes of rows."""
+        return {
+            "t": df["time"].tolist(),
+            "o": df["open"].tolist(),
+            "h": df["high"].tolist(),
+            "l": df["low"].tolist(),
+            "c": df["close"].tolist(),
+        }
@@ -1,9 +1,10 @@
-import requests
 import os
 import hmac
 import hashlib
 import logging
 
+import metrics
+
 logger = logging.getLogger(__name__)
 
 PAYSTACK_SECRET_KEY = os.getenv("PAYSTACK_SECRET_KEY")
@@ -20,6 +21,8 @@ class PaystackService:
         Initialize a Paystack transaction.
         amount_ghs: Amount in Ghana Cedis
         """
+        import requests
+
         headers = {
             "Authorization": f"Bearer {PAYSTACK_SECRET_KEY}",
             "Content-Type": "application/json",
@@ -51,7 +54,9 @@ class PaystackService:
         }
 
         try:
-            response = requests.post(PAYSTACK_INIT_URL, json=payload, headers=headers)
+            with metrics.track_provider("paystack", "initialize") as call:
+                response = requests.post(PAYSTACK_INIT_URL, json=payload, headers=headers)
+                call.error = not response.ok
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -64,6 +69,8 @@ class PaystackService:
         """
         Verify a transaction by reference.
         """
+        import requests
+
         headers = {
             "Authorization": f"Bearer {PAYSTACK_SECRET_KEY}",
         }
@@ -71,7 +78,9 @@ class PaystackService:
         url = f"{PAYSTACK_VERIFY_URL}/{reference}"
         
         try:
-            response = requests.get(url, headers=headers)
+            with metrics.track_provider("paystack", "verify") as call:
+                response = requests.get(url, headers=headers)
+                call.error = not response.ok
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
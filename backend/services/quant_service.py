@@ -1,28 +1,38 @@
-try:
-    import ccxt
-except ImportError:
-    ccxt = None
-import pandas as pd
-import numpy as np
+# pandas, numpy, yfinance, requests and ccxt are imported inside the methods that use
+# them: this module is loaded on every cold start, most requests never touch market data.
 import asyncio
-import yfinance as yf
-import requests
 import os
 import io
 
 import logging
 
+import metrics
+
 logger = logging.getLogger(__name__)
 
 class QuantService:
     def __init__(self):
-        self.exchange = ccxt.kraken() if ccxt else None # Public data fallback
+        self._exchange = None
         self.av_key = os.getenv("ALPHA_VANTAGE_KEY")
 
+    @property
+    def exchange(self):
+        """Public data fallback (ccxt Kraken), built on first use. None if ccxt isn't installed."""
+        if self._exchange is None:
+            try:
+                import ccxt
+            except ImportError:
+                return None
+            self._exchange = ccxt.kraken()
+        return self._exchange
+
     async def fetch_alpha_vantage_data(self, symbol="XAU/USD", timeframe="1h", limit=100):
         """
         Fetches data from Alpha Vantage API.
         """
+        import pandas as pd
+        import requests
+
         if not self.av_key:
             logger.warning("Alpha Vantage Key missing.")
             return pd.DataFrame()
@@ -58,7 +68,10 @@ class QuantService:
                     return response.content
                 return None
 
-            content = await asyncio.to_thread(fetch_av)
+            with metrics.track_provider("alpha_vantage", "fx") as call:
+                content = await asyncio.to_thread(fetch_av)
+                # Rate limits and bad keys come back as HTTP 200 with a JSON body
+                call.error = not content or content.strip().startswith(b'{')
             
             if not content:
                 return pd.DataFrame()
@@ -109,6 +122,8 @@ class QuantService:
         """
         Fetches OHLCV data from Alpha Vantage (Primary) -> yfinance (Secondary) -> Mock (Fallback).
         """
+        import pandas as pd
+
         try:
             # 1. Try Alpha Vantage
             df_av = await self.fetch_alpha_vantage_data(symbol, timeframe, limit)
@@ -130,11 +145,15 @@ class QuantService:
                     
                     # Fetch data in thread to avoid blocking
                     def fetch_yf():
+                        import yfinance as yf
+
                         # GC=F is Gold Futures
                         data = yf.download("GC=F", period="1mo", interval=yf_interval, progress=False)
                         return data
 
-                    df = await asyncio.to_thread(fetch_yf)
+                    with metrics.track_provider("yfinance", "download") as call:
+                        df = await asyncio.to_thread(fetch_yf)
+                        call.error = df.empty
                     
                     if not df.empty and len(df) > 10:
                         # Normalize yfinance dataframe
@@ -178,6 +197,8 @@ class QuantService:
         """
         Fetches 1H, 4H (resampled), and Daily data to build a comprehensive market context.
         """
+        import pandas as pd
+
         try:
             # Fetch 1H and Daily in parallel
             task_1h = self.fetch_ohlcv(symbol, "1h", limit=200)
@@ -232,6 +253,9 @@ class QuantService:
             return {}
 
     def generate_mock_data(self, limit):
+        import numpy as np
+        import pandas as pd
+
         # Generate some realistic looking gold data
         base_price = 2030.0
         data = []
@@ -243,12 +267,16 @@ class QuantService:
         
         df = pd.DataFrame(data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
         df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        df.attrs["mock"] = True  # Synthetic candles: never cache them or treat them as a real feed
         return df
 
     def calculate_indicators(self, df):
         """
         Adds technical indicators: ATR, RSI, EMAs manually without pandas_ta
         """
+        import numpy as np
+        import pandas as pd
+
         if df.empty:
             return df
             
@@ -333,6 +361,8 @@ class QuantService:
         """
         Advanced Quant Analysis: Trend, Volatility, Momentum, and Levels
         """
+        import pandas as pd
+
         if df.empty or len(df) < 50: 
             return {"status": "error", "message": "Insufficient data"}
             
@@ -0,0 +1,293 @@
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import update, select, case, and_, or_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from database import AsyncSessionLocal
+from user_cache import invalidate_user
+
+logger = logging.getLogger(__name__)
+
+# Daily upload limits for subscription tiers
+DAILY_LIMITS = {
+    "starter": 10,
+    "active": 20,
+    "pro": 20,
+    "monthly": 20,
+    "advanced": 100,
+    "yearly": 100,
+}
+
+# How long a /analyze/reserve hold waits for its upload before it is refunded
+RESERVATION_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_SECONDS", 300))
+RESERVATION_SWEEP_LIMIT = 100
+
+# Legacy lazily-provisioned trial users were created with 10 credits; trials are capped at 3
+LEGACY_TRIAL_CREDITS = 10
+TRIAL_CREDITS = 3
+
+
+class QuotaDenied(Exception):
+    """Raised when the user has no quota left; detail is the user-facing message."""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+@dataclass
+class QuotaGrant:
+    user_id: str
+    kind: str  # "daily" (subscription usage) or "credit" (trial credit)
+    plan_tier: str
+    remaining: int | None = None  # Unknown for grants rebuilt from a reservation
+
+
+class QuotaService:
+    """
+    Enforces /analyze quotas with a single conditional UPDATE ... RETURNING:
+    the lazy daily reset, the limit check and the decrement all happen in one
+    statement, so concurrent uploads can't double-spend a credit.
+    """
+
+    async def consume(self, db: AsyncSession, firebase_uid: str, commit: bool = True) -> QuotaGrant:
+        """
+        Takes one unit or raises QuotaDenied. With commit=False the decrement stays in the
+        caller's transaction (used by reserve() to insert the hold atomically with it).
+        """
+        User = models.User
+        now = datetime.utcnow()
+        day_start = datetime.combine(now.date(), time.min)
+
+        is_new_day = or_(User.last_usage_date.is_(None), User.last_usage_date < day_start)
+        daily_limit = case(DAILY_LIMITS, value=User.plan_tier, else_=0)
+        is_trial = User.plan_tier == "trial"
+
+        subscription_ok = and_(
+            User.plan_tier.in_(list(DAILY_LIMITS)),
+            User.subscription_ends_at.isnot(None),
+            User.subscription_ends_at > now,
+            or_(is_new_day, User.daily_usage_count < daily_limit),
+        )
+        trial_ok = and_(
+            is_trial,
+            or_(User.trial_ends_at.is_(None), User.trial_ends_at >= now),
+            User.credits_balance > 0,
+        )
+
+        stmt = (
+            update(User)
+            .where(User.firebase_uid == firebase_uid, or_(subscription_ok, trial_ok))
+            .values(
+                daily_usage_count=case(
+                    (is_trial, case((is_new_day, 0), else_=User.daily_usage_count)),
+                    (is_new_day, 1),
+                    else_=User.daily_usage_count + 1,
+                ),
+                last_usage_date=case(
+                    (and_(is_trial, ~is_new_day), User.last_usage_date),
+                    else_=now,
+                ),
+                credits_balance=case(
+                    (is_trial, case(
+                        (User.credits_balance == LEGACY_TRIAL_CREDITS, TRIAL_CREDITS - 1),
+                        else_=User.credits_balance - 1,
+                    )),
+                    else_=User.credits_balance,
+                ),
+            )
+            .returning(User.plan_tier, User.daily_usage_count, User.credits_balance)
+            .execution_options(synchronize_session=False)
+        )
+
+        row = (await db.execute(stmt)).first()
+        if commit or row is None:
+            await db.commit()
+            invalidate_user(firebase_uid)
+
+        if row is None:
+            await self._deny(db, firebase_uid, now)
+
+        plan_tier, daily_usage_count, credits_balance = row
+        if plan_tier == "trial":
+            return QuotaGrant(firebase_uid, "credit", plan_tier, credits_balance)
+        return QuotaGrant(firebase_uid, "daily", plan_tier, DAILY_LIMITS[plan_tier] - daily_usage_count)
+
+    async def reserve(self, db: AsyncSession, firebase_uid: str) -> tuple[models.AnalysisReservation, QuotaGrant]:
+        """
+        Takes a unit now and records it as a hold that a later /analyze can claim.
+        Raises QuotaDenied exactly like consume().
+        """
+        grant = await self.consume(db, firebase_uid, commit=False)
+        now = datetime.utcnow()
+        reservation = models.AnalysisReservation(
+            id=uuid.uuid4().hex,
+            user_id=firebase_uid,
+            kind=grant.kind,
+            plan_tier=grant.plan_tier,
+            status="held",
+            created_at=now,
+            expires_at=now + timedelta(seconds=RESERVATION_TTL_SECONDS),
+        )
+        db.add(reservation)
+        await db.commit()
+        invalidate_user(firebase_uid)
+        return reservation, grant
+
+    async def claim(self, db: AsyncSession, reservation_id: str, firebase_uid: str) -> QuotaGrant | None:
+        """
+        Atomically turns a live hold into a consumed unit. None if the id is unknown,
+        belongs to someone else, was already used, or expired.
+        """
+        R = models.AnalysisReservation
+        row = (await db.execute(
+            update(R)
+            .where(
+                R.id == reservation_id,
+                R.user_id == firebase_uid,
+                R.status == "held",
+                R.expires_at > datetime.utcnow(),
+            )
+            .values(status="consumed")
+            .returning(R.kind, R.plan_tier)
+            .execution_options(synchronize_session=False)
+        )).first()
+        await db.commit()
+        if row is None:
+            return None
+        kind, plan_tier = row
+        return QuotaGrant(firebase_uid, kind, plan_tier)
+
+    async def release(self, db: AsyncSession, reservation_id: str, firebase_uid: str) -> bool:
+        """
+        Refunds a hold whose upload was rejected before it could be claimed (bad file,
+        oversized body). Same held -> refunded flip as release_expired(), so a hold is
+        refunded or claimed exactly once. False if it was no longer held.
+        """
+        R = models.AnalysisReservation
+        row = (await db.execute(
+            update(R)
+            .where(R.id == reservation_id, R.user_id == firebase_uid, R.status == "held")
+            .values(status="refunded")
+            .returning(R.kind, R.plan_tier)
+            .execution_options(synchronize_session=False)
+        )).first()
+        await db.commit()
+        if row is None:
+            return False
+        kind, plan_tier = row
+        await self.refund(db, QuotaGrant(firebase_uid, kind, plan_tier))
+        return True
+
+    async def release_expired(self, db: AsyncSession) -> int:
+        """
+        Refunds holds whose upload never came. Each row flips held -> refunded in the same
+        UPDATE that returns it, so concurrent sweeps can't refund a hold twice.
+        """
+        R = models.AnalysisReservation
+        expired_ids = select(R.id).where(
+            R.status == "held", R.expires_at <= datetime.utcnow()
+        ).limit(RESERVATION_SWEEP_LIMIT).scalar_subquery()
+        rows = (await db.execute(
+            update(R)
+            .where(R.id.in_(expired_ids), R.status == "held")
+            .values(status="refunded")
+            .returning(R.user_id, R.kind, R.plan_tier)
+            .execution_options(synchronize_session=False)
+        )).all()
+        await db.commit()
+        for user_id, kind, plan_tier in rows:
+            await self.refund(db, QuotaGrant(user_id, kind, plan_tier))
+        if rows:
+            logger.info(f"Released {len(rows)} expired analysis reservation(s)")
+        return len(rows)
+
+    async def release_all_expired(self, db: AsyncSession, max_batches: int = 100, dry_run: bool = False) -> dict:
+        """
+        Full sweep for the retention job: /analyze/reserve only releases one batch per call,
+        and holds from users who never come back would otherwise stay held.
+        """
+        R = models.AnalysisReservation
+        if dry_run:
+            expired = await db.scalar(
+                select(func.count()).select_from(R).where(R.status == "held", R.expires_at <= datetime.utcnow())
+            )
+            return {"expired": expired}
+        released = 0
+        for _ in range(max_batches):
+            count = await self.release_expired(db)
+            released += count
+            if count < RESERVATION_SWEEP_LIMIT:
+                break
+        return {"released": released}
+
+    async def _deny(self, db: AsyncSession, firebase_uid: str, now: datetime):
+        """
+        Slow path (only hit on rejection): work out why, downgrade expired plans, raise QuotaDenied.
+        """
+        User = models.User
+        user = (await db.execute(select(User).where(User.firebase_uid == firebase_uid))).scalars().first()
+        if not user:
+            raise QuotaDenied("Access denied.")
+
+        if user.plan_tier not in ("trial", "free"):
+            if not user.subscription_ends_at or user.subscription_ends_at <= now:
+                await self._downgrade(db, firebase_uid, user.plan_tier)
+                raise QuotaDenied("Subscription expired. Please renew.")
+            daily_limit = DAILY_LIMITS.get(user.plan_tier, 0)
+            raise QuotaDenied(f"Daily limit reached ({daily_limit} uploads/day). Please upgrade for more.")
+
+        if user.plan_tier == "trial":
+            if (user.credits_balance or 0) <= 0:
+                raise QuotaDenied("Free trial limit reached (3 uploads). Please upgrade.")
+            await self._downgrade(db, firebase_uid, "trial")
+            raise QuotaDenied("Free trial time expired. Please upgrade.")
+
+        raise QuotaDenied("Trial expired. Please upgrade to Pro.")
+
+    async def _downgrade(self, db: AsyncSession, firebase_uid: str, from_tier: str):
+        await db.execute(
+            update(models.User)
+            .where(models.User.firebase_uid == firebase_uid, models.User.plan_tier == from_tier)
+            .values(plan_tier="free")
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        invalidate_user(firebase_uid)
+
+    async def refund(self, db: AsyncSession, grant: QuotaGrant):
+        """
+        Gives back the unit taken by consume() when the analysis didn't complete.
+        """
+        User = models.User
+        try:
+            await db.rollback()
+            if grant.kind == "credit":
+                stmt = (
+                    update(User)
+                    .where(User.firebase_uid == grant.user_id)
+                    .values(credits_balance=User.credits_balance + 1)
+                )
+            else:
+                stmt = (
+                    update(User)
+                    .where(User.firebase_uid == grant.user_id, User.daily_usage_count > 0)
+                    .values(daily_usage_count=User.daily_usage_count - 1)
+                )
+            await db.execute(stmt.execution_options(synchronize_session=False))
+            await db.commit()
+            invalidate_user(grant.user_id)
+            logger.info(f"Quota refunded ({grant.kind}) for {grant.user_id}")
+        except Exception as e:
+            logger.error(f"Quota refund failed for {grant.user_id}: {e}")
+
+
+async def release_reservation(reservation_id: str, firebase_uid: str) -> bool:
+    """QuotaService.release() for callers outside a request session (UploadSizeLimitMiddleware)."""
+    async with AsyncSessionLocal() as db:
+        return await QuotaService().release(db, reservation_id, firebase_uid)
@@ -0,0 +1,152 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+import meta_codec
+import models
+from storage import get_storage, upload_key, IMAGE_EXTENSIONS
+import upload_index
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = int(os.getenv("ANALYSIS_RETENTION_DAYS", 180))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+ARCHIVE_MAX_BATCHES = int(os.getenv("ARCHIVE_MAX_BATCHES", 20))
+IMAGE_GC_BATCH_SIZE = int(os.getenv("IMAGE_GC_BATCH_SIZE", 500))
+IMAGE_GC_MAX_FILES = int(os.getenv("IMAGE_GC_MAX_FILES", 5000))
+IMAGE_GC_GRACE_SECONDS = int(os.getenv("IMAGE_GC_GRACE_SECONDS", 3600))
+
+_ARCHIVED_COLUMNS = [
+    "id", "asset", "image_path", "bias", "confidence", "summary", "recommendation", "result",
+    "entry", "sl", "tp1", "tp2", "risk_reward", "sentiment", "user_id", "processing_time_ms", "created_at",
+]
+
+
+class RetentionService:
+    """
+    Keeps the hot analyses table and the uploads directory bounded:
+    archive_old_analyses() moves rows past the retention window into analyses_archive
+    (meta_data compressed), gc_orphan_images() deletes uploads no hot row references.
+    Both work in bounded batches so a single run never holds long locks.
+    """
+
+    def archive_old_analyses(self, db: Session, retention_days: int = RETENTION_DAYS,
+                             batch_size: int = ARCHIVE_BATCH_SIZE, max_batches: int = ARCHIVE_MAX_BATCHES,
+                             dry_run: bool = False) -> dict:
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+        report = {"cutoff": cutoff.isoformat(), "archived": 0, "batches": 0, "meta_bytes_raw": 0, "meta_bytes_compressed": 0}
+
+        for _ in range(max_batches):
+            rows = db.execute(
+                select(models.Analysis)
+                .where(models.Analysis.created_at < cutoff)
+                .order_by(models.Analysis.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not rows:
+                break
+
+            archived = []
+            for row in rows:
+                meta = row.meta_data
+                # Re-packed at the batch level: hot rows were packed fast on the request path
+                packed = meta_codec.encode(meta, level=meta_codec.META_ZSTD_BATCH_LEVEL)
+                if meta is not None:
+                    report["meta_bytes_raw"] += len(json.dumps(meta, default=str))
+                    report["meta_bytes_compressed"] += len(packed)
+                archived.append(models.AnalysisArchive(
+                    **{c: getattr(row, c) for c in _ARCHIVED_COLUMNS},
+                    meta_compressed=packed,
+                ))
+            report["archived"] += len(rows)
+            report["batches"] += 1
+
+            if dry_run:
+                db.expunge_all()
+                break
+
+            # Copy and delete in one transaction per batch
+            db.add_all(archived)
+            db.execute(delete(models.Analysis).where(models.Analysis.id.in_([r.id for r in rows])))
+            db.commit()
+            db.expunge_all()
+
+        logger.info(f"Retention: archived {report['archived']} analyses older than {cutoff:%Y-%m-%d} in {report['batches']} batch(es)")
+        return report
+
+    def _candidate_files(self, storage, min_age_seconds: int):
+        now = time.time()
+        for stored in storage.list_files():
+            # Grace period: an in-flight /analyze writes the file before its row exists
+            if now - stored.mtime >= min_age_seconds:
+                yield stored
+
+    def gc_orphan_images(self, db: Session, batch_size: int = IMAGE_GC_BATCH_SIZE,
+                         max_files: int = IMAGE_GC_MAX_FILES, min_age_seconds: int = IMAGE_GC_GRACE_SECONDS,
+                         dry_run: bool = False) -> dict:
+        """
+        Deletes uploads (originals and their thumbnail/preview variants) whose content key
+        no hot analyses row references. Content-addressed files shared by several analyses
+        stay until the last reference is gone.
+        """
+        storage = get_storage()
+        report = {"scanned": 0, "deleted": 0, "bytes_freed": 0}
+
+        def flush(batch):
+            keys = {upload_key(f.name) for f in batch}
+            paths = [f"uploads/{key}{ext}" for key in keys for ext in IMAGE_EXTENSIONS]
+            referenced = {
+                upload_key(path.rpartition("/")[2])
+                for path in db.execute(
+                    select(models.Analysis.image_path).where(models.Analysis.image_path.in_(paths))
+                ).scalars()
+            }
+            for stored in batch:
+                if upload_key(stored.name) in referenced:
+                    continue
+                if not dry_run:
+                    # Skipped if a dedup hit touched it since it was listed (see save_image)
+                    if not storage.delete(stored.name, unless_modified_after=stored.mtime):
+                        continue
+                    upload_index.invalidate(stored.name)
+                report["deleted"] += 1
+                report["bytes_freed"] += stored.size
+
+        batch = []
+        for candidate in self._candidate_files(storage, min_age_seconds):
+            if report["scanned"] >= max_files:
+                break
+            report["scanned"] += 1
+            batch.append(candidate)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+        logger.info(f"Retention: removed {report['deleted']} orphaned images ({report['bytes_freed']} bytes)")
+        return report
+
+    def purge_idempotency_keys(self, db: Session, dry_run: bool = False) -> dict:
+        """Drops /analyze Idempotency-Key records past their replay window."""
+        K = models.IdempotencyKey
+        expired = K.expires_at <= datetime.utcnow()
+        if dry_run:
+            return {"expired": db.scalar(select(func.count()).select_from(K).where(expired))}
+        deleted = db.execute(delete(K).where(expired)).rowcount
+        db.commit()
+        logger.info(f"Retention: purged {deleted} expired idempotency keys")
+        return {"deleted": deleted}
+
+    def run(self, db: Session, **kwargs) -> dict:
+        dry_run = kwargs.pop("dry_run", False)
+        return {
+            "analyses": self.archive_old_analyses(db, dry_run=dry_run, **kwargs),
+            "images": self.gc_orphan_images(db, dry_run=dry_run),
+            "idempotency_keys": self.purge_idempotency_keys(db, dry_run=dry_run),
+        }
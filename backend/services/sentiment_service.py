@@ -1,9 +1,19 @@
 import os
-import requests
 import datetime
 import json
 from datetime import timedelta
 
+from cache import TTLCache
+import metrics
+
+# The economic calendar barely changes minute to minute; /analyze/reserve and /analyze
+# both gate on it, so one Finnhub call serves every request in the window.
+_news_cache = TTLCache(maxsize=1, ttl=float(os.getenv("NEWS_CHECK_TTL", 300)))
+
+
+def news_cache_stats() -> dict:
+    return _news_cache.stats()
+
 class SentimentService:
     def __init__(self):
         self.api_key = os.getenv("FINNHUB_API_KEY")
@@ -17,13 +27,26 @@ class SentimentService:
         if not self.api_key:
             return {"risk": "LOW", "event": "No API Key - Safe Mode"}
 
+        cached = _news_cache.get("calendar")
+        if cached is not None:
+            return cached
+        result = self._fetch_high_impact_news()
+        if result.get("event") != "Error fetching news":  # Don't pin a transient failure
+            _news_cache.set("calendar", result)
+        return result
+
+    def _fetch_high_impact_news(self):
+        import requests
+
         try:
             # Get Calendar for Today
             today = datetime.datetime.now().strftime("%Y-%m-%d")
             tomorrow = (datetime.datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
             
             url = f"{self.base_url}/calendar?from={today}&to={tomorrow}&token={self.api_key}"
-            response = requests.get(url)
+            with metrics.track_provider("finnhub", "calendar") as call:
+                response = requests.get(url, timeout=10)
+                call.error = response.status_code != 200
             
             if response.status_code == 200:
                 data = response.json()
@@ -55,6 +78,8 @@ class SentimentService:
         """
         Fetches 'News Sentiment' or raw news to determine bias.
         """
+        import requests
+
         if not self.api_key:
              return {"score": 0, "label": "Neutral", "summary": "No Data"}
 
@@ -62,7 +87,9 @@ class SentimentService:
             # Use News Sentiment Endpoint if available (Standard Tier+)
             # Fallback to general news
             url = f"{self.base_url}/news-sentiment?symbol=XAU&token={self.api_key}" 
-            response = requests.get(url)
+            with metrics.track_provider("finnhub", "news_sentiment") as call:
+                response = requests.get(url)
+                call.error = response.status_code != 200
             
             sentiment_score = 0
             label = "Neutral"
@@ -90,7 +117,9 @@ class SentimentService:
                     # Fallback if no sentiment data (e.g. Free Tier restriction)
                     # Fetch generic news
                     news_url = f"{self.base_url}/news?category=forex&token={self.api_key}"
-                    news_res = requests.get(news_url)
+                    with metrics.track_provider("finnhub", "news") as call:
+                        news_res = requests.get(news_url)
+                        call.error = news_res.status_code != 200
                     if news_res.status_code == 200:
                         headlines = news_res.json()[:5]
                         summary = f"Latest: {headlines[0].get('headline')}" if headlines else "No news"
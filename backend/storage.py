@@ -0,0 +1,203 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Pre-generated variants: (suffix, max edge in px). Served as WEBP.
+VARIANTS = {
+    "thumb": int(os.getenv("UPLOAD_THUMB_PX", 320)),
+    "preview": int(os.getenv("UPLOAD_PREVIEW_PX", 1024)),
+}
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+# <sha256>.<ext>, <sha256>_<variant>.webp, or a legacy <uuid4 hex>.<ext>
+CONTENT_NAME_RE = re.compile(r"^([0-9a-f]{64})(?:_(thumb|preview))?\.(png|jpe?g|webp)$")
+LEGACY_NAME_RE = re.compile(r"^([0-9a-f]{32})\.(png|jpe?g|webp)$")
+
+
+@dataclass
+class StoredImage:
+    name: str  # Original, e.g. "<sha256>.png"
+    digest: str
+    deduped: bool  # True when identical bytes were already stored
+
+
+@dataclass
+class StoredFile:
+    name: str
+    size: int
+    mtime: float
+
+
+def variant_name(name: str, variant: str) -> str | None:
+    """Name of a pre-generated variant of a content-addressed original (None for legacy names)."""
+    match = CONTENT_NAME_RE.match(name)
+    if not match or match.group(2):
+        return None
+    return f"{match.group(1)}_{variant}.webp"
+
+
+def variant_path(image_path: str | None, variant: str) -> str | None:
+    """'uploads/<sha>.png' -> 'uploads/<sha>_thumb.webp'; legacy paths fall back to the original."""
+    if not image_path:
+        return image_path
+    directory, _, name = image_path.rpartition("/")
+    derived = variant_name(name, variant)
+    if derived is None:
+        return image_path
+    return f"{directory}/{derived}" if directory else derived
+
+
+def upload_key(name: str) -> str | None:
+    """Groups an original with its variants: the content hash (or legacy uuid) part of the name."""
+    match = CONTENT_NAME_RE.match(name) or LEGACY_NAME_RE.match(name)
+    return match.group(1) if match else None
+
+
+class StorageBackend(ABC):
+    """
+    Where uploaded chart images live. Names are flat (no directories); callers
+    store them in the DB as "uploads/<name>". A backend missing any abstract method
+    fails when it is constructed.
+    """
+
+    @abstractmethod
+    def exists(self, name: str) -> bool:
+        ...
+
+    @abstractmethod
+    def write(self, name: str, data: bytes):
+        ...
+
+    @abstractmethod
+    def local_path(self, name: str) -> str | None:
+        """Filesystem path for serving / handing to the vision model, if the backend has one."""
+        ...
+
+    @abstractmethod
+    def delete(self, name: str, unless_modified_after: float = None) -> bool:
+        """
+        Removes the object; False if it doesn't exist, or if its mtime is newer than
+        `unless_modified_after` (it was re-uploaded after the caller looked at it).
+        """
+        ...
+
+    @abstractmethod
+    def touch(self, name: str) -> bool:
+        """Bumps the mtime of an existing object to now; False if it doesn't exist."""
+        ...
+
+    @abstractmethod
+    def list_files(self):
+        """Yields StoredFile for every upload-like object."""
+        ...
+
+    def save_image(self, data: bytes, ext: str, digest: str = None) -> StoredImage:
+        """
+        Stores bytes under their SHA-256 (pass `digest` if already computed) and generates
+        the thumbnail/preview variants once. Re-uploading identical bytes costs no extra
+        storage or image processing.
+
+        A dedup hit touches the existing files: the orphan GC spares anything modified within
+        its grace period, and the file may be an orphan the new analysis is about to reference.
+        """
+        digest = digest or hashlib.sha256(data).hexdigest()
+        name = f"{digest}{ext}"
+        deduped = self.touch(name)
+        if not deduped:
+            self.write(name, data)
+        for variant, size in VARIANTS.items():
+            derived = variant_name(name, variant)
+            if not self.touch(derived):
+                try:
+                    self.write(derived, _render_variant(data, size))
+                except Exception as e:
+                    # Views fall back to the original if a variant is missing
+                    logger.warning(f"Could not generate {variant} for {name}: {e}")
+        return StoredImage(name=name, digest=digest, deduped=deduped)
+
+
+class LocalDiskStorage(StorageBackend):
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, os.path.basename(name))
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self._path(name))
+
+    def write(self, name: str, data: bytes):
+        # Write-then-rename so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(name))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def local_path(self, name: str) -> str | None:
+        path = self._path(name)
+        return path if os.path.exists(path) else None
+
+    def delete(self, name: str, unless_modified_after: float = None) -> bool:
+        path = self._path(name)
+        try:
+            if unless_modified_after is not None and os.stat(path).st_mtime > unless_modified_after:
+                return False
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def touch(self, name: str) -> bool:
+        try:
+            os.utime(self._path(name))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def list_files(self):
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file() and upload_key(entry.name):
+                    stat = entry.stat()
+                    yield StoredFile(entry.name, stat.st_size, stat.st_mtime)
+
+
+def _render_variant(data: bytes, max_edge: int) -> bytes:
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.thumbnail((max_edge, max_edge))
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        out = io.BytesIO()
+        img.save(out, "WEBP", quality=80, method=4)
+        return out.getvalue()
+
+
+_storage = None
+
+
+def get_storage() -> StorageBackend:
+    """Backend selected by UPLOAD_STORAGE (only "local" for now)."""
+    global _storage
+    if _storage is None:
+        backend = os.getenv("UPLOAD_STORAGE", "local")
+        if backend != "local":
+            raise RuntimeError(f"Unknown UPLOAD_STORAGE backend: {backend}")
+        # Same location /analyze has always used: /tmp on Render/Vercel, ./uploads otherwise
+        default_root = "/tmp" if os.path.exists("/tmp") else "uploads"
+        _storage = LocalDiskStorage(os.getenv("UPLOAD_DIR", default_root))
+    return _storage
@@ -0,0 +1,47 @@
+"""
+Cold-start budget for the serverless entry point (api/index.py). Importing the app in a
+fresh interpreter must not load any of profile_imports.HEAVY_MODULES and must finish
+within COLD_START_BUDGET_MS, so a new top-level `import pandas` (or similar) in a router
+or service fails here instead of showing up as slower cold starts.
+
+Usage: python test_cold_start.py   (pytest collects it too)
+Run profile_imports.py to see where the time goes when it fails.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from profile_imports import measure_cold_start
+
+COLD_START_BUDGET_MS = float(os.getenv("COLD_START_BUDGET_MS", 1500))
+# Best of several runs: scheduling noise only ever adds time
+RUNS = 3
+
+
+def test_heavy_modules_not_imported():
+    result, _ = measure_cold_start()
+    assert not result["heavy"], (
+        f"Imported at startup: {', '.join(result['heavy'])}. Move the import into the function "
+        f"that uses it (python profile_imports.py shows which module pulls it in)."
+    )
+
+
+def best_cold_start_ms() -> float:
+    return min(measure_cold_start()[0]["ms"] for _ in range(RUNS))
+
+
+def test_import_time_within_budget():
+    best_ms = best_cold_start_ms()
+    assert best_ms <= COLD_START_BUDGET_MS, (
+        f"Cold start import took {best_ms:.0f} ms, budget is {COLD_START_BUDGET_MS:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    test_heavy_modules_not_imported()
+    print("No heavy dependencies imported at startup.")
+    best_ms = best_cold_start_ms()
+    print(f"Cold start import: {best_ms:.0f} ms (budget {COLD_START_BUDGET_MS:.0f} ms)")
+    test_import_time_within_budget()
+    print("\nTest Passed: cold start is within budget.")
@@ -0,0 +1,201 @@
+"""
+Behaviour of the /analyze Idempotency-Key handling (services/idempotency_service.py)
+against a throwaway SQLite database: replay of a stored response, 422 on a reused key,
+release followed by a re-run, takeover of an abandoned pending key.
+
+Usage: python test_idempotency.py   (pytest collects it too)
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Never the configured database: these tests write and rewrite rows
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='xgproai-test-'), 'test.db')}"
+
+from sqlalchemy import select, update
+
+import models
+from database import AsyncSessionLocal, async_engine, engine
+from migrations import run_migrations
+from services.idempotency_service import (
+    IDEMPOTENCY_PENDING_TIMEOUT, IdempotencyConflict, IdempotencyService, StoredResponse, request_fingerprint,
+)
+
+run_migrations(engine)
+
+OK = StoredResponse(200, '{"id": 1}')
+FAILED = StoredResponse(500, '{"detail": "Failed to save results"}')
+# A regression that makes a retry wait on the in-flight future should fail, not hang
+SCENARIO_TIMEOUT = 10
+
+
+def run(coro):
+    """asyncio.run() with a timeout that also drops pooled aiosqlite connections bound to the finished loop."""
+    async def main():
+        try:
+            return await asyncio.wait_for(coro, SCENARIO_TIMEOUT)
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
+
+
+def new_key():
+    return f"user-{uuid.uuid4().hex[:8]}", uuid.uuid4().hex
+
+
+async def stored_row(user_id: str, key: str):
+    K = models.IdempotencyKey
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(K).where(K.user_id == user_id, K.key == key))).scalars().first()
+
+
+async def expect_conflict(coro, status_code: int) -> IdempotencyConflict:
+    try:
+        await coro
+    except IdempotencyConflict as e:
+        assert e.status_code == status_code, f"expected {status_code}, got {e.status_code}: {e.detail}"
+        return e
+    raise AssertionError(f"expected IdempotencyConflict {status_code}")
+
+
+def test_duplicate_key_replays_stored_response():
+    async def scenario():
+        service = IdempotencyService()
+        user_id, key = new_key()
+        fingerprint = request_fingerprint("digest", "1000.0")
+        async with AsyncSessionLocal() as db:
+            assert await service.begin(db, user_id, key, fingerprint) is None  # First request runs
+            await service.complete(db, user_id, key, OK)
+        async with AsyncSessionLocal() as db:
+            assert await service.begin(db, user_id, key, fingerprint) == OK
+        assert service.stats()["replayed_stored"] == 1
+        assert (await stored_row(user_id, key)).status == "completed"
+    run(scenario())
+
+
+def test_inflight_duplicate_joins_running_request():
+    async def scenario():
+        service = IdempotencyService()
+        user_id, key = new_key()
+        fingerprint = request_fingerprint("digest", "1000.0")
+        async with AsyncSessionLocal() as owner_db, AsyncSessionLocal() as retry_db:
+            assert await service.begin(owner_db, user_id, key, fingerprint) is None
+            retry = asyncio.create_task(service.begin(retry_db, user_id, key, fingerprint))
+            await asyncio.sleep(0)
+            assert not retry.done()  # Waits for the owner instead of running again
+            await service.complete(owner_db, user_id, key, OK)
+            assert await retry == OK
+        assert service.stats()["joined_inflight"] == 1
+    run(scenario())
+
+
+def test_pending_key_from_another_worker_is_busy():
+    async def scenario():
+        user_id, key = new_key()
+        fingerprint = request_fingerprint("digest", "1000.0")
+        async with AsyncSessionLocal() as db:
+            assert await IdempotencyService().begin(db, user_id, key, fingerprint) is None
+        async with AsyncSessionLocal() as db:
+            # A second service has no in-flight future: it only sees the pending row
+            conflict = await expect_conflict(IdempotencyService().begin(db, user_id, key, fingerprint), 409)
+        assert conflict.retry_after
+    run(scenario())
+
+
+def test_fingerprint_mismatch_returns_422():
+    async def scenario():
+        service = IdempotencyService()
+        user_id, key = new_key()
+        async with AsyncSessionLocal() as db:
+            assert await service.begin(db, user_id, key, request_fingerprint("digest-a", "1000.0")) is None
+            # Same key, different upload while the first is still running...
+            await expect_conflict(service.begin(db, user_id, key, request_fingerprint("digest-b", "1000.0")), 422)
+            await service.complete(db, user_id, key, OK)
+        async with AsyncSessionLocal() as db:
+            # ...and after it completed
+            await expect_conflict(service.begin(db, user_id, key, request_fingerprint("digest-a", "500.0")), 422)
+        assert service.stats()["fingerprint_mismatches"] == 2
+    run(scenario())
+
+
+def test_release_lets_the_retry_run_again():
+    async def scenario():
+        service = IdempotencyService()
+        user_id, key = new_key()
+        fingerprint = request_fingerprint("digest", "1000.0")
+        async with AsyncSessionLocal() as db:
+            assert await service.begin(db, user_id, key, fingerprint) is None
+            await service.release(db, user_id, key, FAILED)
+        assert await stored_row(user_id, key) is None
+        async with AsyncSessionLocal() as db:
+            assert await service.begin(db, user_id, key, fingerprint) is None  # Runs again, not a replay
+            await service.complete(db, user_id, key, OK)
+        async with AsyncSessionLocal() as db:
+            assert await service.begin(db, user_id, key, fingerprint) == OK
+        stats = service.stats()
+        assert (stats["started"], stats["released"], stats["replayed_stored"]) == (2, 1, 1)
+    run(scenario())
+
+
+def test_stale_pending_key_is_taken_over():
+    async def scenario():
+        user_id, key = new_key()
+        fingerprint = request_fingerprint("digest", "1000.0")
+        async with AsyncSessionLocal() as db:
+            assert await IdempotencyService().begin(db, user_id, key, fingerprint) is None
+            # The worker that owned it died without complete()/release()
+            K = models.IdempotencyKey
+            abandoned_at = datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_PENDING_TIMEOUT + 1)
+            await db.execute(update(K).where(K.user_id == user_id, K.key == key).values(created_at=abandoned_at))
+            await db.commit()
+
+        service = IdempotencyService()
+        async with AsyncSessionLocal() as db, AsyncSessionLocal() as other_db:
+            assert await service.begin(db, user_id, key, fingerprint) is None
+            assert service.stats()["takeovers"] == 1
+            # Taken over once: the row is fresh again, so another worker finds it busy
+            await expect_conflict(IdempotencyService().begin(other_db, user_id, key, fingerprint), 409)
+            await service.complete(db, user_id, key, OK)
+        row = await stored_row(user_id, key)
+        assert row.status == "completed" and row.created_at > abandoned_at
+    run(scenario())
+
+
+def test_expired_key_runs_again():
+    async def scenario():
+        service = IdempotencyService()
+        user_id, key = new_key()
+        fingerprint = request_fingerprint("digest", "1000.0")
+        async with AsyncSessionLocal() as db:
+            assert await service.begin(db, user_id, key, fingerprint) is None
+            await service.complete(db, user_id, key, OK)
+            K = models.IdempotencyKey
+            await db.execute(
+                update(K).where(K.user_id == user_id, K.key == key).values(expires_at=datetime.utcnow())
+            )
+            await db.commit()
+        async with AsyncSessionLocal() as db:
+            assert await service.begin(db, user_id, key, fingerprint) is None
+        assert (await stored_row(user_id, key)).status == "pending"
+    run(scenario())
+
+
+def test_invalid_key_is_rejected():
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            await expect_conflict(IdempotencyService().begin(db, "user", "", "fp"), 400)
+            await expect_conflict(IdempotencyService().begin(db, "user", "k" * 256, "fp"), 400)
+    run(scenario())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  ok  {name}")
+    print("\nTest Passed: Idempotency-Key behaviour.")
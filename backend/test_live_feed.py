@@ -0,0 +1,243 @@
+"""
+Behaviour of the live candle feed (services/live_feed.py) with a stubbed
+MarketDataService: snapshot then bar events, a slow subscriber resynced with a fresh
+snapshot instead of blocking the feed, the feed and subscriber caps, the polling task
+stopping with the last unsubscribe, and provider outages.
+
+Usage: python test_live_feed.py   (pytest collects it too)
+"""
+import asyncio
+import os
+import sys
+from contextlib import contextmanager
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services import live_feed
+from services.live_feed import FEED_QUEUE_SIZE, SNAPSHOT_CANDLES, FeedFull, LiveFeedHub, poll_interval
+from services.market_data_service import MarketDataService
+from test_market_data import candles
+
+SCENARIO_TIMEOUT = 10
+FAST_POLL_SECONDS = 0.005
+
+
+class StubQuant:
+    def analyze_market_structure(self, df):
+        return {"trend": "Bullish", "candles": len(df)}
+
+
+class StubMarketData(MarketDataService):
+    """Serves `bars` candles; with auto_advance every read finds one new candle."""
+
+    def __init__(self, bars: int = 120, auto_advance: bool = False):
+        super().__init__(quant=StubQuant())
+        self.bars = bars
+        self.auto_advance = auto_advance
+        self.calls = 0
+        self.mock = False
+        self.fail = False
+
+    async def get_history(self, symbol, timeframe, refresh=False):
+        assert refresh, "the live feed must bypass the /market-data cache"
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("provider down")
+        if self.auto_advance and self.calls > 1:
+            self.bars += 1
+        df = candles(self.bars)
+        df.attrs["mock"] = self.mock
+        return df
+
+
+@contextmanager
+def feed_settings(**overrides):
+    """Temporarily overrides live_feed module settings (read at call time)."""
+    saved = {name: getattr(live_feed, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(live_feed, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(live_feed, name, value)
+
+
+def run(coro, **settings):
+    async def main():
+        with feed_settings(**{"FEED_POLL_SECONDS": FAST_POLL_SECONDS, **settings}):
+            return await asyncio.wait_for(coro, SCENARIO_TIMEOUT)
+    return asyncio.run(main())
+
+
+def hub_with(market_data: StubMarketData) -> LiveFeedHub:
+    hub = LiveFeedHub()
+    hub.market_data = market_data
+    return hub
+
+
+async def wait_until(condition):
+    while not condition():
+        await asyncio.sleep(FAST_POLL_SECONDS)
+
+
+def test_snapshot_then_bar_events():
+    async def scenario():
+        market_data = StubMarketData(bars=120)
+        hub = hub_with(market_data)
+        subscription = await hub.subscribe("XAU/USD", "1h")
+        snapshot = await subscription.next_event(1)
+        assert snapshot["type"] == "snapshot"
+        assert len(snapshot["bars"]["t"]) == SNAPSHOT_CANDLES
+        assert snapshot["bars"]["t"][-1] == int(candles(120)["time"].iloc[-1])
+        assert snapshot["indicators"] == {"trend": "Bullish", "candles": 120}
+
+        assert await subscription.next_event(0.05) is None  # Unchanged candles publish nothing
+        market_data.bars = 121
+        bar = await subscription.next_event(1)
+        assert bar["type"] == "bar" and bar["bar"]["time"] == int(candles(121)["time"].iloc[-1])
+        assert bar["indicators"]["candles"] == 121
+        hub.unsubscribe(subscription)
+    run(scenario())
+
+
+def test_slow_subscriber_is_resynced_with_a_snapshot():
+    async def scenario():
+        market_data = StubMarketData(bars=120, auto_advance=True)
+        hub = hub_with(market_data)
+        slow = await hub.subscribe("XAU/USD", "1h")
+        fast = await hub.subscribe("XAU/USD", "1h")
+        feed = slow.feed
+
+        received = []
+
+        async def drain():
+            while True:
+                received.append(await fast.queue.get())
+
+        reader = asyncio.create_task(drain())
+        # The slow subscriber reads nothing while the feed publishes past its queue size
+        await wait_until(lambda: feed.published >= FEED_QUEUE_SIZE + 5)
+        reader.cancel()
+
+        assert slow.resyncs >= 1 and feed.stats()["resyncs"] == slow.resyncs
+        assert fast.resyncs == 0  # One slow client doesn't affect the others
+        bar_times = [e["bar"]["time"] for e in received if e["type"] == "bar"]
+        assert bar_times == sorted(set(bar_times)) and len(bar_times) >= FEED_QUEUE_SIZE + 4
+
+        # Backlog dropped: the slow client catches up from one snapshot, then live bars
+        backlog = []
+        while not slow.queue.empty():
+            backlog.append(slow.queue.get_nowait())
+        assert len(backlog) <= FEED_QUEUE_SIZE
+        assert backlog[0]["type"] == "snapshot"
+        resync_time = backlog[0]["bars"]["t"][-1]
+        assert resync_time > received[0]["bars"]["t"][-1]
+        following = [e["bar"]["time"] for e in backlog[1:]]
+        assert all(e["type"] == "bar" for e in backlog[1:])
+        assert following == sorted(following) and all(t > resync_time for t in following)
+
+        hub.unsubscribe(slow)
+        hub.unsubscribe(fast)
+    run(scenario())
+
+
+def test_last_unsubscribe_stops_the_feed():
+    async def scenario():
+        market_data = StubMarketData()
+        hub = hub_with(market_data)
+        first = await hub.subscribe("XAU/USD", "1h")
+        second = await hub.subscribe("XAU/USD", "1h")
+        feed = first.feed
+        assert second.feed is feed and len(hub.stats()["feeds"]) == 1  # One poller per chart
+
+        hub.unsubscribe(first)
+        await asyncio.sleep(FAST_POLL_SECONDS * 3)
+        assert not feed.task.done()
+
+        hub.unsubscribe(second)
+        hub.unsubscribe(second)  # Idempotent (the route's on_close and finally may both call it)
+        # Not awaited directly: awaiting would cancel the task itself if the scenario timed out
+        await wait_until(feed.task.done)
+        assert feed.task.cancelled()
+        assert hub.stats()["feeds"] == [] and hub.subscriber_count() == 0
+        calls = market_data.calls
+        await asyncio.sleep(FAST_POLL_SECONDS * 5)
+        assert market_data.calls == calls  # No more provider reads
+
+        again = await hub.subscribe("XAU/USD", "1h")  # A new viewer starts a new feed
+        assert again.feed is not feed and not again.feed.task.done()
+        hub.unsubscribe(again)
+    run(scenario())
+
+
+def test_feed_and_subscriber_caps():
+    async def scenario():
+        hub = hub_with(StubMarketData())
+        one = await hub.subscribe("XAU/USD", "1h")
+        two = await hub.subscribe("XAU/USD", "4h")
+        for timeframe in ["1d", "15m"]:
+            try:
+                await hub.subscribe("XAU/USD", timeframe)
+            except FeedFull:
+                pass
+            else:
+                raise AssertionError("expected FeedFull past FEED_MAX_FEEDS")
+        joined = await hub.subscribe("XAU/USD", "1h")  # Existing feeds can still be joined
+        assert len(hub.stats()["feeds"]) == 2
+
+        try:
+            await hub.subscribe("XAU/USD", "4h")
+        except FeedFull:
+            pass
+        else:
+            raise AssertionError("expected FeedFull past FEED_MAX_SUBSCRIBERS")
+
+        hub.unsubscribe(two)
+        replacement = await hub.subscribe("XAU/USD", "1d")  # A freed feed slot is reusable
+        assert sorted(f["timeframe"] for f in hub.stats()["feeds"]) == ["1d", "1h"]
+        for subscription in [one, joined, replacement]:
+            hub.unsubscribe(subscription)
+    run(scenario(), FEED_MAX_FEEDS=2, FEED_MAX_SUBSCRIBERS=3)
+
+
+def test_provider_outage_keeps_the_last_state():
+    async def scenario():
+        market_data = StubMarketData(bars=120)
+        hub = hub_with(market_data)
+        subscription = await hub.subscribe("XAU/USD", "1h")
+        await subscription.next_event(1)  # Snapshot
+
+        market_data.mock = True  # Every provider failed: QuantService's random fallback candles
+        market_data.bars = 121
+        calls = market_data.calls
+        await wait_until(lambda: market_data.calls >= calls + 3)
+        assert await subscription.next_event(0.02) is None
+        assert subscription.feed.last_bar["time"] == int(candles(120)["time"].iloc[-1])
+        hub.unsubscribe(subscription)
+
+        broken = StubMarketData()
+        broken.fail = True
+        hub = hub_with(broken)
+        subscription = await hub.subscribe("XAU/USD", "1h")  # Doesn't hang on a failing provider
+        snapshot = await subscription.next_event(1)
+        assert snapshot["type"] == "snapshot" and snapshot["bars"]["t"] == []
+        hub.unsubscribe(subscription)
+    run(scenario())
+
+
+def test_poll_interval_follows_the_timeframe():
+    with feed_settings(FEED_POLL_SECONDS=None, FEED_POLLS_PER_BAR=12, FEED_POLL_MIN_SECONDS=5, FEED_POLL_MAX_SECONDS=30):
+        assert poll_interval("1m") == 5
+        assert poll_interval("5m") == 25
+        assert poll_interval("1h") == poll_interval("1d") == 30
+    with feed_settings(FEED_POLL_SECONDS=2.0):
+        assert poll_interval("1d") == 2.0
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  ok  {name}")
+    print("\nTest Passed: live feed behaviour.")
@@ -0,0 +1,176 @@
+"""
+Behaviour of the per-provider LLM admission control (services/llm_governor.py):
+the concurrency cap, the token bucket, tier-ordered admission from the queue, the
+queue bound, and per-tier max-wait rejection (without leaking slots).
+
+Usage: python test_llm_governor.py   (pytest collects it too)
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.llm_governor import GovernorRejected, ProviderGovernor, TIER_PRIORITY, _from_env, _parse_map
+
+# A regression that leaves a waiter queued forever should fail, not hang
+SCENARIO_TIMEOUT = 10
+# Long enough that no test waits hit it unless they mean to
+LONG_WAIT = {priority: 5.0 for priority in range(4)}
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, SCENARIO_TIMEOUT))
+
+
+def governor(max_concurrency: int = 1, rate_per_min: float = 60_000, burst: int = 100, max_queue: int = 10,
+             tier_max_wait: dict = None) -> ProviderGovernor:
+    return ProviderGovernor(
+        "test", max_concurrency=max_concurrency, rate_per_min=rate_per_min, burst=burst,
+        max_queue=max_queue, tier_max_wait=tier_max_wait or LONG_WAIT,
+    )
+
+
+async def settle():
+    """Lets queued acquire() calls reach their wait."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrency_cap_queues_until_release():
+    async def scenario():
+        gov = governor(max_concurrency=2)
+        await gov.acquire("pro")
+        await gov.acquire("pro")
+        third = asyncio.create_task(gov.acquire("pro"))
+        await settle()
+        assert not third.done()
+        assert gov.stats()["queue_depth"] == 1
+        gov.release()
+        await third
+        stats = gov.stats()
+        assert (stats["in_flight"], stats["queue_depth"], stats["admitted"]) == (2, 0, 3)
+    run(scenario())
+
+
+def test_token_bucket_paces_admissions():
+    async def scenario():
+        gov = governor(max_concurrency=10, rate_per_min=600, burst=2)  # One token every 0.1 s
+        start = time.monotonic()
+        await gov.acquire("pro")
+        await gov.acquire("pro")  # The burst
+        assert time.monotonic() - start < 0.05
+        await gov.acquire("pro")  # Capacity is free, but it waits for the next token
+        assert time.monotonic() - start >= 0.08
+        assert gov.stats()["queued_total"] == 1
+    run(scenario())
+
+
+def test_queue_admits_by_tier_then_arrival():
+    async def scenario():
+        gov = governor(max_concurrency=1)
+        await gov.acquire("pro")  # Holds the only slot
+        admitted = []
+
+        async def request(tier, name):
+            await gov.acquire(tier)
+            admitted.append(name)
+
+        tasks = []
+        for tier, name in [("free", "free"), ("trial", "trial"), ("starter", "starter-1"),
+                           ("yearly", "yearly"), ("starter", "starter-2"), ("no-such-tier", "unknown")]:
+            tasks.append(asyncio.create_task(request(tier, name)))
+            await settle()
+
+        while len(admitted) < len(tasks):
+            gov.release()
+            await settle()
+        await asyncio.gather(*tasks)
+        # Unknown tiers wait with the lowest priority, behind free (earlier arrival wins ties)
+        assert admitted == ["yearly", "starter-1", "starter-2", "trial", "free", "unknown"]
+    run(scenario())
+
+
+def test_full_queue_rejects_immediately():
+    async def scenario():
+        gov = governor(max_concurrency=1, max_queue=1)
+        await gov.acquire("pro")
+        waiting = asyncio.create_task(gov.acquire("pro"))
+        await settle()
+        try:
+            await gov.acquire("yearly")
+        except GovernorRejected as e:
+            assert e.reason == "queue full" and e.retry_after
+        else:
+            raise AssertionError("expected GovernorRejected")
+        assert gov.stats()["rejected_queue_full"] == 1
+        gov.release()
+        await waiting
+    run(scenario())
+
+
+def test_max_wait_rejects_per_tier_without_leaking_the_slot():
+    async def scenario():
+        gov = governor(max_concurrency=1, tier_max_wait={**LONG_WAIT, TIER_PRIORITY["free"]: 0.05})
+        await gov.acquire("pro")
+        paying = asyncio.create_task(gov.acquire("pro"))
+        start = time.monotonic()
+        try:
+            await gov.acquire("free")
+        except GovernorRejected as e:
+            assert e.reason == "wait deadline exceeded"
+        else:
+            raise AssertionError("expected GovernorRejected")
+        assert time.monotonic() - start < 1.0
+        assert not paying.done()  # Its tier allows a longer wait
+
+        stats = gov.stats()
+        assert (stats["rejected_timeout"], stats["queue_depth"], stats["in_flight"]) == (1, 1, 1)
+        gov.release()
+        await paying
+        gov.release()
+        assert gov.stats()["in_flight"] == 0
+        await gov.acquire("free")  # Admitted straight away: nothing was leaked
+        assert gov.stats()["queued_total"] == 2
+    run(scenario())
+
+
+def test_cancelled_waiter_does_not_hold_a_slot():
+    async def scenario():
+        gov = governor(max_concurrency=1)
+        await gov.acquire("pro")
+        waiter = asyncio.create_task(gov.acquire("pro"))
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        gov.release()
+        stats = gov.stats()
+        assert (stats["in_flight"], stats["queue_depth"]) == (0, 0)
+        async with gov.slot("free"):
+            assert gov.stats()["in_flight"] == 1
+        assert gov.stats()["in_flight"] == 0
+    run(scenario())
+
+
+def test_tier_settings_from_env():
+    assert _parse_map("trial=3, starter=0,", str, int) == {"trial": 3, "starter": 0}
+    assert _parse_map(None, int, float) == {}
+
+    names = ["TESTPROVIDER_TIER_PRIORITY", "TESTPROVIDER_TIER_MAX_WAIT"]
+    os.environ.update({names[0]: "trial=0", names[1]: "3=1.5"})
+    try:
+        gov = _from_env("testprovider", default_concurrency=2, default_rpm=60)
+    finally:
+        for name in names:
+            os.environ.pop(name)
+    assert gov.tier_priority["trial"] == 0 and gov.tier_priority["yearly"] == TIER_PRIORITY["yearly"]
+    assert gov.tier_max_wait[3] == 1.5 and gov.stats()["tier_max_wait_s"][3] == 1.5
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  ok  {name}")
+    print("\nTest Passed: LLM governor behaviour.")
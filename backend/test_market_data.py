@@ -0,0 +1,162 @@
+"""
+Behaviour of the /market-data candle pipeline (services/market_data_service.py):
+range selection, OHLC-preserving downsampling (bucket boundaries, first open / max high /
+min low / last close, passthrough when there is nothing to merge) and the history cache
+(mock fallback candles and empty frames are never cached; refresh skips the cache).
+
+Usage: python test_market_data.py   (pytest collects it too)
+"""
+import asyncio
+import os
+import sys
+import uuid
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+
+from services.market_data_service import MarketDataService, OHLC_COLUMNS
+
+HOUR = 3600
+
+
+def candles(n: int, start: int = 1_700_000_000, seed: int = 7) -> pd.DataFrame:
+    """Normalized frame (what get_history returns): random walk with real wicks."""
+    rng = np.random.default_rng(seed)
+    close = 2000 + np.cumsum(rng.normal(0, 3, n))
+    open_ = np.concatenate([[2000.0], close[:-1]])[:n]
+    high = np.maximum(open_, close) + rng.uniform(0, 5, n)
+    low = np.minimum(open_, close) - rng.uniform(0, 5, n)
+    return pd.DataFrame({
+        "time": start + HOUR * np.arange(n, dtype=np.int64),
+        "open": open_, "high": high, "low": low, "close": close,
+    })
+
+
+def check_buckets(df: pd.DataFrame, out: pd.DataFrame):
+    """
+    Recovers each bucket from the output alone (rows from one bucket's time up to the next
+    one's) and checks it against the candles it merged.
+    """
+    times = df["time"].to_numpy()
+    starts = np.searchsorted(times, out["time"].to_numpy())
+    assert starts[0] == 0 and np.all(np.diff(starts) > 0), "buckets must be contiguous and non-empty"
+    ends = np.append(starts[1:], len(df))
+    for i, (lo, hi) in enumerate(zip(starts, ends)):
+        bucket = df.iloc[lo:hi]
+        got = out.iloc[i]
+        assert got["time"] == bucket["time"].iloc[0]
+        assert got["open"] == bucket["open"].iloc[0]
+        assert got["high"] == bucket["high"].max()
+        assert got["low"] == bucket["low"].min()
+        assert got["close"] == bucket["close"].iloc[-1]
+    return ends - starts
+
+
+def test_downsample_preserves_ohlc_per_bucket():
+    df = candles(1000)
+    for points in [1, 2, 7, 100, 333, 999]:
+        out = MarketDataService.downsample(df, points)
+        assert len(out) == points
+        assert list(out.columns) == ["time"] + OHLC_COLUMNS
+        sizes = check_buckets(df, out)
+        assert sizes.sum() == len(df)
+        assert sizes.max() - sizes.min() <= 1, f"uneven buckets for {points} points: {sorted(set(sizes))}"
+        # The extremes of the whole range survive, whichever bucket they fell in
+        assert out["high"].max() == df["high"].max() and out["low"].min() == df["low"].min()
+        assert out["open"].iloc[0] == df["open"].iloc[0] and out["close"].iloc[-1] == df["close"].iloc[-1]
+
+
+def test_downsample_extreme_on_a_bucket_boundary():
+    df = candles(10)
+    out = MarketDataService.downsample(df, 3)
+    starts = np.searchsorted(df["time"].to_numpy(), out["time"].to_numpy())
+    # A spike on the first and on the last candle of a bucket must stay in that bucket
+    df.loc[starts[1], "high"] = 9999.0
+    df.loc[starts[2] - 1, "low"] = 1.0
+    out = MarketDataService.downsample(df, 3)
+    assert out["high"].tolist()[1] == 9999.0 and out["low"].tolist()[1] == 1.0
+    assert out["high"].tolist()[0] != 9999.0 and out["low"].tolist()[2] != 1.0
+    check_buckets(df, out)
+
+
+def test_downsample_passes_through_when_nothing_to_merge():
+    df = candles(50)
+    assert MarketDataService.downsample(df, 50) is df
+    assert MarketDataService.downsample(df, 80) is df
+    assert MarketDataService.downsample(df, None) is df
+    empty = candles(0)
+    assert MarketDataService.downsample(empty, 10) is empty
+
+    out = MarketDataService.downsample(df, 49)  # One pair merged, everything else unchanged
+    check_buckets(df, out)
+
+
+def test_select_range_and_limit():
+    df = candles(100)
+    t = df["time"].to_numpy()
+
+    picked = MarketDataService.select(df, start=int(t[10]), end=int(t[19]))
+    assert picked["time"].tolist() == t[10:20].tolist()  # Both ends inclusive
+    picked = MarketDataService.select(df, start=int(t[10]) + 1, end=int(t[19]) - 1)
+    assert picked["time"].tolist() == t[11:19].tolist()  # Between candles: rounded inward
+    assert MarketDataService.select(df, limit=5)["time"].tolist() == t[-5:].tolist()
+    assert MarketDataService.select(df, end=int(t[50]), limit=3)["time"].tolist() == t[48:51].tolist()
+    assert MarketDataService.select(df, start=int(t[-1]) + HOUR).empty
+    assert len(MarketDataService.select(df)) == 100
+
+
+class StubQuant:
+    """QuantService stand-in: fetch_ohlcv() returns raw provider-shaped frames and counts calls."""
+
+    def __init__(self, mock: bool = False, empty: bool = False):
+        self.mock, self.empty, self.calls = mock, empty, 0
+
+    async def fetch_ohlcv(self, symbol, timeframe="1h", limit=100):
+        self.calls += 1
+        if self.empty:
+            return pd.DataFrame()
+        df = candles(limit)
+        raw = df.drop(columns="time").assign(
+            timestamp=pd.to_datetime(df["time"], unit="s"), volume=1.0
+        ).iloc[::-1]  # Providers don't promise order
+        if self.mock:
+            raw.attrs["mock"] = True
+        return raw
+
+
+def history(service: MarketDataService, symbol: str, refresh: bool = False) -> pd.DataFrame:
+    return asyncio.run(service.get_history(symbol, "1h", refresh=refresh))
+
+
+def test_history_is_normalized_and_cached():
+    quant = StubQuant()
+    service = MarketDataService(quant=quant)
+    symbol = f"TEST-{uuid.uuid4().hex[:6]}"
+    df = history(service, symbol)
+    assert df["time"].is_monotonic_increasing and df["time"].dtype == np.int64
+    assert list(df.columns) == ["time"] + OHLC_COLUMNS
+    assert history(service, symbol) is df and quant.calls == 1
+    history(service, symbol, refresh=True)  # The live feed: always fetches...
+    assert quant.calls == 2
+    history(service, symbol)  # ...and stores it for /market-data
+    assert quant.calls == 2
+
+
+def test_mock_and_empty_history_are_not_cached():
+    for quant in [StubQuant(mock=True), StubQuant(empty=True)]:
+        service = MarketDataService(quant=quant)
+        symbol = f"TEST-{uuid.uuid4().hex[:6]}"
+        first = history(service, symbol)
+        history(service, symbol)
+        assert quant.calls == 2, "a provider outage must not be pinned for the TTL"
+        assert first.attrs["mock"] == quant.mock
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  ok  {name}")
+    print("\nTest Passed: market data behaviour.")
@@ -0,0 +1,210 @@
+"""
+Behaviour of the /analyze quota (services/quota_service.py) against a throwaway SQLite
+database: concurrent consume() never overdraws credits or the daily limit, the lazy
+daily reset, refunds, and the reservation release/expiry paths.
+
+Usage: python test_quota.py   (pytest collects it too)
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Never the configured database: these tests write and rewrite rows
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='xgproai-test-'), 'test.db')}"
+
+from sqlalchemy import select, update
+
+import models
+from database import AsyncSessionLocal, SessionLocal, async_engine, engine
+from migrations import run_migrations
+from services.quota_service import DAILY_LIMITS, QuotaDenied, QuotaGrant, QuotaService
+
+run_migrations(engine)
+
+# Below the SQLite pool size (SQLITE_POOL_SIZE + SQLITE_POOL_OVERFLOW) so every call gets its own connection
+CONCURRENT_CALLS = 12
+SCENARIO_TIMEOUT = 30
+
+
+def run(coro):
+    """asyncio.run() with a timeout that also drops pooled aiosqlite connections bound to the finished loop."""
+    async def main():
+        try:
+            return await asyncio.wait_for(coro, SCENARIO_TIMEOUT)
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
+
+
+def make_user(**fields) -> str:
+    uid = f"uid-{uuid.uuid4().hex[:12]}"
+    with SessionLocal() as db:
+        db.add(models.User(firebase_uid=uid, email=f"{uid}@example.com", **fields))
+        db.commit()
+    return uid
+
+
+def subscriber(plan_tier: str = "starter", **fields) -> str:
+    return make_user(plan_tier=plan_tier, subscription_ends_at=datetime.utcnow() + timedelta(days=30), **fields)
+
+
+def load_user(uid: str) -> models.User:
+    with SessionLocal() as db:
+        return db.query(models.User).filter(models.User.firebase_uid == uid).first()
+
+
+async def consume_concurrently(uid: str, calls: int = CONCURRENT_CALLS):
+    """consume() from `calls` sessions at once; returns (grants, denials)."""
+    async def one():
+        async with AsyncSessionLocal() as db:
+            try:
+                return await QuotaService().consume(db, uid)
+            except QuotaDenied as e:
+                return e
+    results = await asyncio.gather(*(one() for _ in range(calls)))
+    grants = [r for r in results if isinstance(r, QuotaGrant)]
+    return grants, len(results) - len(grants)
+
+
+async def expect_denied(uid: str) -> str:
+    async with AsyncSessionLocal() as db:
+        try:
+            await QuotaService().consume(db, uid)
+        except QuotaDenied as e:
+            return e.detail
+    raise AssertionError("expected QuotaDenied")
+
+
+def test_concurrent_consume_never_overdraws_trial_credits():
+    uid = make_user(plan_tier="trial", credits_balance=3, trial_ends_at=datetime.utcnow() + timedelta(days=3))
+    grants, denied = run(consume_concurrently(uid))
+    assert (len(grants), denied) == (3, CONCURRENT_CALLS - 3)
+    assert sorted(g.remaining for g in grants) == [0, 1, 2]
+    assert load_user(uid).credits_balance == 0
+
+
+def test_concurrent_consume_respects_daily_limit():
+    uid = subscriber("starter")
+    grants, denied = run(consume_concurrently(uid, DAILY_LIMITS["starter"] + 4))
+    assert (len(grants), denied) == (DAILY_LIMITS["starter"], 4)
+    assert load_user(uid).daily_usage_count == DAILY_LIMITS["starter"]
+
+
+def test_legacy_trial_balance_is_capped():
+    uid = make_user(plan_tier="trial", credits_balance=10)
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            return await QuotaService().consume(db, uid)
+    assert run(scenario()).remaining == 2
+    assert load_user(uid).credits_balance == 2
+
+
+def test_daily_usage_resets_on_a_new_day():
+    limit = DAILY_LIMITS["starter"]
+    yesterday = datetime.utcnow() - timedelta(days=1)
+    uid = subscriber("starter", daily_usage_count=limit, last_usage_date=yesterday)
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            return await QuotaService().consume(db, uid)
+    grant = run(scenario())
+    assert (grant.kind, grant.remaining) == ("daily", limit - 1)
+    user = load_user(uid)
+    assert user.daily_usage_count == 1 and user.last_usage_date > yesterday
+
+
+def test_daily_limit_holds_within_the_same_day():
+    limit = DAILY_LIMITS["starter"]
+    uid = subscriber("starter", daily_usage_count=limit, last_usage_date=datetime.utcnow())
+    assert "Daily limit reached" in run(expect_denied(uid))
+    assert load_user(uid).daily_usage_count == limit
+
+
+def test_trial_credits_do_not_reset_daily():
+    uid = make_user(plan_tier="trial", credits_balance=0, last_usage_date=datetime.utcnow() - timedelta(days=1))
+    assert "Free trial limit reached" in run(expect_denied(uid))
+    assert load_user(uid).credits_balance == 0
+
+
+def test_expired_subscription_is_downgraded():
+    uid = make_user(plan_tier="starter", subscription_ends_at=datetime.utcnow() - timedelta(minutes=1))
+    assert "Subscription expired" in run(expect_denied(uid))
+    assert load_user(uid).plan_tier == "free"
+
+
+def test_refund_gives_the_unit_back():
+    trial_uid = make_user(plan_tier="trial", credits_balance=3)
+    daily_uid = subscriber("starter")
+
+    async def scenario():
+        service = QuotaService()
+        async with AsyncSessionLocal() as db:
+            await service.refund(db, await service.consume(db, trial_uid))
+            await service.refund(db, await service.consume(db, daily_uid))
+            # A daily refund never drives the counter below zero
+            await service.refund(db, QuotaGrant(daily_uid, "daily", "starter"))
+    run(scenario())
+    assert load_user(trial_uid).credits_balance == 3
+    assert load_user(daily_uid).daily_usage_count == 0
+
+
+def test_released_reservation_is_refunded_once():
+    uid = make_user(plan_tier="trial", credits_balance=3)
+
+    async def scenario():
+        service = QuotaService()
+        async with AsyncSessionLocal() as db:
+            reservation, _ = await service.reserve(db, uid)
+            assert load_user(uid).credits_balance == 2
+            assert await service.release(db, reservation.id, uid)
+            assert not await service.release(db, reservation.id, uid)
+            assert await service.claim(db, reservation.id, uid) is None
+    run(scenario())
+    assert load_user(uid).credits_balance == 3
+
+
+def test_claimed_reservation_is_not_refunded():
+    uid = subscriber("starter")
+
+    async def scenario():
+        service = QuotaService()
+        async with AsyncSessionLocal() as db:
+            reservation, _ = await service.reserve(db, uid)
+            assert (await service.claim(db, reservation.id, uid)).kind == "daily"
+            assert not await service.release(db, reservation.id, uid)
+            assert await service.claim(db, reservation.id, uid) is None  # Claimed exactly once
+    run(scenario())
+    assert load_user(uid).daily_usage_count == 1
+
+
+def test_expired_reservations_are_swept_and_refunded():
+    uid = make_user(plan_tier="trial", credits_balance=3)
+
+    async def scenario():
+        service = QuotaService()
+        R = models.AnalysisReservation
+        async with AsyncSessionLocal() as db:
+            reservation, _ = await service.reserve(db, uid)
+            await db.execute(update(R).where(R.id == reservation.id).values(expires_at=datetime.utcnow()))
+            await db.commit()
+            assert await service.claim(db, reservation.id, uid) is None
+            assert (await service.release_all_expired(db, dry_run=True))["expired"] >= 1
+            assert (await service.release_all_expired(db))["released"] >= 1
+            assert (await service.release_all_expired(db))["released"] == 0
+            return await db.scalar(select(R.status).where(R.id == reservation.id))
+    assert run(scenario()) == "refunded"
+    assert load_user(uid).credits_balance == 3
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  ok  {name}")
+    print("\nTest Passed: quota behaviour.")
@@ -0,0 +1,160 @@
+"""
+Behaviour of the content-addressed upload storage (storage.py) on a temporary
+directory: sha256 naming, thumbnail/preview generation, dedup of identical bytes
+(no rewrite, no re-render, mtime refreshed for the orphan GC) and the GC-safe delete.
+
+Usage: python test_storage.py   (pytest collects it too)
+"""
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+
+from storage import VARIANTS, LocalDiskStorage, StorageBackend, upload_key, variant_name, variant_path
+
+
+class CountingStorage(LocalDiskStorage):
+    """LocalDiskStorage that records every write()."""
+
+    def __init__(self):
+        super().__init__(tempfile.mkdtemp(prefix="xgproai-uploads-"))
+        self.writes = []
+
+    def write(self, name: str, data: bytes):
+        self.writes.append(name)
+        super().write(name, data)
+
+    def age(self, name: str, seconds: float) -> float:
+        """Backdates a stored file; returns its new mtime."""
+        mtime = time.time() - seconds
+        os.utime(self._path(name), (mtime, mtime))
+        return mtime
+
+    def mtime(self, name: str) -> float:
+        return os.stat(self._path(name)).st_mtime
+
+
+def png(width: int = 1600, height: int = 900, color=(10, 20, 30)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(out, "PNG")
+    return out.getvalue()
+
+
+def test_save_image_is_content_addressed_with_variants():
+    storage = CountingStorage()
+    data = png()
+    stored = storage.save_image(data, ".png")
+
+    digest = hashlib.sha256(data).hexdigest()
+    assert (stored.name, stored.digest, stored.deduped) == (f"{digest}.png", digest, False)
+    with open(storage.local_path(stored.name), "rb") as f:
+        assert f.read() == data
+    for variant, max_edge in VARIANTS.items():
+        with Image.open(storage.local_path(f"{digest}_{variant}.webp")) as img:
+            assert img.format == "WEBP"
+            assert max(img.size) == max_edge and img.size[0] / img.size[1] == 1600 / 900
+    assert len(storage.writes) == 1 + len(VARIANTS)
+
+
+def test_identical_bytes_are_deduplicated():
+    storage = CountingStorage()
+    data = png()
+    first = storage.save_image(data, ".png")
+    storage.writes.clear()
+
+    second = storage.save_image(data, ".png", digest=first.digest)
+    assert second.name == first.name and second.deduped
+    assert storage.writes == []  # No rewrite and no variant rendering
+    assert sum(1 for _ in storage.list_files()) == 1 + len(VARIANTS)
+
+    other = storage.save_image(png(color=(200, 0, 0)), ".png")
+    assert other.name != first.name and not other.deduped
+
+
+def test_dedup_refreshes_mtime_of_original_and_variants():
+    storage = CountingStorage()
+    stored = storage.save_image(png(), ".png")
+    names = [stored.name] + [variant_name(stored.name, v) for v in VARIANTS]
+    old = {name: storage.age(name, 7200) for name in names}
+
+    storage.save_image(png(), ".png")
+    for name in names:
+        assert storage.mtime(name) > old[name] + 3600, f"{name} was not touched"
+
+
+def test_dedup_regenerates_a_missing_variant():
+    storage = CountingStorage()
+    stored = storage.save_image(png(), ".png")
+    thumb = variant_name(stored.name, "thumb")
+    assert storage.delete(thumb)
+    storage.writes.clear()
+
+    storage.save_image(png(), ".png")
+    assert storage.writes == [thumb]
+    assert storage.exists(thumb)
+
+
+def test_undecodable_image_is_stored_without_variants():
+    storage = CountingStorage()
+    stored = storage.save_image(b"\x89PNG\r\n\x1a\n not really an image", ".png")
+    assert storage.exists(stored.name)
+    assert not any(storage.exists(variant_name(stored.name, v)) for v in VARIANTS)
+    # Views fall back to the original when the variant is missing
+    assert variant_path(f"uploads/{stored.name}", "thumb") == f"uploads/{variant_name(stored.name, 'thumb')}"
+
+
+def test_delete_spares_files_touched_after_listing():
+    storage = CountingStorage()
+    stored = storage.save_image(png(), ".png")
+    listed_mtime = storage.age(stored.name, 7200)
+
+    storage.touch(stored.name)  # A dedup hit between the GC listing and its delete
+    assert not storage.delete(stored.name, unless_modified_after=listed_mtime)
+    assert storage.exists(stored.name)
+    assert storage.delete(stored.name, unless_modified_after=storage.mtime(stored.name))
+    assert not storage.delete(stored.name)
+    assert not storage.touch(stored.name)
+
+
+def test_names_group_originals_with_their_variants():
+    digest = "a" * 64
+    legacy = "b" * 32
+    assert upload_key(f"{digest}.png") == upload_key(f"{digest}_thumb.webp") == digest
+    assert upload_key(f"{legacy}.jpg") == legacy
+    assert upload_key(".upload-tmp123") is None
+    assert variant_path(f"uploads/{digest}.png", "preview") == f"uploads/{digest}_preview.webp"
+    assert variant_path(f"uploads/{legacy}.jpg", "preview") == f"uploads/{legacy}.jpg"  # Legacy: the original
+    assert variant_name(f"{digest}_thumb.webp", "thumb") is None
+
+    storage = CountingStorage()
+    with open(os.path.join(storage.root, "notes.txt"), "w") as f:
+        f.write("not an upload")
+    stored = storage.save_image(png(), ".png")
+    assert {f.name for f in storage.list_files()} == {stored.name} | {variant_name(stored.name, v) for v in VARIANTS}
+
+
+def test_backend_must_implement_every_operation():
+    class Partial(StorageBackend):
+        def exists(self, name):
+            return False
+
+    try:
+        Partial()
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("a backend missing abstract methods should not construct")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  ok  {name}")
+    print("\nTest Passed: upload storage behaviour.")
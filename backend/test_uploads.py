@@ -0,0 +1,136 @@
+"""
+Behaviour of GET /uploads/{filename} (main.py + upload_index.py) against a temporary
+upload directory: ETags and Cache-Control for content-addressed, variant and legacy
+names, If-None-Match -> 304, Range, names that are never served, and index entries
+that went stale because another process deleted or replaced the file.
+
+Usage: python test_uploads.py   (pytest collects it too)
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Never the configured uploads directory or database
+UPLOAD_DIR = tempfile.mkdtemp(prefix="xgproai-uploads-")
+os.environ["UPLOAD_DIR"] = UPLOAD_DIR
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='xgproai-test-'), 'test.db')}"
+os.environ.setdefault("JWT_SECRET_KEY", "test-uploads")  # auth.py refuses to import without one
+
+from fastapi.testclient import TestClient
+
+import storage
+import upload_index
+from main import app
+from test_storage import png
+
+storage._storage = None  # Pick up UPLOAD_DIR even if another test module created the backend
+client = TestClient(app)
+
+
+def save(data: bytes = None) -> storage.StoredImage:
+    return storage.get_storage().save_image(data or png(), ".png")
+
+
+def write_legacy(name: str, data: bytes):
+    """A pre-content-addressing upload: uuid4 hex name, no variants."""
+    with open(os.path.join(UPLOAD_DIR, name), "wb") as f:
+        f.write(data)
+
+
+def test_content_addressed_upload_is_immutable():
+    stored = save()
+    response = client.get(f"/uploads/{stored.name}")
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'"{stored.digest}"'
+    assert response.headers["cache-control"] == upload_index.IMMUTABLE_CACHE_CONTROL
+    assert hashlib.sha256(response.content).hexdigest() == stored.digest
+
+    thumb = client.get(f"/uploads/{storage.variant_name(stored.name, 'thumb')}")
+    assert thumb.status_code == 200
+    assert thumb.headers["etag"] == f'"{stored.digest}-thumb"'
+
+
+def test_matching_if_none_match_returns_304():
+    stored = save()
+    etag = f'"{stored.digest}"'
+    for if_none_match in [etag, f"W/{etag}", f'"other", {etag}', "*"]:
+        response = client.get(f"/uploads/{stored.name}", headers={"If-None-Match": if_none_match})
+        assert response.status_code == 304, if_none_match
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+        assert response.headers["cache-control"] == upload_index.IMMUTABLE_CACHE_CONTROL
+
+    response = client.get(f"/uploads/{stored.name}", headers={"If-None-Match": '"something-else"'})
+    assert response.status_code == 200 and response.content
+
+
+def test_range_request_is_partial():
+    stored = save()
+    response = client.get(f"/uploads/{stored.name}", headers={"Range": "bytes=0-7"})
+    assert response.status_code == 206
+    assert response.content == b"\x89PNG\r\n\x1a\n"
+
+
+def test_legacy_upload_gets_a_content_etag_and_revalidates():
+    name = "c" * 32 + ".png"
+    data = png(color=(1, 2, 3))
+    write_legacy(name, data)
+    response = client.get(f"/uploads/{name}")
+    etag = f'"{hashlib.sha256(data).hexdigest()}"'
+    assert response.status_code == 200
+    assert response.headers["etag"] == etag
+    assert response.headers["cache-control"] == upload_index.LEGACY_CACHE_CONTROL
+    assert client.get(f"/uploads/{name}", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_repeat_requests_are_served_from_the_index():
+    stored = save()
+    client.get(f"/uploads/{stored.name}")
+    hits = upload_index.upload_index_stats()["hits"]
+    client.get(f"/uploads/{stored.name}")
+    assert upload_index.upload_index_stats()["hits"] == hits + 1
+
+
+def test_only_upload_names_are_served():
+    with open(os.path.join(UPLOAD_DIR, "xgproai.db"), "wb") as f:
+        f.write(b"SQLite format 3\x00")
+    for name in ["xgproai.db", "a" * 64 + ".png", "..%2Fetc%2Fpasswd", "notes.txt"]:
+        assert client.get(f"/uploads/{name}").status_code == 404, name
+
+
+def test_deleted_file_is_404_even_when_indexed():
+    stored = save(png(color=(9, 9, 9)))
+    assert client.get(f"/uploads/{stored.name}").status_code == 200
+    # The retention GC runs in another process: this worker's index never hears about it
+    os.remove(os.path.join(UPLOAD_DIR, stored.name))
+    assert client.get(f"/uploads/{stored.name}").status_code == 404
+    response = client.get(f"/uploads/{stored.name}", headers={"If-None-Match": f'"{stored.digest}"'})
+    assert response.status_code == 404
+
+
+def test_replaced_legacy_file_gets_a_new_etag():
+    name = "d" * 32 + ".png"
+    write_legacy(name, png(color=(4, 5, 6)))
+    old_etag = client.get(f"/uploads/{name}").headers["etag"]
+
+    replacement = png(color=(7, 8, 9))
+    write_legacy(name, replacement)
+    later = time.time() + 5  # Same-second rewrites can keep the mtime on coarse filesystems
+    os.utime(os.path.join(UPLOAD_DIR, name), (later, later))
+
+    response = client.get(f"/uploads/{name}", headers={"If-None-Match": old_etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'"{hashlib.sha256(replacement).hexdigest()}"'
+    assert response.content == replacement
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"  ok  {name}")
+    print("\nTest Passed: upload serving behaviour.")
@@ -0,0 +1,113 @@
+import hashlib
+import os
+from dataclasses import dataclass
+
+from cache import TTLCache
+from storage import CONTENT_NAME_RE, get_storage, upload_key
+
+# Content-addressed names never change content, so clients may cache them forever.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Legacy uuid names: cache for a while, then revalidate with the ETag (cheap 304s).
+LEGACY_CACHE_CONTROL = "public, max-age=86400"
+
+# Where uploads lived before the storage backend (still served for old rows)
+LEGACY_UPLOAD_DIRS = ("/tmp", "uploads")
+
+
+@dataclass(frozen=True)
+class IndexedUpload:
+    path: str
+    stat: os.stat_result
+    etag: str
+    cache_control: str
+
+
+# name -> IndexedUpload, so repeat requests skip the path resolution and hashing.
+# Retention GC runs in its own process, so its invalidate() calls never reach the web
+# workers: cached() re-stats the file on every hit and drops entries that went stale.
+_index = TTLCache(
+    maxsize=int(os.getenv("UPLOAD_INDEX_MAX_ENTRIES", 4096)),
+    ttl=float(os.getenv("UPLOAD_INDEX_TTL", 3600)),
+)
+
+
+def _resolve_path(name: str) -> str | None:
+    path = get_storage().local_path(name)
+    if path:
+        return path
+    for directory in LEGACY_UPLOAD_DIRS:
+        candidate = os.path.join(directory, name)
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached(name: str) -> IndexedUpload | None:
+    """
+    Indexed entry if its file is still the one that was indexed (same size and mtime).
+    A deleted or replaced file is evicted and None returned, so the caller re-resolves it
+    (404 if gone) instead of sending 200 headers for a body it can't read.
+    """
+    entry = _index.get(name)
+    if entry is None:
+        return None
+    try:
+        current = os.stat(entry.path)
+    except OSError:
+        current = None
+    if current is None or (current.st_size, current.st_mtime) != (entry.stat.st_size, entry.stat.st_mtime):
+        _index.invalidate(name)
+        return None
+    return entry
+
+
+def index_upload(name: str) -> IndexedUpload | None:
+    """
+    Resolves an upload on disk and adds it to the index. Blocking (stat, and a one-off
+    hash for legacy names): call after a cached() miss, from a thread in async code.
+    """
+    # Only names /analyze generates; anything else in /tmp (e.g. the SQLite file) is never served
+    if not upload_key(name):
+        return None
+    path = _resolve_path(name)
+    if path is None:
+        return None
+
+    match = CONTENT_NAME_RE.match(name)
+    if match:
+        # The name already is the content hash; variants get their own tag
+        etag = f'"{match.group(1)}-{match.group(2)}"' if match.group(2) else f'"{match.group(1)}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = f'"{_file_digest(path)}"'
+        cache_control = LEGACY_CACHE_CONTROL
+
+    entry = IndexedUpload(path=path, stat=os.stat(path), etag=etag, cache_control=cache_control)
+    _index.set(name, entry)
+    return entry
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """RFC 9110 If-None-Match: weak comparison against a list of tags or '*'."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return any(t.removeprefix("W/") == etag for t in tags)
+
+
+def invalidate(name: str):
+    _index.invalidate(name)
+
+
+def upload_index_stats() -> dict:
+    return _index.stats()
@@ -0,0 +1,172 @@
+import hashlib
+import io
+import json
+import logging
+import os
+from dataclasses import dataclass
+
+from fastapi import HTTPException, UploadFile
+
+from services.quota_service import release_reservation
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))  # 10 MB
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 40_000_000))  # e.g. 8000 x 5000
+MAX_IMAGE_EDGE = int(os.getenv("MAX_IMAGE_EDGE", 12_000))
+INGEST_CHUNK_BYTES = 64 * 1024
+# Dimensions are probed while streaming only within this prefix (then once at the end)
+HEADER_PROBE_BYTES = 256 * 1024
+
+# Multipart framing (boundaries, part headers, small form fields) on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# Routes whose request bodies are capped while they are received
+UPLOAD_ROUTES = {"/analyze"}
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+
+INVALID_TYPE_DETAIL = "Invalid file type. Only PNG, JPG, and WEBP images are accepted."
+TOO_LARGE_DETAIL = f"File too large. Maximum allowed size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB."
+
+
+@dataclass
+class IngestedUpload:
+    data: bytes
+    digest: str  # sha256 hex, computed while streaming
+    ext: str  # From the sniffed format, not the client's filename
+    width: int | None
+    height: int | None
+
+
+def sniff_image_type(head: bytes) -> str | None:
+    """Extension for PNG/JPEG/WEBP magic bytes, else None."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def _header_dimensions(data: bytes) -> tuple[int, int] | None:
+    """Width/height from the image header via Pillow's lazy open (no pixel decode). None if incomplete."""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.size
+    except Image.DecompressionBombError:
+        raise HTTPException(status_code=400, detail="Image dimensions too large.")
+    except Exception:
+        return None
+
+
+def _check_dimensions(size: tuple[int, int]):
+    width, height = size
+    if width > MAX_IMAGE_EDGE or height > MAX_IMAGE_EDGE or width * height > MAX_IMAGE_PIXELS:
+        raise HTTPException(status_code=400, detail=f"Image dimensions too large ({width}x{height}).")
+
+
+async def ingest_upload(file: UploadFile) -> IngestedUpload:
+    """
+    Validates an upload Starlette has already received and spooled: hashes it chunk by
+    chunk and stops at the first failed check (magic bytes, file size, header dimensions),
+    so a bad file is never decoded. Oversized request bodies are cut off earlier, while
+    they are received, by UploadSizeLimitMiddleware.
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray()
+    ext = None
+    size = None
+
+    while True:
+        chunk = await file.read(INGEST_CHUNK_BYTES)
+        if not chunk:
+            break
+        if len(buffer) + len(chunk) > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=400, detail=TOO_LARGE_DETAIL)
+        digest.update(chunk)
+        buffer.extend(chunk)
+
+        if ext is None:
+            ext = sniff_image_type(bytes(buffer[:16]))
+            if ext is None and len(buffer) >= 16:
+                raise HTTPException(status_code=400, detail=INVALID_TYPE_DETAIL)
+        if ext and size is None and len(buffer) <= HEADER_PROBE_BYTES:
+            # Most headers fit in the first chunk; JPEGs with large EXIF blocks retry on the next few
+            size = _header_dimensions(bytes(buffer))
+            if size:
+                _check_dimensions(size)
+
+    if ext is None:
+        raise HTTPException(status_code=400, detail=INVALID_TYPE_DETAIL)
+    if size is None:
+        size = _header_dimensions(bytes(buffer))
+        if size:
+            _check_dimensions(size)
+    if size is None:
+        raise HTTPException(status_code=400, detail="Could not read image. The file may be corrupted.")
+
+    return IngestedUpload(data=bytes(buffer), digest=digest.hexdigest(), ext=ext, width=size[0], height=size[1])
+
+
+async def _release_reservation(headers):
+    """An /analyze/reserve hold sent with a rejected body would otherwise stay held until it expires."""
+    values = {name: value.decode("latin-1") for name, value in headers}
+    reservation_id, user_id = values.get(b"x-reservation-id"), values.get(b"x-user-id")
+    if reservation_id and user_id:
+        try:
+            await release_reservation(reservation_id, user_id)
+        except Exception as e:
+            logger.error(f"Releasing reservation {reservation_id} after 413 failed: {e}")
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Caps upload request bodies at MAX_REQUEST_BYTES. A Content-Length over the limit is
+    rejected before any of the body is read; otherwise (chunked requests included) the
+    received bytes are counted and the request fails with 413 once the limit is crossed,
+    so the multipart parser never spools more than the limit.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in UPLOAD_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    too_large = int(value) > MAX_REQUEST_BYTES
+                except ValueError:
+                    too_large = False
+                if too_large:
+                    await _release_reservation(scope["headers"])
+                    body = json.dumps({"detail": TOO_LARGE_DETAIL}).encode("utf-8")
+                    await send({
+                        "type": "http.response.start", "status": 413,
+                        "headers": [(b"content-type", b"application/json"),
+                                    (b"content-length", str(len(body)).encode()),
+                                    (b"connection", b"close")],
+                    })
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_REQUEST_BYTES:
+                    await _release_reservation(scope["headers"])
+                    # Raised inside form parsing; FastAPI re-raises HTTPException and the app answers 413
+                    raise HTTPException(status_code=413, detail=TOO_LARGE_DETAIL, headers={"Connection": "close"})
+            return message
+
+        await self.app(scope, limited_receive, send)
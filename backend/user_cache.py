@@ -0,0 +1,86 @@
+import os
+from dataclasses import dataclass, fields
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from cache import TTLCache
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """
+    Read-only snapshot of a users row. Routes that only *read* user state use this;
+    anything that writes goes to the DB and then calls invalidate_user().
+    """
+    id: int
+    firebase_uid: str
+    email: str | None
+    full_name: str | None
+    plan_tier: str | None
+    credits_balance: int | None
+    daily_usage_count: int | None
+    last_usage_date: datetime | None
+    trial_ends_at: datetime | None
+    subscription_ends_at: datetime | None
+    mobile: str | None
+    country: str | None
+    gender: str | None
+    age_group: str | None
+    is_admin: bool | None
+    chat_cache_opt_out: bool | None
+
+    @classmethod
+    def from_model(cls, user: models.User) -> "CachedUser":
+        return cls(**{f.name: getattr(user, f.name) for f in fields(cls)})
+
+
+# Short TTL bounds staleness across workers: a write on another worker
+# only invalidates that worker's cache.
+_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_MAX_ENTRIES", 2048)),
+    ttl=float(os.getenv("USER_CACHE_TTL", 10)),
+)
+
+
+def cache_user(user: models.User) -> CachedUser:
+    snapshot = CachedUser.from_model(user)
+    if snapshot.firebase_uid:
+        _cache.set(snapshot.firebase_uid, snapshot)
+    return snapshot
+
+
+def get_cached_user(db: Session, firebase_uid: str) -> CachedUser | None:
+    if not firebase_uid:
+        return None
+    snapshot = _cache.get(firebase_uid)
+    if snapshot is None:
+        user = db.query(models.User).filter(models.User.firebase_uid == firebase_uid).first()
+        if user:
+            snapshot = cache_user(user)
+    return snapshot
+
+
+async def get_cached_user_async(db: AsyncSession, firebase_uid: str) -> CachedUser | None:
+    if not firebase_uid:
+        return None
+    snapshot = _cache.get(firebase_uid)
+    if snapshot is None:
+        user = (await db.execute(
+            select(models.User).where(models.User.firebase_uid == firebase_uid)
+        )).scalars().first()
+        if user:
+            snapshot = cache_user(user)
+    return snapshot
+
+
+def invalidate_user(firebase_uid: str):
+    if firebase_uid:
+        _cache.invalidate(firebase_uid)
+
+
+def user_cache_stats() -> dict:
+    return _cache.stats()
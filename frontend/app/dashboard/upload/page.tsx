@@ -116,16 +116,49 @@ export default function UploadPage() {
             const userEmail = user.email || user.providerData?.[0]?.email || '';
 
 
-            const response = await fetch(`${apiUrl}/analyze`, {
+            // Reserve a quota unit first: over-limit / paused requests are rejected before the file is sent
+            let response = await fetch(`${apiUrl}/analyze/reserve`, {
                 method: 'POST',
                 headers: {
                     'X-User-ID': user.uid,
                     'X-User-Email': userEmail,
                 },
-                body: formData,
                 signal: controller.signal
             });
 
+            if (response.ok) {
+                const { reservation_id } = await response.json();
+                // Same key on every attempt: a retry after a dropped connection gets the first
+                // result back instead of being charged and analyzed again
+                const idempotencyKey = crypto.randomUUID();
+                for (let attempt = 0; ; attempt++) {
+                    try {
+                        response = await fetch(`${apiUrl}/analyze`, {
+                            method: 'POST',
+                            headers: {
+                                'X-User-ID': user.uid,
+                                'X-User-Email': userEmail,
+                                'X-Reservation-Id': reservation_id,
+                                'Idempotency-Key': idempotencyKey,
+                            },
+                            body: formData,
+                            signal: controller.signal
+                        });
+                    } catch (err: any) {
+                        if (err.name === 'AbortError' || attempt >= 2) throw err;
+                        await new Promise(resolve => setTimeout(resolve, 1000 * (attempt + 1)));
+                        continue;
+                    }
+                    // 409: the original attempt is still running on the server
+                    if (response.status === 409 && attempt < 2) {
+                        const retryAfter = Number(response.headers.get('Retry-After')) || 5;
+                        await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+                        continue;
+                    }
+                    break;
+                }
+            }
+
             // ... (rest of logic) ...
             clearTimeout(timeoutId);
             if (uploadInterval) clearInterval(uploadInterval);
@@ -23,6 +23,8 @@ export function UserTable() {
     const [loading, setLoading] = useState(true);
     const [search, setSearch] = useState("");
     const [page, setPage] = useState(0);
+    // cursors[n] is the keyset cursor that loads page n (page 0 has none)
+    const [cursors, setCursors] = useState<(string | null)[]>([null]);
     const [selectedUser, setSelectedUser] = useState<User | null>(null);
 
     const LIMIT = 10;
@@ -35,7 +37,9 @@ export function UserTable() {
         try {
             const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
 
-            let query = `?skip=${page * LIMIT}&limit=${LIMIT}`;
+            let query = `?limit=${LIMIT}`;
+            const cursor = cursors[page];
+            if (cursor) query += `&cursor=${encodeURIComponent(cursor)}`;
             if (search) query += `&search=${search}`;
 
             const res = await fetch(`${apiUrl}/admin/users${query}`, {
@@ -45,6 +49,12 @@ export function UserTable() {
             if (res.ok) {
                 const data = await res.json();
                 setUsers(data);
+                const nextCursor = res.headers.get('X-Next-Cursor');
+                setCursors(prev => {
+                    const next = prev.slice(0, page + 1);
+                    next[page + 1] = nextCursor;
+                    return next;
+                });
             }
         } catch (error) {
             console.error("Failed to fetch users", error);
@@ -61,6 +71,7 @@ export function UserTable() {
     const handleSearch = (e: React.ChangeEvent<HTMLInputElement>) => {
         setSearch(e.target.value);
         setPage(0); // Reset to first page
+        setCursors([null]);
     };
 
     return (
@@ -147,7 +158,7 @@ export function UserTable() {
                 <span className="text-xs text-gray-600">Page {page + 1}</span>
                 <button
                     onClick={() => setPage(p => p + 1)}
-                    disabled={users.length < LIMIT}
+                    disabled={!cursors[page + 1]}
                     className="text-xs text-gray-400 hover:text-white disabled:opacity-50 disabled:cursor-not-allowed"
                 >
                     Next &rarr;
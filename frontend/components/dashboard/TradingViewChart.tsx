@@ -18,6 +18,8 @@ export default function TradingViewChart({ symbol, levels }: TradingViewChartPro
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState<string | null>(null);
     const [timeframe, setTimeframe] = useState("1h");
+    const seriesRef = useRef<any>(null);
+    const lastTimeRef = useRef(0);
 
     // Fetch Data
     useEffect(() => {
@@ -85,6 +87,8 @@ export default function TradingViewChart({ symbol, levels }: TradingViewChartPro
         });
 
         candleSeries.setData(chartData);
+        seriesRef.current = candleSeries;
+        lastTimeRef.current = chartData.length ? chartData[chartData.length - 1].time : 0;
 
         // Add Lines
         if (levels?.entry) {
@@ -141,10 +145,38 @@ export default function TradingViewChart({ symbol, levels }: TradingViewChartPro
 
         return () => {
             window.removeEventListener('resize', handleResize);
+            seriesRef.current = null;
             chart.remove();
         };
     }, [chartData, levels]);
 
+    // Live updates pushed by the server (one shared feed per symbol/timeframe) instead of polling
+    useEffect(() => {
+        const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
+        const safeSymbol = symbol.replace("/", "-");
+        const source = new EventSource(`${apiUrl}/market-data/${safeSymbol}/stream?timeframe=${timeframe}`);
+
+        // The chart only accepts updates to its latest bar or newer ones
+        const applyBar = (bar: any) => {
+            if (!seriesRef.current || bar.time < lastTimeRef.current) return;
+            seriesRef.current.update(bar);
+            lastTimeRef.current = bar.time;
+        };
+
+        source.addEventListener('bar', (e: MessageEvent) => {
+            applyBar(JSON.parse(e.data).bar);
+        });
+        // Sent on connect and again if this client fell behind: catch up on the recent bars
+        source.addEventListener('snapshot', (e: MessageEvent) => {
+            const { bars } = JSON.parse(e.data);
+            bars.t.forEach((time: number, i: number) => {
+                applyBar({ time, open: bars.o[i], high: bars.h[i], low: bars.l[i], close: bars.c[i] });
+            });
+        });
+
+        return () => source.close();
+    }, [symbol, timeframe]);
+
     return (
         <div className="relative w-full h-[530px] glass-panel rounded-xl overflow-hidden flex flex-col">
             {/* Chart Toolbar */}